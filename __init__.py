@@ -10,6 +10,9 @@ from helpers.msg_utils import MakeButtons
 MERGE_MODE = {}  # Maintain each user merge_mode
 UPLOAD_AS_DOC = {}  # Maintain each user ul_type
 UPLOAD_TO_GOFILE = {}  # Maintain each user gofile upload choice
+TRANSITION = {}  # Maintain each user crossfade length in seconds (0 = hard cuts)
+TRACK_PREFS = {}  # Maintain each user audio/subtitle languages to keep
+OUTPUT_TAGS = {}  # Maintain each user title/author/audio-track tags for the next output
 
 FINISHED_PROGRESS_STR = os.environ.get("FINISHED_PROGRESS_STR", "█")
 UN_FINISHED_PROGRESS_STR = os.environ.get("UN_FINISHED_PROGRESS_STR", "░")
@@ -18,6 +21,8 @@ gDict = defaultdict(lambda: [])
 queueDB = {}
 formatDB = {}
 replyDB = {}
+probeDB = {}  # user_id -> {message_id: remote probe summary}
+manifestDB = {}  # user_id -> {message_id: media details captured at enqueue}
 
 VIDEO_EXTENSIONS = ["mkv", "mp4", "webm", "ts", "wav", "mov"]
 AUDIO_EXTENSIONS = ["aac", "ac3", "eac3", "m4a", "mka", "thd", "dts", "mp3"]
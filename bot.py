@@ -3,6 +3,7 @@
 MERGE-BOT - Complete Fixed Version
 All spam, callback, and merge issues resolved
 """
+import asyncio
 import os
 import shutil
 import time
@@ -18,15 +19,23 @@ from __init__ import (
     formatDB, gDict, queueDB, replyDB
 )
 from config import Config
+from helpers.rate_limiter import RateLimitedClient
+from helpers.prefetcher import prefetcher
+from helpers.queue_manifest import add_to_manifest
+from helpers.remote_probe import check_merge_input
+from helpers.settings_menus import (
+    handle_output_settings, is_output_settings_callback, output_settings_rows, transition_status
+)
 from helpers.utils import UserSettings, get_readable_file_size, get_readable_time
 
 botStartTime = time.time()
 
-class MergeBot(Client):
-    def start(self):
-        super().start()
+class MergeBot(RateLimitedClient, Client):
+    async def start(self):
+        # Async so the rate-limited send_message below is awaited; run() awaits start()
+        await super().start()
         try:
-            self.send_message(
+            await self.send_message(
                 chat_id=int(Config.OWNER), 
                 text="🚀 **Bot Started Successfully!**\n\n"
                      f"⏰ Started at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
@@ -36,8 +45,8 @@ class MergeBot(Client):
             pass
         LOGGER.info("✅ Bot Started Successfully!")
 
-    def stop(self):
-        super().stop()
+    async def stop(self, *args, **kwargs):
+        await super().stop(*args, **kwargs)
         LOGGER.info("🛑 Bot Stopped")
 
 def delete_all(root):
@@ -181,79 +190,162 @@ async def start_handler(c: Client, m: Message):
 
 # ================== VIDEO UPLOAD HANDLER ==================
 
+UPLOAD_BATCH_WINDOW = 1.5  # seconds of quiet before a burst/album is enqueued
+QUEUE_SUMMARY_REUSE = 120  # edit the last summary instead of replying if younger than this
+pendingUploads = {}  # user_id -> {"messages": [...], "task": asyncio.Task}
+queueSummaries = {}  # user_id -> (summary message, sent at)
+
+def classify_upload(m: Message):
+    """Return (queue name or None, file name, file size) for an incoming file"""
+    if m.video:
+        return "videos", m.video.file_name or f"video_{m.id}.mp4", m.video.file_size
+    file_name = m.document.file_name or f"document_{m.id}"
+    file_ext = m.document.file_name.split('.')[-1].lower() if m.document.file_name else ""
+    target = None
+    if file_ext in VIDEO_EXTENSIONS:
+        target = "videos"
+    elif file_ext in AUDIO_EXTENSIONS:
+        target = "audios"
+    elif file_ext in SUBTITLE_EXTENSIONS:
+        target = "subtitles"
+    return target, file_name, m.document.file_size
+
 @mergeApp.on_message((filters.video | filters.document) & filters.private)
 async def video_upload_handler(c: Client, m: Message):
-    """Handle video uploads and add to queue"""
-    user = UserSettings(m.from_user.id, m.from_user.first_name)
+    """Collect uploads; albums and quick bursts are enqueued as one batch"""
+    batch = pendingUploads.setdefault(m.from_user.id, {"messages": [], "task": None})
+    batch["messages"].append(m)
+    if batch["task"]:
+        batch["task"].cancel()
+    batch["task"] = asyncio.create_task(flush_upload_batch(c, m.from_user.id))
+
+async def flush_upload_batch(c: Client, user_id: int):
+    """Runs detached once a burst goes quiet; failures are logged and reported to the user"""
+    await asyncio.sleep(UPLOAD_BATCH_WINDOW)
+    batch = pendingUploads.pop(user_id, None)
+    if not batch:
+        return
+    messages = sorted(batch["messages"], key=lambda x: x.id)
+    try:
+        await enqueue_batch(c, user_id, messages)
+    except Exception as e:
+        LOGGER.error(f"Queueing {len(messages)} file(s) for {user_id} failed: {e}")
+        try:
+            await messages[-1].reply_text(
+                "❌ **Could not queue your files!**\n\n"
+                f"🚨 Error: `{e}`\n\n"
+                "💡 Please send them again.",
+                quote=True
+            )
+        except Exception:
+            pass
+
+async def enqueue_batch(c: Client, user_id: int, messages: list):
+    """Add a whole batch to the queue in one pass and report it in one message"""
+    last = messages[-1]
+    user = UserSettings(user_id, last.from_user.first_name)
     
-    if not user.allowed and m.from_user.id != int(Config.OWNER):
-        await m.reply_text("🔐 **Access Required!** Please login first using `/login <password>`")
+    if not user.allowed and user_id != int(Config.OWNER):
+        await last.reply_text("🔐 **Access Required!** Please login first using `/login <password>`")
         return
     
     # Initialize user queue if not exists
-    if m.from_user.id not in queueDB:
-        queueDB[m.from_user.id] = {"videos": [], "subtitles": [], "audios": []}
+    if user_id not in queueDB:
+        queueDB[user_id] = {"videos": [], "subtitles": [], "audios": []}
+
+    added = {"videos": [], "subtitles": [], "audios": []}
+    added_files = []
+    skipped = []
+    uploads = [(msg, *classify_upload(msg)) for msg in messages]
+    # Validate merge inputs from their first bytes before anything is downloaded,
+    # probing the whole batch at once
+    to_probe = [msg for msg, target, _, _ in uploads if target == "videos"] if user.merge_mode == 1 else []
+    rejections = dict(zip(
+        (msg.id for msg in to_probe),
+        await asyncio.gather(*(
+            check_merge_input(c, msg, user_id, pending=[m.id for m in to_probe]) for msg in to_probe
+        )),
+    ))
+    for msg, target, file_name, file_size in uploads:
+        if target is None:
+            skipped.append((file_name, "unsupported file type"))
+            continue
+        if rejections.get(msg.id):
+            skipped.append((file_name, rejections[msg.id]))
+            continue
+        added[target].append(msg.id)
+        added_files.append((file_name, file_size))
+
+    for target, ids in added.items():
+        queueDB[user_id][target].extend(ids)
+    add_to_manifest(user_id, [msg for msg in messages if any(msg.id in ids for ids in added.values())])
+    # Start pulling the files in the background while the user keeps queueing
+    await prefetcher.schedule(c, user_id)
+
+    if not added_files:
+        text = (
+            "❌ **No Files Added!**\n\n"
+            + "\n".join(f"• `{name}`: {reason}" for name, reason in skipped)
+            + "\n\n📌 **Supported formats:**\n"
+            f"🎬 Videos: `{', '.join(VIDEO_EXTENSIONS)}`\n"
+            f"🎵 Audios: `{', '.join(AUDIO_EXTENSIONS)}`\n"
+            f"📝 Subtitles: `{', '.join(SUBTITLE_EXTENSIONS)}`"
+        )
+        await last.reply_text(text, quote=True)
+        return
 
-    # Check file type and add to appropriate queue
-    file_added = False
-    file_name = "Unknown"
-    file_size = 0
+    # Show queue status with merge/encode buttons
+    video_count = len(queueDB[user_id]["videos"])
+    audio_count = len(queueDB[user_id]["audios"]) 
+    subtitle_count = len(queueDB[user_id]["subtitles"])
     
-    if m.video:
-        queueDB[m.from_user.id]["videos"].append(m.id)
-        file_name = m.video.file_name or f"video_{m.id}.mp4"
-        file_size = m.video.file_size
-        file_added = True
-        
-    elif m.document:
-        file_ext = m.document.file_name.split('.')[-1].lower() if m.document.file_name else ""
-        
-        if file_ext in VIDEO_EXTENSIONS:
-            queueDB[m.from_user.id]["videos"].append(m.id)
-            file_added = True
-        elif file_ext in AUDIO_EXTENSIONS:
-            queueDB[m.from_user.id]["audios"].append(m.id)
-            file_added = True  
-        elif file_ext in SUBTITLE_EXTENSIONS:
-            queueDB[m.from_user.id]["subtitles"].append(m.id)
-            file_added = True
-            
-        file_name = m.document.file_name or f"document_{m.id}"
-        file_size = m.document.file_size
-
-    if file_added:
-        # Show queue status with merge/encode buttons
-        video_count = len(queueDB[m.from_user.id]["videos"])
-        audio_count = len(queueDB[m.from_user.id]["audios"]) 
-        subtitle_count = len(queueDB[m.from_user.id]["subtitles"])
-        
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔥 Merge Videos", callback_data="merge"),
-             InlineKeyboardButton("🎬 Encode Video", callback_data="enc_mode_menu")],
-            [InlineKeyboardButton("📋 Show Queue", callback_data="show_queue"),
-             InlineKeyboardButton("🗑️ Clear Queue", callback_data="clear_queue")],
-            [InlineKeyboardButton("⚙️ Settings", callback_data="settings")]
-        ])
-        
-        await m.reply_text(
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔥 Merge Videos", callback_data="merge"),
+         InlineKeyboardButton("🎬 Encode Video", callback_data="enc_mode_menu")],
+        [InlineKeyboardButton("📋 Show Queue", callback_data="show_queue"),
+         InlineKeyboardButton("🗑️ Clear Queue", callback_data="clear_queue")],
+        [InlineKeyboardButton("⚙️ Settings", callback_data="settings")]
+    ])
+
+    if len(added_files) == 1:
+        file_name, file_size = added_files[0]
+        files_text = (
             f"✅ **File Added to Queue!**\n\n"
             f"📁 **File:** `{file_name}`\n"
-            f"📊 **Size:** `{get_readable_file_size(file_size)}`\n\n"
-            f"📋 **Queue Status:**\n"
-            f"🎬 Videos: **{video_count}**\n"
-            f"🎵 Audios: **{audio_count}**\n"
-            f"📝 Subtitles: **{subtitle_count}**\n\n"
-            f"{'🚀 Ready to merge!' if video_count >= 2 else '📥 Add more videos to merge'}",
-            reply_markup=keyboard
+            f"📊 **Size:** `{get_readable_file_size(file_size)}`\n"
         )
     else:
-        await m.reply_text(
-            "❌ **Unsupported File Type!**\n\n"
-            "📌 **Supported formats:**\n"
-            f"🎬 Videos: `{', '.join(VIDEO_EXTENSIONS)}`\n"
-            f"🎵 Audios: `{', '.join(AUDIO_EXTENSIONS)}`\n"
-            f"📝 Subtitles: `{', '.join(SUBTITLE_EXTENSIONS)}`"
+        files_text = f"✅ **{len(added_files)} Files Added to Queue!**\n\n" + "".join(
+            f"📁 `{name}` ({get_readable_file_size(size)})\n" for name, size in added_files
         )
+    if skipped:
+        files_text += "\n⚠️ **Skipped:**\n" + "".join(
+            f"• `{name}`: {reason}\n" for name, reason in skipped
+        )
+
+    text = (
+        f"{files_text}\n"
+        f"📋 **Queue Status:**\n"
+        f"🎬 Videos: **{video_count}**\n"
+        f"🎵 Audios: **{audio_count}**\n"
+        f"📝 Subtitles: **{subtitle_count}**\n\n"
+        f"{'🚀 Ready to merge!' if video_count >= 2 else '📥 Add more videos to merge'}"
+    )
+
+    # Keep a single summary message per user up to date instead of replying to every file
+    summary, sent_at = queueSummaries.get(user_id, (None, 0))
+    if summary is not None and time.time() - sent_at < QUEUE_SUMMARY_REUSE:
+        try:
+            await summary.edit_text(text, reply_markup=keyboard)
+            return
+        except Exception as e:
+            LOGGER.info(f"Queue summary edit failed, sending a new one: {e}")
+    summary = await last.reply_text(text, reply_markup=keyboard)
+    now = time.time()
+    # Summaries too old to be edited are never looked up again
+    for uid in [u for u, (_, at) in queueSummaries.items() if now - at >= QUEUE_SUMMARY_REUSE]:
+        del queueSummaries[uid]
+    queueSummaries[user_id] = (summary, now)
 
 # ================== CALLBACK HANDLER ==================
 
@@ -344,17 +436,35 @@ async def callback_handler(c: Client, cb):
 🎭 **Mode:** Video + Video
 📤 **Upload:** As Video
 🚫 **Banned:** No ✅
-✅ **Allowed:** Yes"""
+✅ **Allowed:** Yes
+🎞️ **Transition:** {transition_status(user_id)}"""
             
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton("🎥 Mode: Video+Video", callback_data="mode_1")],
                 [InlineKeyboardButton("🎵 Mode: Video+Audio", callback_data="mode_2")],
                 [InlineKeyboardButton("📝 Mode: Video+Subtitle", callback_data="mode_3")],
+                *output_settings_rows(user),
                 [InlineKeyboardButton("🔙 Back", callback_data="back_to_start")]
             ])
             
             await cb.message.edit_text(settings_text, reply_markup=keyboard)
             
+        elif is_output_settings_callback(data):
+            if not user.allowed:
+                await cb.answer("🔐 Login required!", show_alert=True)
+                return
+            if await handle_output_settings(c, cb, data, user_id):
+                # Redraw the settings menu with the new value
+                cb.data = "settings"
+                await callback_handler(c, cb)
+            
+        elif data == "contact_sheet":
+            if not user.allowed:
+                await cb.answer("🔐 Login required!", show_alert=True)
+                return
+            from plugins.streams_extractor import contactSheetNow
+            await contactSheetNow(c, cb)
+            
         elif data.startswith("mode_"):
             mode_id = int(data.split("_")[1])
             user.merge_mode = mode_id
@@ -385,9 +495,19 @@ async def callback_handler(c: Client, cb):
             )
             
             try:
-                # Import and call merge function
-                from helpers.merge_helper import start_merge_process
-                await start_merge_process(c, cb, user_id)
+                # The plugin merges apply the transition, track and output tag settings
+                if user.merge_mode == 1:
+                    from plugins.mergeVideo import mergeNow
+                    await mergeNow(c, cb, f"downloads/{user_id}/merged.mkv")
+                elif user.merge_mode == 2:
+                    from plugins.mergeVideoAudio import mergeAudio
+                    await mergeAudio(c, cb, f"downloads/{user_id}/merged_audio.mkv")
+                elif user.merge_mode == 3:
+                    from plugins.mergeVideoSub import mergeSub
+                    await mergeSub(c, cb, f"downloads/{user_id}/merged_subtitle.mkv")
+                else:
+                    from helpers.merge_helper import start_merge_process
+                    await start_merge_process(c, cb, user_id)
                 
             except ImportError:
                 await cb.message.edit_text(
@@ -425,6 +545,8 @@ Total Items: {video_count + audio_count + subtitle_count}"""
         elif data == "clear_queue":
             if user_id in queueDB:
                 queueDB[user_id] = {"videos": [], "subtitles": [], "audios": []}
+                queueSummaries.pop(user_id, None)
+                await prefetcher.cancel(user_id)
                 await cb.answer("🗑️ Queue cleared successfully!", show_alert=True)
             else:
                 await cb.answer("📋 Queue is already empty!", show_alert=True)
@@ -530,6 +652,28 @@ Total Items: {video_count + audio_count + subtitle_count}"""
 
 # ================== ADDITIONAL COMMANDS ==================
 
+@mergeApp.on_message(filters.photo & filters.private)
+async def photo_handler(c: Client, m: Message):
+    """Save a sent photo as the user's custom thumbnail, prepared once"""
+    user = UserSettings(m.from_user.id, m.from_user.first_name)
+    if not user.allowed and m.from_user.id != int(Config.OWNER):
+        await m.reply_text("🔐 **Access Required!** Please login first using `/login <password>`")
+        return
+    from helpers.database import saveThumb
+    from helpers.thumbnail_cache import cache_thumbnail
+    status = await m.reply_text("🖼️ Saving thumbnail ...", quote=True)
+    file_id = m.photo.file_id
+    if await cache_thumbnail(c, m.from_user.id, file_id) is None:
+        await status.edit_text("❌ Could not read that photo, try another one")
+        return
+    user.thumbnail = file_id
+    user.set()
+    try:
+        await saveThumb(m.from_user.id, file_id)
+    except Exception as e:
+        LOGGER.warning(f"saveThumb failed for {m.from_user.id}: {e}")
+    await status.edit_text("✅ **Thumbnail saved!** It will be used for your next uploads.")
+
 @mergeApp.on_message(filters.command(["help"]) & filters.private)
 async def help_handler(c: Client, m: Message):
     """Help command"""
@@ -553,6 +697,8 @@ async def help_handler(c: Client, m: Message):
 • `/login <password>` - Login to use bot
 • `/help` - Show this help
 • `/encode` - Start encoding mode
+• `/preview <time>` - Screenshot + sample of a replied video
+• `/trim <start> <end>` - Cut a replied video without re-encoding it all
 • `/settings` - User preferences
 
 **🎯 Features:**
@@ -610,6 +756,102 @@ async def encode_command(c: Client, m: Message):
         quote=True
     )
 
+def parse_time(text: str) -> float:
+    """Seconds from `[[h:]m:]s`"""
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+@mergeApp.on_message(filters.command(["preview"]) & filters.private)
+async def preview_command(c: Client, m: Message):
+    """Screenshot + 30s sample of a replied video, fetched by byte range"""
+    user = UserSettings(m.from_user.id, m.from_user.first_name)
+    if not user.allowed and m.from_user.id != int(Config.OWNER):
+        await m.reply_text("🔐 **Access Required!** Please login first using `/login <password>`")
+        return
+    target = m.reply_to_message
+    if not target or not (target.video or target.document):
+        await m.reply_text(
+            "❌ **Invalid Usage!**\n\nReply to a video with `/preview 10:00` (time as `[[h:]m:]s`)",
+            quote=True,
+        )
+        return
+    try:
+        at = parse_time(m.command[1] if len(m.command) > 1 else "0")
+    except ValueError:
+        await m.reply_text("❌ Could not read the time, use e.g. `1:23:45` or `300`", quote=True)
+        return
+
+    from helpers.remote_preview import SAMPLE_LENGTH, remote_preview
+    status = await m.reply_text(f"🔎 Fetching preview at `{get_readable_time(at)}` ...", quote=True)
+    work_dir = f"downloads/{m.from_user.id}/preview_{target.id}"
+    result = await remote_preview(c, target, at, work_dir)
+    if result is None:
+        await status.edit_text("⚠️ This file has no usable index for a quick preview. Queue it and use 🖼️ Preview sheet instead.")
+        delete_all(work_dir)
+        return
+    shot, sample = result
+    if shot:
+        await c.send_photo(m.chat.id, shot, caption=f"📸 `{get_readable_time(at)}`", reply_to_message_id=target.id)
+    if sample:
+        await c.send_video(
+            m.chat.id, sample, caption=f"🎬 {SAMPLE_LENGTH}s sample from `{get_readable_time(at)}`",
+            supports_streaming=True, reply_to_message_id=target.id,
+        )
+    if shot or sample:
+        await status.delete()
+    else:
+        await status.edit_text("❌ Failed to build the preview")
+    delete_all(work_dir)
+
+@mergeApp.on_message(filters.command(["trim"]) & filters.private)
+async def trim_command(c: Client, m: Message):
+    """Frame-accurate cut of a replied video; only the partial GOPs at the ends are re-encoded"""
+    user = UserSettings(m.from_user.id, m.from_user.first_name)
+    if not user.allowed and m.from_user.id != int(Config.OWNER):
+        await m.reply_text("🔐 **Access Required!** Please login first using `/login <password>`")
+        return
+    target = m.reply_to_message
+    media = target and (target.video or target.document)
+    if not media or len(m.command) < 3:
+        await m.reply_text(
+            "❌ **Invalid Usage!**\n\nReply to a video with `/trim 1:00 2:30` (times as `[[h:]m:]s`)",
+            quote=True,
+        )
+        return
+    try:
+        start, end = parse_time(m.command[1]), parse_time(m.command[2])
+    except ValueError:
+        await m.reply_text("❌ Could not read the times, use e.g. `1:23:45` or `300`", quote=True)
+        return
+    if end <= start:
+        await m.reply_text("❌ The end has to come after the start", quote=True)
+        return
+
+    from helpers.ffmpeg_helper import cult_small_video
+    work_dir = f"downloads/{m.from_user.id}/trim_{target.id}/"
+    status = await m.reply_text("📥 Downloading video to trim ...", quote=True)
+    try:
+        src = await c.download_media(media, file_name=work_dir)
+        await status.edit_text(f"✂️ Cutting `{get_readable_time(start)}` → `{get_readable_time(end)}` ...")
+        format_ = src.rsplit(".", 1)[-1] if "." in os.path.basename(src) else "mkv"
+        trimmed = await cult_small_video(src, work_dir, start, end, format_)
+        if trimmed is None:
+            await status.edit_text("❌ Failed to trim the video")
+            return
+        await c.send_video(
+            m.chat.id, trimmed,
+            caption=f"✂️ `{get_readable_time(start)}` → `{get_readable_time(end)}`",
+            duration=int(end - start), supports_streaming=True, reply_to_message_id=target.id,
+        )
+        await status.delete()
+    except Exception as e:
+        LOGGER.error(f"Trim failed: {e}")
+        await status.edit_text(f"❌ Failed to trim the video\n\n`{e}`")
+    finally:
+        delete_all(work_dir)
+
 if __name__ == "__main__":
     LOGGER.info("🚀 Starting SSMERGE Bot...")
     mergeApp.run()
@@ -16,6 +16,8 @@ from hashlib import sha256
 # Import from bot modules
 from __init__ import LOGGER
 from config import Config
+from helpers.prefetcher import prefetcher
+from helpers.rate_limiter import progress_priority
 from helpers.utils import get_readable_file_size, get_readable_time
 
 # Configuration Constants
@@ -275,7 +277,8 @@ async def _perform_download_request(session: aiohttp.ClientSession, url: str, de
 🚀 **Speed:** `{speed}`
 ⏱ **ETA:** `{eta}`"""
                         
-                        await smart_progress_editor(status_message, progress_text)
+                        with progress_priority():
+                            await smart_progress_editor(status_message, progress_text)
         
         return downloaded
     
@@ -414,8 +417,8 @@ async def download_from_url(url: str, user_id: int, status_message, password: st
         )
         return None
 
-async def download_from_tg(message, user_id: int, status_message) -> str | None:
-    """Download video from Telegram message"""
+async def download_from_tg(message, user_id: int, status_message, client=None) -> str | None:
+    """Download video from Telegram message, or from a queue manifest entry (needs `client`)"""
     try:
         # Setup paths
         user_download_dir = f"downloads/{str(user_id)}"
@@ -427,7 +430,15 @@ async def download_from_tg(message, user_id: int, status_message) -> str | None:
         file_size = 0
         duration = 0
         
-        if message.video:
+        if isinstance(message, dict):
+            # Manifest entry: everything we need was captured at enqueue time
+            if not message.get("file_id"):
+                await smart_progress_editor(status_message, "❌ **Error:** No downloadable file found")
+                return None
+            file_name = message["file_name"]
+            file_size = message["file_size"]
+            duration = message.get("duration", 0)
+        elif message.video:
             file_obj = message.video
             file_name = file_obj.file_name or f"video_{message.id}.mp4"
             file_size = file_obj.file_size
@@ -485,13 +496,31 @@ async def download_from_tg(message, user_id: int, status_message) -> str | None:
 🚀 **Speed:** `{speed}`
 ⏱ **ETA:** `{eta}`"""
             
-            await smart_progress_editor(status_message, progress_text)
+            with progress_priority():
+                await smart_progress_editor(status_message, progress_text)
         
         # Download file
-        file_path = await message.download(
-            file_name=dest_path,
-            progress=progress_callback
-        )
+        if isinstance(message, dict):
+            file_path = await prefetcher.claim(user_id, message)
+            if file_path:
+                LOGGER.info(f"Using prefetched file: {file_path}")
+                await smart_progress_editor(
+                    status_message,
+                    f"⚡ **Already Downloaded in Background!**\n\n"
+                    f"📁 **File:** `{file_name}`\n"
+                    f"📊 **Size:** `{get_readable_file_size(file_size)}`"
+                )
+                return file_path
+            file_path = await client.download_media(
+                message["file_id"],
+                file_name=dest_path,
+                progress=progress_callback
+            )
+        else:
+            file_path = await message.download(
+                file_name=dest_path,
+                progress=progress_callback
+            )
         
         # Verify download
         if not os.path.exists(file_path):
@@ -0,0 +1,69 @@
+# helpers/contact_sheet.py - Preview grids and screenshot series from keyframes
+"""
+A contact sheet only needs a dozen roughly evenly spaced frames, and
+keyframes are the only frames that decode without their neighbours.  One
+ffmpeg run with `-skip_frame nokey` hands only keyframes to the filter
+graph; `select` keeps the first keyframe after every interval, and `split`
+feeds the same frames to `tile` (the sheet) and to numbered JPEGs (the
+screenshot series).  No per-timestamp seeks, and no inter frames are decoded.
+"""
+import asyncio
+import os
+
+from __init__ import LOGGER
+from helpers.media_probe import media_info
+
+SHEET_COLUMNS = 4
+SHEET_ROWS = 3
+TILE_WIDTH = 480  # px per tile; a 4-wide sheet is 1920 px
+SHEET_PADDING = 4
+
+
+def sheet_command(src: str, duration: float, out_dir: str, columns: int, rows: int) -> list:
+    """ffmpeg command writing `sheet.jpg` and `shot_NN.jpg` into `out_dir`"""
+    count = columns * rows
+    interval = duration / count
+    first = interval / 2  # Skip black intros / fade-ins at 0s
+    select = (
+        f"select='gte(t\\,{first:.3f})*(isnan(prev_selected_t)+gte(t-prev_selected_t\\,{interval * 0.9:.3f}))'"
+    )
+    graph = (
+        f"[0:v:0]{select},scale={TILE_WIDTH}:-2,split=2[t][s];"
+        f"[t]tile={columns}x{rows}:padding={SHEET_PADDING}:margin={SHEET_PADDING}[sheet]"
+    )
+    return [
+        "ffmpeg", "-hide_banner", "-y",
+        "-skip_frame", "nokey", "-i", src,
+        "-filter_complex", graph,
+        "-map", "[sheet]", "-frames:v", "1", "-q:v", "3", os.path.join(out_dir, "sheet.jpg"),
+        "-map", "[s]", "-vsync", "vfr", "-frames:v", str(count), "-q:v", "3",
+        os.path.join(out_dir, "shot_%02d.jpg"),
+    ]
+
+
+async def contact_sheet(src: str, out_dir: str, columns: int = SHEET_COLUMNS, rows: int = SHEET_ROWS):
+    """
+    Build a `columns` x `rows` contact sheet and the matching screenshot series.
+
+    returns: `(sheet_path, [shot_paths])`, or `(None, [])` on failure.
+    """
+    info = await media_info(src)
+    if not info or not info["video"] or info["duration"] <= 0:
+        return None, []
+    os.makedirs(out_dir, exist_ok=True)
+    cmd = sheet_command(src, info["duration"], out_dir, columns, rows)
+    LOGGER.info(cmd)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    sheet = os.path.join(out_dir, "sheet.jpg")
+    if process.returncode != 0 or not os.path.exists(sheet):
+        LOGGER.error(f"Contact sheet failed: {stderr.decode().strip()[-500:]}")
+        return None, []
+    shots = sorted(
+        os.path.join(out_dir, f) for f in os.listdir(out_dir) if f.startswith("shot_")
+    )
+    return sheet, shots
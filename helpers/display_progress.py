@@ -16,6 +16,7 @@ from __init__ import (
     LOGGER,
 )
 from pyrogram import Client
+from helpers.rate_limiter import limiter, progress_priority
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -101,17 +102,19 @@ class Progress:
                 )
             )
             try:
-                if not self._mess.photo:
-                    await self._mess.edit_text(
-                        text="{}\n {}".format(ud_type, tmp), reply_markup=reply_markup
-                    )
-                else:
-                    await self._mess.edit_caption(
-                        caption="{}\n {}".format(ud_type, tmp)
-                    )
+                with progress_priority():
+                    if not self._mess.photo:
+                        await self._mess.edit_text(
+                            text="{}\n {}".format(ud_type, tmp), reply_markup=reply_markup
+                        )
+                    else:
+                        await self._mess.edit_caption(
+                            caption="{}\n {}".format(ud_type, tmp)
+                        )
             except FloodWait as fd:
+                # Back off through the limiter; sleeping here would block the event loop
                 logger.warning(f"{fd}")
-                time.sleep(fd.x)
+                limiter.penalize(chat_id, fd.value)
             except Exception as ou:
                 logger.info(ou)
 
@@ -21,6 +21,8 @@ def get_encoding_mode_buttons():
          InlineKeyboardButton("📹 720p HEVC", callback_data="enc_preset_720p_hevc")],
         [InlineKeyboardButton("📱 480p H.264", callback_data="enc_preset_480p_h264"),
          InlineKeyboardButton("📱 480p HEVC", callback_data="enc_preset_480p_hevc")],
+        [InlineKeyboardButton("🔁 Remux → MP4", callback_data="enc_remux_mp4"),
+         InlineKeyboardButton("🔁 Remux → MKV", callback_data="enc_remux_mkv")],
         [InlineKeyboardButton("⚙️ Custom Settings", callback_data="enc_custom_menu")],
         [InlineKeyboardButton("🔙 Back to Main", callback_data="back_to_start")]
     ])
@@ -35,6 +37,7 @@ def get_custom_encoding_buttons():
          InlineKeyboardButton("⚡ Encoding Speed", callback_data="enc_speed_menu")],
         [InlineKeyboardButton("🔊 Audio Bitrate", callback_data="enc_audio_br_menu"),
          InlineKeyboardButton("🎵 Audio Codec", callback_data="enc_audio_codec_menu")],
+        [InlineKeyboardButton("🎞 Preview Clip", callback_data="enc_preview_toggle")],
         [InlineKeyboardButton("✅ Start Encoding", callback_data="enc_start_custom"),
          InlineKeyboardButton("🔙 Back", callback_data="enc_mode_menu")]
     ])
@@ -116,6 +119,14 @@ def get_current_settings_text(user_id):
     from helpers.encoding_helper import get_user_encoding_settings
     
     settings_obj = get_user_encoding_settings(user_id)
+    if settings_obj.remux_target:
+        return f"""⚙️ **Current Encoding Settings**
+
+🔁 **Mode:** `Remux to {settings_obj.remux_target.upper()}`
+📋 Streams are copied; only what the container can't hold is converted.
+
+💡 **Tip:** Takes seconds, quality is untouched
+"""
     settings = settings_obj.get_settings()
     
     preset_name = QUALITY_PRESETS.get(settings_obj.preset, {}).get("name", "Custom")
@@ -129,6 +140,7 @@ def get_current_settings_text(user_id):
 📐 **Resolution:** `{settings.get('resolution') or 'Original'}`
 🔊 **Audio Bitrate:** `{settings.get('audio_bitrate', '128k')}`
 🎵 **Audio Codec:** `{settings.get('audio_codec', 'aac')}`
+🎞 **Preview Clip:** `{'On' if settings_obj.preview_clip else 'Off'}`
 
 💡 **Tip:** Lower CRF = Better quality but larger file
 """
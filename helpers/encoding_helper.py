@@ -10,6 +10,9 @@ import time
 import re
 from typing import Optional, Dict, Any
 from __init__ import LOGGER
+from helpers.faststart import FASTSTART_FLAGS, is_mp4
+from helpers.media_probe import media_info
+from helpers.rate_limiter import progress_priority
 from helpers.utils import get_readable_file_size, get_readable_time
 
 # Encoding Quality Presets
@@ -107,6 +110,11 @@ AUDIO_CODECS = {
     "copy": "Copy (No Re-encoding)"
 }
 
+# Side outputs of the fused encode graph
+THUMB_SIDE = 320  # Telegram's thumbnail limit
+PREVIEW_HEIGHT = 360
+PREVIEW_LENGTH = 20  # seconds
+
 
 class EncodingSettings:
     """Stores encoding settings for a user"""
@@ -120,6 +128,8 @@ class EncodingSettings:
         self.custom_preset = None
         self.custom_audio_bitrate = None
         self.custom_audio_codec = None
+        self.remux_target = None  # "mp4"/"mkv": container conversion only, no encode
+        self.preview_clip = False  # Also write a short low-res sample in the same pass
     
     def get_settings(self) -> Dict[str, Any]:
         """Get current encoding settings"""
@@ -147,6 +157,16 @@ class EncodingSettings:
         """Set quality preset"""
         if preset in QUALITY_PRESETS:
             self.preset = preset
+            self.remux_target = None
+    
+    def set_remux(self, target: str):
+        """Switch to remux-only conversion into `target` container"""
+        if target in ("mp4", "mkv"):
+            self.remux_target = target
+    
+    def toggle_preview_clip(self):
+        """Switch the low-res preview clip on or off"""
+        self.preview_clip = not self.preview_clip
     
     def set_custom_crf(self, crf: str):
         """Set custom CRF value"""
@@ -188,22 +208,84 @@ def get_user_encoding_settings(user_id: int) -> EncodingSettings:
     return user_encoding_settings[user_id]
 
 
+def output_geometry(info: Dict[str, Any], settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Width, height and duration of the encode output, derived from the input probe.
+
+    The scale+pad chain produces exactly the requested resolution, and `copy`
+    keeps the source frame, so the encoded file never has to be probed again.
+    """
+    width, height = info.get("width", 0), info.get("height", 0)
+    if settings.get("codec") != "copy" and settings.get("resolution"):
+        width, height = (int(x) for x in settings["resolution"].split(":"))
+    return {"width": width, "height": height, "duration": info.get("duration", 0)}
+
+
+def fused_graph(
+    settings: Dict[str, Any],
+    thumbnail_at: Optional[float],
+    preview_at: Optional[float],
+) -> str:
+    """
+    `-filter_complex` that decodes the source once and `split`s it into the
+    encode ([v]), a single thumbnail frame ([thumb]) and a preview clip ([prev]).
+    Side branches rebase to zero first: `trim` works on absolute PTS, and
+    MPEG-TS or some MKV sources start well after 0.
+    """
+    side = []
+    if thumbnail_at is not None:
+        side.append((
+            "thumb",
+            f"setpts=PTS-STARTPTS,trim=start={thumbnail_at:.3f},"
+            f"scale={THUMB_SIDE}:{THUMB_SIDE}:force_original_aspect_ratio=decrease",
+        ))
+    if preview_at is not None:
+        side.append((
+            "prev",
+            f"setpts=PTS-STARTPTS,trim=start={preview_at:.3f}:duration={PREVIEW_LENGTH},"
+            "setpts=PTS-STARTPTS,"
+            f"scale=-2:min({PREVIEW_HEIGHT}\\,ih)",
+        ))
+    graph = "[0:v:0]"
+    if settings.get("resolution"):
+        graph += (
+            f"scale={settings['resolution']}:force_original_aspect_ratio=decrease,"
+            f"pad={settings['resolution']}:(ow-iw)/2:(oh-ih)/2,"
+        )
+    graph += f"split={len(side) + 1}[v]" + "".join(f"[{name}_in]" for name, _ in side)
+    for name, chain in side:
+        graph += f";[{name}_in]{chain}[{name}]"
+    return graph
+
+
 async def encode_video(
     input_file: str,
     output_file: str,
     user_id: int,
     progress_message=None,
-    preset: Optional[str] = None
+    preset: Optional[str] = None,
+    metadata: Optional[list] = None,
+    thumbnail_path: Optional[str] = None,
+    thumbnail_at: float = 0.0,
+    preview_path: Optional[str] = None,
+    preview_at: float = 0.0
 ) -> Optional[str]:
     """
     Encode video with specified settings
     
+    When the video is re-encoded, the thumbnail and preview clip are taken
+    from the same decoded frames (see `fused_graph`) instead of decoding the
+    output again afterwards.
+    
     Args:
         input_file: Path to input video
         output_file: Path to output video
         user_id: User ID for settings
         progress_message: Pyrogram message for progress updates
         preset: Override preset (optional)
+        metadata: Extra `-metadata` options for the output (optional)
+        thumbnail_path: Also write a JPEG of the frame at `thumbnail_at` (optional)
+        preview_path: Also write a short low-res clip from `preview_at` (optional)
     
     Returns:
         Path to encoded video or None if failed
@@ -224,6 +306,22 @@ async def encode_video(
         # Build FFmpeg command
         ffmpeg_cmd = ["ffmpeg", "-i", input_file, "-y"]
         
+        # One decode feeds the encode and the side outputs; a stream copy has no
+        # decoded frames to share, so the caller takes its thumbnail separately
+        fused = settings.get("codec") != "copy" and bool(thumbnail_path or preview_path)
+        if fused:
+            ffmpeg_cmd.extend([
+                "-filter_complex",
+                fused_graph(
+                    settings,
+                    thumbnail_at if thumbnail_path else None,
+                    preview_at if preview_path else None,
+                ),
+                "-map", "[v]", "-map", "0:a:0?",
+            ])
+            if output_file.lower().endswith(".mkv"):
+                ffmpeg_cmd.extend(["-map", "0:s:0?", "-c:s", "copy"])
+        
         # Video codec
         if settings.get("codec") == "copy":
             ffmpeg_cmd.extend(["-c:v", "copy"])
@@ -236,8 +334,8 @@ async def encode_video(
             # Preset
             ffmpeg_cmd.extend(["-preset", settings.get("preset", "medium")])
             
-            # Resolution
-            if settings.get("resolution"):
+            # Resolution (part of the filter graph when fused)
+            if settings.get("resolution") and not fused:
                 # Use scale filter with proper aspect ratio handling
                 ffmpeg_cmd.extend([
                     "-vf", 
@@ -258,9 +356,28 @@ async def encode_video(
         elif settings.get("codec") == "libx265":
             ffmpeg_cmd.extend(["-x265-params", "log-level=error"])
         
+        # Queued output tags
+        if metadata:
+            ffmpeg_cmd.extend(metadata)
+        
+        # Index up front so Telegram can stream before the download finishes
+        if is_mp4(output_file):
+            ffmpeg_cmd.extend(FASTSTART_FLAGS)
+        
         # Output file
         ffmpeg_cmd.append(output_file)
         
+        # Side outputs of the fused graph
+        if fused and thumbnail_path:
+            ffmpeg_cmd.extend([
+                "-map", "[thumb]", "-frames:v", "1", "-update", "1", "-q:v", "3", thumbnail_path
+            ])
+        if fused and preview_path:
+            ffmpeg_cmd.extend([
+                "-map", "[prev]", "-c:v", "libx264", "-preset", "veryfast", "-crf", "30",
+                *FASTSTART_FLAGS, preview_path
+            ])
+        
         LOGGER.info(f"FFmpeg command: {' '.join(ffmpeg_cmd)}")
         
         # Update progress
@@ -305,14 +422,15 @@ async def encode_video(
                     elapsed = time.time() - start_time
                     
                     try:
-                        await progress_message.edit_text(
-                            "🔄 **Encoding in Progress...**\n\n"
-                            f"📁 **File:** `{os.path.basename(input_file)}`\n"
-                            f"⏱ **Elapsed:** `{get_readable_time(elapsed)}`\n"
-                            f"🎬 **Codec:** `{settings.get('codec', 'libx264')}`\n"
-                            f"📊 **CRF:** `{settings.get('crf', '23')}`\n\n"
-                            "💡 Please be patient, encoding takes time..."
-                        )
+                        with progress_priority():
+                            await progress_message.edit_text(
+                                "🔄 **Encoding in Progress...**\n\n"
+                                f"📁 **File:** `{os.path.basename(input_file)}`\n"
+                                f"⏱ **Elapsed:** `{get_readable_time(elapsed)}`\n"
+                                f"🎬 **Codec:** `{settings.get('codec', 'libx264')}`\n"
+                                f"📊 **CRF:** `{settings.get('crf', '23')}`\n\n"
+                                "💡 Please be patient, encoding takes time..."
+                            )
                         last_update = time.time()
                     except Exception as e:
                         LOGGER.warning(f"Failed to update progress: {e}")
@@ -356,37 +474,13 @@ async def encode_video(
 
 
 async def get_video_info(file_path: str) -> Optional[Dict[str, Any]]:
-    """Get video information using ffprobe"""
-    try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height,duration,codec_name",
-            "-of", "json",
-            file_path
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode == 0:
-            import json
-            data = json.loads(stdout.decode())
-            stream = data.get("streams", [{}])[0]
-            
-            return {
-                "width": stream.get("width"),
-                "height": stream.get("height"),
-                "duration": float(stream.get("duration", 0)),
-                "codec": stream.get("codec_name")
-            }
-    except Exception as e:
-        LOGGER.error(f"Failed to get video info: {e}")
-    
-    return None
+    """Get video information from the shared probe cache"""
+    info = await media_info(file_path)
+    if info is None:
+        return None
+    return {
+        "width": info["width"],
+        "height": info["height"],
+        "duration": info["duration"],
+        "codec": info["video_codec"],
+    }
@@ -0,0 +1,137 @@
+# helpers/faststart.py - Move the MP4 index to the front for instant playback
+"""
+An MP4 written by a plain mux ends with its `moov` atom, so Telegram's
+streaming player must fetch the whole file before it can start.  Outputs
+we encode ourselves get `-movflags +faststart`; for files that already
+exist `make_faststart()` moves `moov` in front of `mdat` in Python: the
+chunk offset tables (`stco` / `co64`) are shifted by the size of `moov` and
+the file is rewritten once sequentially.  Nothing is decoded or re-muxed.
+Files that already start with `moov` are left untouched, and the rewrite is
+skipped when the disk has no room for the temporary copy.
+"""
+import asyncio
+import os
+import struct
+
+from __init__ import LOGGER
+from helpers.queue_manifest import has_disk_space
+
+MP4_EXTENSIONS = ("mp4", "m4v", "mov")
+FASTSTART_FLAGS = ["-movflags", "+faststart"]
+CONTAINER_ATOMS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+COPY_CHUNK = 8 * 1024 * 1024
+
+
+def is_mp4(path: str) -> bool:
+    return path.rsplit(".", 1)[-1].lower() in MP4_EXTENSIONS
+
+
+def _top_level_atoms(f, file_size: int) -> list:
+    """[(type, start, size), ...] of the top-level atoms"""
+    atoms, pos = [], 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+        elif size == 0:
+            size = file_size - pos
+        if size < 8:
+            raise ValueError(f"bad atom size at {pos}")
+        atoms.append((kind, pos, size))
+        pos += size
+    return atoms
+
+
+def _patch_offsets(moov: bytearray, start: int, end: int, shift) -> bool:
+    """Rewrite chunk offsets inside `moov[start:end]`; False if they no longer fit"""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", moov, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", moov, pos + 8)[0]
+            header = 16
+        if size < header or pos + size > end:
+            raise ValueError("malformed moov")
+        if kind in CONTAINER_ATOMS:
+            if not _patch_offsets(moov, pos + header, pos + size, shift):
+                return False
+        elif kind == b"cmov":
+            return False
+        elif kind in (b"stco", b"co64"):
+            count = struct.unpack_from(">I", moov, pos + header + 4)[0]
+            fmt, width = (">I", 4) if kind == b"stco" else (">Q", 8)
+            base = pos + header + 8
+            for i in range(count):
+                offset = shift(struct.unpack_from(fmt, moov, base + i * width)[0])
+                if kind == b"stco" and offset > 0xFFFFFFFF:
+                    return False
+                struct.pack_into(fmt, moov, base + i * width, offset)
+        pos += size
+    return True
+
+
+def _copy_range(src, dst, start: int, length: int):
+    src.seek(start)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK, length))
+        if not chunk:
+            raise ValueError("unexpected end of file")
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def _relocate_moov(path: str) -> bool:
+    """Rewrite `path` with moov first; True if the file was changed"""
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as src:
+        atoms = _top_level_atoms(src, file_size)
+        kinds = [a[0] for a in atoms]
+        if b"moov" not in kinds or b"mdat" not in kinds:
+            return False
+        _, moov_start, moov_size = atoms[kinds.index(b"moov")]
+        insert_at = atoms[kinds.index(b"mdat")][1]
+        if moov_start < insert_at:
+            return False  # Already streamable
+        if not has_disk_space(file_size, os.path.dirname(os.path.abspath(path))):
+            LOGGER.warning(f"Not enough free space to rewrite {path} with moov first, leaving it")
+            return False
+        src.seek(moov_start)
+        moov = bytearray(src.read(moov_size))
+
+        def shift(offset):
+            return offset + moov_size if insert_at <= offset < moov_start else offset
+
+        header = 16 if struct.unpack_from(">I", moov, 0)[0] == 1 else 8
+        if not _patch_offsets(moov, header, moov_size, shift):
+            LOGGER.info(f"Cannot move moov of {path} without widening stco, leaving it")
+            return False
+        tmp = f"{path}.faststart"
+        try:
+            with open(tmp, "wb") as dst:
+                _copy_range(src, dst, 0, insert_at)
+                dst.write(moov)
+                _copy_range(src, dst, insert_at, moov_start - insert_at)
+                _copy_range(src, dst, moov_start + moov_size, file_size - moov_start - moov_size)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    os.replace(tmp, path)
+    return True
+
+
+async def make_faststart(path: str) -> bool:
+    """Move the moov atom of an existing MP4 in front of its media data"""
+    if not is_mp4(path):
+        return False
+    loop = asyncio.get_running_loop()
+    try:
+        moved = await loop.run_in_executor(None, _relocate_moov, path)
+    except (OSError, ValueError, struct.error) as e:
+        LOGGER.warning(f"Faststart rewrite skipped for {path}: {e}")
+        return False
+    if moved:
+        LOGGER.info(f"Moved moov to the front of {path}")
+    return moved
@@ -1,40 +1,120 @@
 import asyncio
-import subprocess
 import shutil
 import os
 import time
-import ffmpeg
 from pyrogram.types import CallbackQuery
 from config import Config
 from pyrogram.types import Message
 from __init__ import LOGGER
 from helpers.utils import get_path_size
+from helpers.media_probe import probe, streams_of
+from helpers.keyframe_index import keyframe_before
+from helpers.smart_cut import smart_cut
+from helpers.stream_select import is_filtering, select_streams, selection_maps
+from helpers.transitions import crossfade_pieces
+from helpers.ts_concat import can_byte_concat, ts_byte_concat
+from helpers.merge_planner import (
+    concat_command,
+    normalize_plan,
+    plan_concat,
+    read_concat_list,
+    write_concat_list,
+)
 
 
-async def MergeVideo(input_file: str, user_id: int, message: Message, format_: str):
+async def run_command(cmd: list) -> int:
+    """Run an ffmpeg command without blocking the event loop; returns its exit code"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    await process.communicate()
+    return process.returncode
+
+
+async def MergeVideo(
+    input_file: str,
+    user_id: int,
+    message: Message,
+    format_: str,
+    subtitles: list = None,
+    transition: float = 0,
+    metadata: list = None,
+):
     """
     This is for Merging Videos Together!
     :param `input_file`: input.txt file's location.
     :param `user_id`: Pass user_id as integer.
     :param `message`: Pass Editable Message for Showing FFmpeg Progress.
     :param `format_`: Pass File Extension.
+    :param `subtitles`: Optional list of `(video_index, subtitle_path)` muxed in the same pass,
+        each shifted to where that video starts in the output.
+    :param `transition`: Crossfade length in seconds between videos (0 = hard cuts).
+    :param `metadata`: Extra `-metadata` options for the output (see helpers/output_tags.py).
     :return: This will return Merged Video File Path
     """
     output_vid = f"downloads/{str(user_id)}/[@yashoswalyo].{format_.lower()}"
-    file_generator_command = [
-        "ffmpeg",
-        "-f",
-        "concat",
-        "-safe",
-        "0",
-        "-i",
-        input_file,
-        "-map",
-        "0",
-        "-c",
-        "copy",
-        output_vid,
+    plan = await plan_concat(read_concat_list(input_file))
+    if (
+        plan["copy_only"]
+        and not subtitles
+        and not transition
+        and not metadata
+        and not is_filtering(user_id)
+        and await can_byte_concat(read_concat_list(input_file))
+    ):
+        # Continuing TS segments: append the files, the result stays MPEG-TS
+        await message.edit("⚡ Inputs are continuous TS segments, joining them directly ...")
+        ts_output = f"downloads/{str(user_id)}/[@yashoswalyo].ts"
+        joined = await ts_byte_concat(read_concat_list(input_file), ts_output)
+        if joined is not None:
+            return joined
+        LOGGER.info("Falling back to ffmpeg concat")
+    if not plan["copy_only"]:
+        to_normalize = [i for i in plan["inputs"] if i["normalize"]]
+        await message.edit(
+            f"🔄 Normalizing {len(to_normalize)} of {len(plan['inputs'])} inputs to match the others ..."
+        )
+        paths = await normalize_plan(plan, f"downloads/{str(user_id)}/normalized")
+        if paths is None:
+            await message.edit("❌ Could not normalize the inputs for merging")
+            return None
+        write_concat_list(input_file, paths)
+    durations = [(item["info"] or {}).get("duration", 0) for item in plan["inputs"]]
+    overlap = 0.0
+    if transition and any((item["info"] or {}).get("subtitle_codecs") for item in plan["inputs"]):
+        # Cutting bodies at keyframes would tear the inputs' own subtitle tracks
+        await message.edit("📝 Inputs carry subtitle tracks, merging with hard cuts ...")
+        LOGGER.info("Crossfade skipped: inputs have embedded subtitles")
+        transition = 0
+    if transition and len(plan["inputs"]) > 1 and plan["target"]:
+        await message.edit(f"🎞️ Building {len(plan['inputs']) - 1} crossfade(s) ...")
+        paths = read_concat_list(input_file)
+        pieces = await crossfade_pieces(
+            paths, plan["target"], transition, f"downloads/{str(user_id)}/transitions"
+        )
+        if pieces is None:
+            LOGGER.info("Crossfade not possible for these inputs, merging with hard cuts")
+        else:
+            overlap = transition
+            write_concat_list(input_file, pieces)
+    # Every crossfade join overlaps the next video by `overlap` seconds
+    subtitles = [
+        (sum(durations[:k]) - k * overlap, sub) for k, sub in subtitles or []
     ]
+    maps = ["-map", "0"]
+    existing_subs = 0
+    if subtitles or is_filtering(user_id):
+        first_data = await probe(read_concat_list(input_file)[0])
+        if is_filtering(user_id):
+            maps = selection_maps(first_data, user_id)
+            existing_subs = len(select_streams(first_data, user_id)["subtitle"])
+        else:
+            existing_subs = len(streams_of(first_data, "subtitle"))
+    file_generator_command = concat_command(
+        input_file, output_vid, subtitles, existing_subs, maps, metadata or ()
+    )
     process = None
     try:
         process = await asyncio.create_subprocess_exec(
@@ -87,12 +167,7 @@ async def MergeSub(filePath: str, subPath: str, user_id):
     muxcmd.append("0:s:?")
     muxcmd.append("-map")
     muxcmd.append("1:s")
-    videoData = ffmpeg.probe(filename=filePath)
-    videoStreamsData = videoData.get("streams")
-    subTrack = 0
-    for i in range(len(videoStreamsData)):
-        if videoStreamsData[i]["codec_type"] == "subtitle":
-            subTrack += 1
+    subTrack = len(streams_of(await probe(filePath), "subtitle"))
     muxcmd.append(f"-metadata:s:s:{subTrack}")
     subTrack += 1
     subTitle = f"Track {subTrack} - tg@yashoswalyo"
@@ -105,14 +180,14 @@ async def MergeSub(filePath: str, subPath: str, user_id):
     muxcmd.append("srt")
     muxcmd.append(f"./downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv")
     LOGGER.info("Muxing subtitles")
-    subprocess.call(muxcmd)
+    await run_command(muxcmd)
     orgFilePath = shutil.move(
         f"downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv", filePath
     )
     return orgFilePath
 
 
-def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
+async def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
     """
     This method is for Merging Video + Subtitle(s) Together.
 
@@ -128,21 +203,14 @@ def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
     muxcmd = []
     muxcmd.append("ffmpeg")
     muxcmd.append("-hide_banner")
-    videoData = ffmpeg.probe(filename=filePath)
-    videoStreamsData = videoData.get("streams")
-    subTrack = 0
-    for i in range(len(videoStreamsData)):
-        if videoStreamsData[i]["codec_type"] == "subtitle":
-            subTrack += 1
+    videoData = await probe(filePath)
+    subTrack = len(select_streams(videoData, user_id)["subtitle"])
     for i in file_list:
         muxcmd.append("-i")
         muxcmd.append(i)
     muxcmd.append("-map")
     muxcmd.append("0:v:0")
-    muxcmd.append("-map")
-    muxcmd.append("0:a:?")
-    muxcmd.append("-map")
-    muxcmd.append("0:s:?")
+    muxcmd += selection_maps(videoData, user_id, kinds=("audio", "subtitle"))
     for j in range(1, (len(file_list))):
         muxcmd.append("-map")
         muxcmd.append(f"{j}:s")
@@ -157,31 +225,29 @@ def MergeSubNew(filePath: str, subPath: str, user_id, file_list):
     muxcmd.append("srt")
     muxcmd.append(f"./downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv")
     LOGGER.info("Sub muxing")
-    subprocess.call(muxcmd)
+    await run_command(muxcmd)
     return f"downloads/{str(user_id)}/[@yashoswalyo]_softmuxed_video.mkv"
 
 
-def MergeAudio(videoPath: str, files_list: list, user_id):
+async def MergeAudio(videoPath: str, files_list: list, user_id):
     LOGGER.info("Generating Mux Command")
     muxcmd = []
     muxcmd.append("ffmpeg")
     muxcmd.append("-hide_banner")
-    videoData = ffmpeg.probe(filename=videoPath)
-    videoStreamsData = videoData.get("streams")
+    videoData = await probe(videoPath)
+    selected = select_streams(videoData, user_id)
     audioTracks = 0
     for i in files_list:
         muxcmd.append("-i")
         muxcmd.append(i)
     muxcmd.append("-map")
     muxcmd.append("0:v:0")
-    muxcmd.append("-map")
-    muxcmd.append("0:a:?")
+    muxcmd += selection_maps(videoData, user_id, kinds=("audio",))
     audioTracks = 0
-    for i in range(len(videoStreamsData)):
-        if videoStreamsData[i]["codec_type"] == "audio":
-            muxcmd.append(f"disposition:a:{audioTracks}")
-            muxcmd.append("0")
-            audioTracks += 1
+    for _ in selected["audio"]:
+        muxcmd.append(f"-disposition:a:{audioTracks}")
+        muxcmd.append("0")
+        audioTracks += 1
     fAudio = audioTracks
     for j in range(1, len(files_list)):
         muxcmd.append("-map")
@@ -191,8 +257,7 @@ def MergeAudio(videoPath: str, files_list: list, user_id):
         audioTracks += 1
     muxcmd.append(f"-disposition:s:a:{fAudio}")
     muxcmd.append("default")
-    muxcmd.append("-map")
-    muxcmd.append("0:s:?")
+    muxcmd += selection_maps(videoData, user_id, kinds=("subtitle",))
     muxcmd.append("-c:v")
     muxcmd.append("copy")
     muxcmd.append("-c:a")
@@ -202,44 +267,30 @@ def MergeAudio(videoPath: str, files_list: list, user_id):
     muxcmd.append(f"downloads/{str(user_id)}/[@yashoswalyo]_export.mkv")
 
     LOGGER.info(muxcmd)
-    process = subprocess.call(muxcmd)
+    process = await run_command(muxcmd)
     LOGGER.info(process)
     return f"downloads/{str(user_id)}/[@yashoswalyo]_export.mkv"
 
 
 async def cult_small_video(video_file, output_directory, start_time, end_time, format_):
-    # https://stackoverflow.com/a/13891070/4723940
-    out_put_file_name = (
-        output_directory + str(round(time.time())) + "." + format_.lower()
-    )
-    file_generator_command = [
-        "ffmpeg",
-        "-ss",
-        str(start_time),
-        "-to",
-        str(end_time),
-        "-i",
+    """
+    Trim `video_file` to [start_time, end_time] (seconds).
+
+    Full GOPs inside the range are stream-copied and only the partial GOPs at
+    both ends are re-encoded (see helpers/smart_cut.py), so the cut is frame
+    accurate without re-encoding the whole clip.
+
+    returns: Path of the trimmed file, or None
+    """
+    stamp = str(round(time.time()))
+    out_put_file_name = output_directory + stamp + "." + format_.lower()
+    return await smart_cut(
         video_file,
-        "-async",
-        "1",
-        "-strict",
-        "-2",
+        float(start_time),
+        float(end_time),
         out_put_file_name,
-    ]
-    process = await asyncio.create_subprocess_exec(
-        *file_generator_command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+        work_dir=output_directory + stamp + "_cut",
     )
-    stdout, stderr = await process.communicate()
-    e_response = stderr.decode().strip()
-    t_response = stdout.decode().strip()
-    LOGGER.info(e_response)
-    LOGGER.info(t_response)
-    if os.path.lexists(out_put_file_name):
-        return out_put_file_name
-    else:
-        return None
 
 
 async def take_screen_shot(video_file, output_directory, ttl):
@@ -273,6 +324,11 @@ async def take_screen_shot(video_file, output_directory, ttl):
             "3GP",
         )
     ):
+        # Seek to a keyframe (from the index, or a short scan) so only one
+        # frame is decoded
+        keyframe = await keyframe_before(video_file, float(ttl))
+        if keyframe is not None and float(ttl) - keyframe < 10:
+            ttl = keyframe
         file_genertor_command = [
             "ffmpeg",
             "-ss",
@@ -301,56 +357,87 @@ async def take_screen_shot(video_file, output_directory, ttl):
         return None
 
 
-async def extractAudios(path_to_file, user_id):
+# Subtitle codec -> (extension, codec); anything else goes into Matroska as is
+SUBTITLE_TARGETS = {
+    "subrip": ("srt", "copy"),
+    "mov_text": ("srt", "srt"),
+    "webvtt": ("srt", "srt"),
+    "text": ("srt", "srt"),
+    "ass": ("ass", "copy"),
+    "ssa": ("ass", "copy"),
+    "hdmv_pgs_subtitle": ("sup", "copy"),
+}
+
+
+def _extract_target(stream: dict):
+    """(extension, codec) a stream can be written to on its own"""
+    if stream["codec_type"] == "subtitle":
+        return SUBTITLE_TARGETS.get(stream.get("codec_name"), ("mks", "copy"))
+    return "mka", "copy"
+
+
+def _extract_name(stream: dict, ext: str) -> str:
+    tags = stream.get("tags", {})
+    kind = stream["codec_type"]
+    if "language" in tags and "title" in tags:
+        name = f"({tags['language']}) {tags['title']}.{kind}.{ext}"
+        return name.replace(" ", ".")
+    if kind == "subtitle" and "language" in tags:
+        return f"{stream['index']}.{tags['language']}.{kind}.{ext}"
+    return f"{stream['index']}.{kind}.{ext}"
+
+
+async def extractStreams(path_to_file, user_id, audios=True, subtitles=True):
     """
-    docs
+    Extract audio and/or subtitle streams into `extract/` next to the
+    download folder.  All streams are written by one ffmpeg process (one
+    `-map`/output pair per stream), so the file is demuxed only once.  If
+    that run fails, each stream is retried on its own so the ones that can
+    be written still are.
+
+    returns: Path of extract directory, or None if nothing was extracted
     """
     dir_name = os.path.dirname(os.path.dirname(path_to_file))
     if not os.path.exists(path_to_file):
         return None
-    if not os.path.exists(dir_name + "/extract"):
-        os.makedirs(dir_name + "/extract")
-    videoStreamsData = ffmpeg.probe(path_to_file)
-    # with open("data.json",'w') as f:
-    #     f.write(json.dumps(videoStreamsData))
     extract_dir = dir_name + "/extract"
-    audios = []
-    for stream in videoStreamsData.get("streams"):
-        try:
-            if stream["codec_type"] == "audio":
-                audios.append(stream)
-        except Exception as e:
-            LOGGER.warning(e)
-    for audio in audios:
-        extractcmd = []
-        extractcmd.append("ffmpeg")
-        extractcmd.append("-hide_banner")
-        extractcmd.append("-i")
-        extractcmd.append(path_to_file)
-        extractcmd.append("-map")
-        try:
-            index = audio["index"]
-            extractcmd.append(f"0:{index}")
-            try:
-                output_file: str = (
-                    "("
-                    + audio["tags"]["language"]
-                    + ") "
-                    + audio["tags"]["title"]
-                    + "."
-                    + audio["codec_type"]
-                    + ".mka"
-                )
-                output_file = output_file.replace(" ", ".")
-            except:
-                output_file = str(audio["index"]) + "." + audio["codec_type"] + ".mka"
-            extractcmd.append("-c")
-            extractcmd.append("copy")
-            extractcmd.append(f"{extract_dir}/{output_file}")
-            LOGGER.info(extractcmd)
-            subprocess.call(extractcmd)
-        except Exception as e:
-            LOGGER.error(f"Something went wrong: {e}")
+    if not os.path.exists(extract_dir):
+        os.makedirs(extract_dir)
+    data = await probe(path_to_file)
+    wanted = []
+    if audios:
+        wanted += streams_of(data, "audio")
+    if subtitles:
+        wanted += streams_of(data, "subtitle")
+    if not wanted:
+        LOGGER.warning(f"No streams to extract in {path_to_file}")
+        return None
+
+    outputs = []
+    used = set()
+    for stream in wanted:
+        ext, codec = _extract_target(stream)
+        output_file = _extract_name(stream, ext)
+        if output_file in used:
+            output_file = f"{stream['index']}.{output_file}"
+        used.add(output_file)
+        outputs.append(["-map", f"0:{stream['index']}", "-c", codec, f"{extract_dir}/{output_file}"])
+    extractcmd = ["ffmpeg", "-hide_banner", "-y", "-i", path_to_file]
+    for output in outputs:
+        extractcmd += output
+    LOGGER.info(extractcmd)
+    returncode = await run_command(extractcmd)
+    if returncode != 0 and len(outputs) > 1:
+        LOGGER.warning(f"Stream extraction exited with {returncode}, retrying stream by stream")
+        for output in outputs:
+            if os.path.exists(output[-1]):
+                os.remove(output[-1])  # May be a partial write of the failed run
+            if await run_command(["ffmpeg", "-hide_banner", "-y", "-i", path_to_file] + output) != 0:
+                LOGGER.error(f"Could not extract {output[1]} of {path_to_file}")
+                if os.path.exists(output[-1]):
+                    os.remove(output[-1])
+    elif returncode != 0:
+        LOGGER.error(f"Stream extraction exited with {returncode}")
     if get_path_size(extract_dir) > 0:
         return extract_dir
     else:
@@ -358,70 +445,11 @@ async def extractAudios(path_to_file, user_id):
         return None
 
 
+async def extractAudios(path_to_file, user_id):
+    """Extract every audio stream in a single pass"""
+    return await extractStreams(path_to_file, user_id, audios=True, subtitles=False)
+
+
 async def extractSubtitles(path_to_file, user_id):
-    """
-    docs
-    """
-    dir_name = os.path.dirname(os.path.dirname(path_to_file))
-    if not os.path.exists(path_to_file):
-        return None
-    if not os.path.exists(dir_name + "/extract"):
-        os.makedirs(dir_name + "/extract")
-    videoStreamsData = ffmpeg.probe(path_to_file)
-    # with open("data.json",'w') as f:
-    #     f.write(json.dumps(videoStreamsData))
-    extract_dir = dir_name + "/extract"
-    subtitles = []
-    for stream in videoStreamsData.get("streams"):
-        try:
-            if stream["codec_type"] == "subtitle":
-                subtitles.append(stream)
-        except Exception as e:
-            LOGGER.warning(e)
-    for subtitle in subtitles:
-        extractcmd = []
-        extractcmd.append("ffmpeg")
-        extractcmd.append("-hide_banner")
-        extractcmd.append("-i")
-        extractcmd.append(path_to_file)
-        extractcmd.append("-map")
-        try:
-            index = subtitle["index"]
-            extractcmd.append(f"0:{index}")
-            try:
-                output_file: str = (
-                    "("
-                    + subtitle["tags"]["language"]
-                    + ") "
-                    + subtitle["tags"]["title"]
-                    + "."
-                    + subtitle["codec_type"]
-                    + ".mka"
-                )
-                output_file = output_file.replace(" ", ".")
-            except:
-                try:
-                    output_file = (
-                        str(subtitle["index"])
-                        + "."
-                        + subtitle["tags"]["language"]
-                        + "."
-                        + subtitle["codec_type"]
-                        + ".mka"
-                    )
-                except:
-                    output_file = (
-                        str(subtitle["index"]) + "." + subtitle["codec_type"] + ".mka"
-                    )
-            extractcmd.append("-c")
-            extractcmd.append("copy")
-            extractcmd.append(f"{extract_dir}/{output_file}")
-            LOGGER.info(extractcmd)
-            subprocess.call(extractcmd)
-        except Exception as e:
-            LOGGER.error(f"Something went wrong: {e}")
-    if get_path_size(extract_dir) > 0:
-        return extract_dir
-    else:
-        LOGGER.warning(f"{extract_dir} is empty")
-        return None
+    """Extract every subtitle stream in a single pass"""
+    return await extractStreams(path_to_file, user_id, audios=False, subtitles=True)
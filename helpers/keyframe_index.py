@@ -0,0 +1,162 @@
+# helpers/keyframe_index.py - Persistent keyframe / GOP index per media file
+"""
+Trimming, splitting and screenshots all need keyframe positions.  The index
+is built once per file from packet flags (ffprobe reads packets only, no
+frame is decoded) and stored as `<file>.keyframes.json` next to the file,
+tagged with the file's size and mtime so a rewritten file is rescanned.
+It is only built where a whole file is walked (splitting); single cuts
+and screenshots scan a short window unless an index already exists.
+Later lookups come from memory (the most recently used indexes) or that
+JSON.
+
+Each keyframe is `[pts_time, byte_offset]`; the byte offset is -1 when the
+container does not report one.
+"""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+
+from __init__ import LOGGER
+
+INDEX_SUFFIX = ".keyframes.json"
+INDEX_VERSION = 1
+MEMORY_INDEXES = 64  # indexes kept in memory; older ones are re-read from JSON
+
+_memory = OrderedDict()  # realpath -> index dict, least recently used first
+_building = {}  # realpath -> asyncio.Task
+
+
+def index_path(path: str) -> str:
+    return path + INDEX_SUFFIX
+
+
+def _stamp(path: str):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _remember(real: str, index: dict):
+    _memory[real] = index
+    _memory.move_to_end(real)
+    while len(_memory) > MEMORY_INDEXES:
+        _memory.popitem(last=False)
+
+
+def _load(path: str):
+    real = os.path.realpath(path)
+    try:
+        stamp = _stamp(path)
+    except OSError:
+        return None
+    index = _memory.get(real)
+    if index and index["stamp"] == stamp:
+        _memory.move_to_end(real)
+        return index
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION or index.get("stamp") != stamp:
+        return None
+    _remember(real, index)
+    return index
+
+
+async def _scan(path: str, start: float = None, end: float = None) -> list:
+    """[[pts_time, pos], ...] of video keyframes, optionally only within [start, end]"""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0"]
+    if start is not None:
+        cmd += ["-read_intervals", f"{start}%{'' if end is None else end}"]
+    cmd += ["-show_entries", "packet=pts_time,pos,flags", "-of", "csv=p=0", path]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.warning(f"Keyframe scan failed for {path}: {stderr.decode().strip()[:200]}")
+        return []
+    keyframes = []
+    for line in stdout.decode().splitlines():
+        fields = line.split(",")
+        if len(fields) < 3 or "K" not in fields[2]:
+            continue
+        try:
+            pts = float(fields[0])
+        except ValueError:
+            continue
+        pos = int(fields[1]) if fields[1].isdigit() else -1
+        keyframes.append([pts, pos])
+    keyframes.sort()
+    return keyframes
+
+
+async def _build(path: str):
+    try:
+        stamp = _stamp(path)
+    except OSError:
+        return None
+    keyframes = await _scan(path)
+    index = {"version": INDEX_VERSION, "stamp": stamp, "keyframes": keyframes}
+    if keyframes:
+        try:
+            with open(index_path(path), "w") as f:
+                json.dump(index, f)
+        except OSError as e:
+            LOGGER.warning(f"Could not store keyframe index for {path}: {e}")
+        _remember(os.path.realpath(path), index)
+        LOGGER.info(f"Indexed {len(keyframes)} keyframes of {path}")
+    return index
+
+
+async def get_index(path: str):
+    """Full keyframe index of `path`, building and storing it on first use"""
+    index = _load(path)
+    if index is not None:
+        return index
+    if not os.path.exists(path):
+        return None
+    _start_build(path)
+    task = _building.get(os.path.realpath(path))
+    return await asyncio.shield(task) if task else _load(path)
+
+
+def _start_build(path: str):
+    """Start indexing `path` without waiting, unless it is indexed or being indexed"""
+    real = os.path.realpath(path)
+    if real in _building or _load(path) is not None or not os.path.exists(path):
+        return
+    task = asyncio.create_task(_build(path))
+    _building[real] = task
+    task.add_done_callback(lambda _: _building.pop(real, None))
+
+
+async def keyframe_times(path: str) -> list:
+    """All keyframe timestamps of `path` (builds the index if needed)"""
+    index = await get_index(path)
+    return [k[0] for k in index["keyframes"]] if index else []
+
+
+async def keyframes_between(path: str, start: float, end: float) -> list:
+    """
+    Keyframe timestamps within [start, end].  Uses the stored index when
+    there is one; otherwise only that window is scanned, which is cheaper
+    than indexing a long file for a single short cut.
+    """
+    index = _load(path)
+    if index is None and os.path.realpath(path) in _building:
+        index = await get_index(path)  # Already being built, wait for it
+    if index:
+        times = [k[0] for k in index["keyframes"]]
+    else:
+        times = [k[0] for k in await _scan(path, max(0, start - 1), end + 1)]
+    return [t for t in times if start <= t <= end]
+
+
+async def keyframe_before(path: str, ts: float, window: float = 10):
+    """Closest keyframe in [ts - window, ts], or None; see `keyframes_between`"""
+    times = await keyframes_between(path, max(0, ts - window), ts)
+    return times[-1] if times else None
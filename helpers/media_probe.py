@@ -0,0 +1,121 @@
+# helpers/media_probe.py - One ffprobe per file, shared by every caller
+"""
+Jobs used to probe the same file several times (ffmpeg.probe in the mux
+helpers, hachoir on inputs, output and thumbnail, another ffprobe in the
+encoder).  `probe()` runs ffprobe once off the event loop and caches the
+JSON keyed by (path, inode, size, mtime), so a file rewritten in place is
+probed again while repeat lookups are free.  Concurrent lookups of the same
+file share one ffprobe process.
+"""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+
+from __init__ import LOGGER
+
+PROBE_TIMEOUT = 60
+PROBE_CACHE_SIZE = 256
+
+_cache = OrderedDict()  # (path, inode, size, mtime_ns) -> ffprobe JSON
+_inflight = {}  # same key -> asyncio.Future
+
+
+async def ffprobe_json(path: str):
+    """Run ffprobe on `path` and return its JSON output, or None on failure"""
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return None
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        LOGGER.info(f"ffprobe failed on {path}: {stderr.decode().strip()[:200]}")
+        return None
+    return json.loads(stdout.decode() or "{}")
+
+
+def _cache_key(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.realpath(path), st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+async def probe(path: str):
+    """Cached ffprobe JSON (`{"streams": [...], "format": {...}}`) or None"""
+    key = _cache_key(path)
+    if key is None:
+        return None
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    if key in _inflight:
+        return await asyncio.shield(_inflight[key])
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        data = await ffprobe_json(path)
+        if data and data.get("streams"):
+            _cache[key] = data
+            while len(_cache) > PROBE_CACHE_SIZE:
+                _cache.popitem(last=False)
+        else:
+            data = None
+        future.set_result(data)
+        return data
+    except Exception as e:
+        future.set_result(None)
+        LOGGER.warning(f"Probe failed for {path}: {e}")
+        return None
+    finally:
+        # Also reached when this task is cancelled; don't leave waiters hanging
+        if not future.done():
+            future.set_result(None)
+        _inflight.pop(key, None)
+
+
+def streams_of(data: dict, codec_type: str) -> list:
+    """Streams of one kind ("video", "audio", "subtitle") from probe JSON"""
+    return [s for s in (data or {}).get("streams", []) if s.get("codec_type") == codec_type]
+
+
+async def media_info(path: str):
+    """
+    Duration, dimensions and stream lists of a local file, or None if it
+    cannot be read.  Works for images too (thumbnails).
+    """
+    data = await probe(path)
+    if data is None:
+        return None
+    videos = [s for s in streams_of(data, "video")
+              if not s.get("disposition", {}).get("attached_pic")]
+    video = videos[0] if videos else {}
+    duration = data.get("format", {}).get("duration") or video.get("duration") or 0
+    return {
+        "duration": float(duration),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "video_codec": video.get("codec_name"),
+        "video": videos,
+        "audio": streams_of(data, "audio"),
+        "subtitle": streams_of(data, "subtitle"),
+    }
+
+
+def forget(path: str):
+    """Drop cached entries for `path` (e.g. before deleting or overwriting it)"""
+    real = os.path.realpath(path)
+    for key in [k for k in _cache if k[0] == real]:
+        del _cache[key]
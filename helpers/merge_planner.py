@@ -0,0 +1,343 @@
+# helpers/merge_planner.py - Decide how merge inputs can be concatenated
+"""
+The concat demuxer with `-c copy` only works when every input shares the
+same stream parameters.  The planner probes all inputs, groups them by
+stream signature and picks the dominant group (most inputs, then longest
+total duration).  Inputs already matching it are stream-copied; only the
+minority is re-encoded to the dominant parameters before the final copy
+concat.
+
+The concat demuxer keeps the first file's codec header (SPS/PPS for
+H.264/HEVC), so re-encoded parts must not depend on their own.  For
+H.264/HEVC every input goes through an MPEG-TS intermediate: matching
+inputs are remuxed (the TS muxer puts their headers in-band) and the
+minority is encoded with headers repeated at every keyframe.  Other
+codecs, and audio that TS cannot carry, re-encode every input to MKV with
+the same settings as soon as one input needs it.
+"""
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+from __init__ import LOGGER
+from helpers.remote_probe import concat_signature, probe_file
+
+# ffprobe codec_name -> encoder used when a minority input must match it
+VIDEO_ENCODERS = {
+    "h264": ["libx264", "-crf", "18", "-preset", "veryfast"],
+    "hevc": ["libx265", "-crf", "20", "-preset", "veryfast", "-x265-params", "log-level=error"],
+    "vp9": ["libvpx-vp9", "-crf", "30", "-b:v", "0", "-row-mt", "1"],
+    "av1": ["libaom-av1", "-crf", "30", "-b:v", "0", "-cpu-used", "6"],
+    "mpeg4": ["mpeg4", "-q:v", "2"],
+}
+AUDIO_ENCODERS = {
+    "aac": "aac",
+    "opus": "libopus",
+    "mp3": "libmp3lame",
+    "ac3": "ac3",
+    "eac3": "eac3",
+    "flac": "flac",
+    "vorbis": "libvorbis",
+}
+CHANNEL_LAYOUTS = {1: "mono", 2: "stereo", 6: "5.1", 8: "7.1"}
+# Video codecs whose headers can travel in-band, and the audio MPEG-TS can hold
+ANNEXB_CODECS = ("h264", "hevc")
+TS_AUDIO = {"aac", "mp3", "mp2", "ac3", "eac3", "opus"}
+# ffprobe profile name -> encoder `-profile:v`
+ENCODER_PROFILES = {
+    "h264": {
+        "Baseline": "baseline", "Constrained Baseline": "baseline", "Main": "main",
+        "High": "high", "High 10": "high10", "High 4:2:2": "high422",
+        "High 4:4:4 Predictive": "high444",
+    },
+    "hevc": {"Main": "main", "Main 10": "main10", "Main Still Picture": "mainstillpicture"},
+}
+# Text subtitle codecs and the encoder writing them into the MKV intermediate;
+# mov_text cannot live in Matroska, so it only ever appears as a source
+TEXT_SUBTITLES = {"subrip", "ass", "ssa", "webvtt", "mov_text", "text"}
+SUBTITLE_ENCODERS = {"subrip": "srt", "ass": "ass", "ssa": "ass", "webvtt": "webvtt"}
+
+# Normalizations are independent ffmpeg processes; run a few side by side
+# and split the CPU budget between them instead of one job using every core.
+CPU_BUDGET = os.cpu_count() or 1
+NORMALIZE_JOBS = max(1, min(4, CPU_BUDGET // 2))
+
+
+def read_concat_list(input_file: str) -> list:
+    """Paths listed in an ffmpeg concat demuxer file"""
+    paths = []
+    with open(input_file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("file "):
+                paths.append(line[5:].strip("'").replace("'\\''", "'"))
+    return paths
+
+
+def write_concat_list(input_file: str, paths: list):
+    with open(input_file, "w") as f:
+        f.write("\n".join("file '" + p.replace("'", "'\\''") + "'" for p in paths))
+
+
+async def plan_concat(paths: list) -> dict:
+    """
+    Probe `paths` and return a plan:
+    `{"target": summary, "inputs": [{"path", "info", "normalize"}], "copy_only": bool}`
+    """
+    infos = await asyncio.gather(*(probe_file(p) for p in paths))
+    groups = defaultdict(list)
+    for info in infos:
+        if info is not None:
+            groups[concat_signature(info)].append(info)
+    if not groups:
+        return {"target": None, "inputs": [], "copy_only": True}
+    dominant = max(
+        groups,
+        key=lambda sig: (len(groups[sig]), sum(i.get("duration", 0) for i in groups[sig])),
+    )
+    target = groups[dominant][0]
+    inputs = [
+        {"path": p, "info": info, "normalize": info is not None and concat_signature(info) != dominant}
+        for p, info in zip(paths, infos)
+    ]
+    if any(i["normalize"] for i in inputs) and not can_encode(target):
+        # The minority cannot be made to match, so re-encode everything to H.264/AAC
+        LOGGER.info(f"No encoder for {target.get('video_codec')}/{target.get('audio_codec')}, re-encoding all inputs")
+        target = dict(
+            target,
+            video_codec="h264",
+            pix_fmt="yuv420p",
+            profile=None,
+            level=None,
+            audio_codec="aac" if target.get("audio_codec") else None,
+        )
+        for item in inputs:
+            item["normalize"] = item["info"] is not None
+    container = intermediate_container(target)
+    if any(i["normalize"] for i in inputs) and container == "mkv":
+        # Matching inputs would keep codec headers the re-encoded ones lack
+        for item in inputs:
+            item["normalize"] = item["info"] is not None
+    plan = {
+        "target": target,
+        "inputs": inputs,
+        "copy_only": not any(i["normalize"] for i in inputs),
+        "container": container,
+    }
+    LOGGER.info(
+        f"Concat plan: {len(groups)} signature group(s), "
+        f"{sum(i['normalize'] for i in inputs)}/{len(inputs)} input(s) to normalize"
+    )
+    return plan
+
+
+def can_encode(target: dict) -> bool:
+    """True if the target's codecs can be produced by a normalization"""
+    return target.get("video_codec") in VIDEO_ENCODERS and (
+        target.get("audio_codec") is None or target["audio_codec"] in AUDIO_ENCODERS
+    )
+
+
+def intermediate_container(target: dict) -> str:
+    """Intermediate format: TS when the target's streams fit it with in-band headers"""
+    if target.get("video_codec") in ANNEXB_CODECS and target.get("audio_codec") in TS_AUDIO | {None}:
+        return "ts"
+    return "mkv"
+
+
+def bitstream_args(info: dict, stream: dict) -> list:
+    """Encoder options reproducing the source's profile and level, with in-band headers"""
+    codec = info.get("video_codec")
+    args = []
+    profile = ENCODER_PROFILES.get(codec, {}).get(stream.get("profile"))
+    if profile:
+        args += ["-profile:v", profile]
+    level = stream.get("level") or 0
+    if codec == "h264":
+        if level > 0:
+            args += ["-level", f"{level / 10:.1f}"]
+        args += ["-x264-params", "repeat-headers=1"]
+    elif codec == "hevc":
+        args += ["-x265-params", "log-level=error:repeat-headers=1"]
+    return args
+
+
+def encoder_args(codec: str, bitstream: list = ()) -> list:
+    """`-c:v` options for `codec`; `bitstream` replaces the table's -x265-params"""
+    encoder = VIDEO_ENCODERS.get(codec, VIDEO_ENCODERS["h264"])
+    if any(a.startswith("-x265-params") for a in bitstream):
+        n = encoder.index("-x265-params")
+        encoder = encoder[:n] + encoder[n + 2:]
+    return ["-c:v"] + encoder + list(bitstream)
+
+
+def matches_target(info: dict, target: dict) -> bool:
+    """Whether a normalized output can be stream-copied next to `target` inputs"""
+    sig, want = concat_signature(info), concat_signature(target)
+    fps_ok = abs((info.get("fps") or 0) - (target.get("fps") or 0)) < 0.01
+    if not fps_ok or any(a != b for n, (a, b) in enumerate(zip(sig, want)) if n != 3):
+        return False
+    # The encoder was asked for the target's profile (and H.264 level)
+    profiles = ENCODER_PROFILES.get(target.get("video_codec"), {})
+    if target.get("profile") in profiles and \
+            profiles.get(info.get("profile")) != profiles[target["profile"]]:
+        return False
+    if target.get("video_codec") == "h264" and (target.get("level") or 0) > 0:
+        return info.get("level") == target["level"]
+    return True
+
+
+def subtitle_codecs(info: dict, target: dict) -> list:
+    """
+    Output codec for each leading subtitle track of `info` that can match the
+    target's track at the same index; stops at the first one that cannot.
+    """
+    codecs = []
+    for source, wanted in zip(info.get("subtitle_codecs") or [], target.get("subtitle_codecs") or []):
+        if source == wanted and source != "mov_text":
+            codecs.append("copy")
+        elif source in TEXT_SUBTITLES and wanted in SUBTITLE_ENCODERS:
+            codecs.append(SUBTITLE_ENCODERS[wanted])
+        else:
+            break
+    return codecs
+
+
+def normalize_command(src: str, dst: str, target: dict, info: dict, threads: int = 0) -> list:
+    """
+    ffmpeg command re-encoding `src` so its streams match `target`.  A .ts
+    `dst` carries no subtitles; MPEG-TS has no place for text tracks.
+    """
+    width, height = target["width"], target["height"]
+    vfilter = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
+        f"setsar={target.get('sar', '1:1').replace(':', '/')}"
+    )
+    if target.get("fps"):
+        vfilter += f",fps={target['fps']}"
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-i", src]
+    has_target_audio = target.get("audio_codec") is not None
+    # Same number of audio tracks as the target; missing ones are silence
+    audio_tracks = (target.get("audio_tracks") or 1) if has_target_audio else 0
+    own_tracks = info.get("audio_tracks", 1 if info.get("audio_codec") else 0)
+    add_silence = audio_tracks > own_tracks
+    if add_silence:
+        layout = CHANNEL_LAYOUTS.get(target.get("channels"), "stereo")
+        cmd += ["-f", "lavfi", "-i", f"anullsrc=r={target.get('sample_rate') or 48000}:cl={layout}"]
+    cmd += ["-map", "0:v:0"]
+    for k in range(audio_tracks):
+        cmd += ["-map", f"0:a:{k}" if k < own_tracks else "1:a:0"]
+    subs = subtitle_codecs(info, target) if not dst.endswith(".ts") else []
+    for k in range(len(subs)):
+        cmd += ["-map", f"0:s:{k}"]
+    cmd += ["-vf", vfilter]
+    cmd += encoder_args(target.get("video_codec"), bitstream_args(target, target))
+    if target.get("pix_fmt"):
+        cmd += ["-pix_fmt", target["pix_fmt"]]
+    if has_target_audio:
+        cmd += ["-c:a", AUDIO_ENCODERS.get(target["audio_codec"], "aac")]
+        if target.get("sample_rate"):
+            cmd += ["-ar", str(target["sample_rate"])]
+        if target.get("channels"):
+            cmd += ["-ac", str(target["channels"])]
+    else:
+        cmd += ["-an"]
+    if add_silence:
+        cmd += ["-shortest"]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    for k, codec in enumerate(subs):
+        cmd += [f"-c:s:{k}", codec]
+    cmd.append(dst)
+    return cmd
+
+
+def remux_command(src: str, dst: str) -> list:
+    """Stream-copy a matching input into a TS intermediate, headers in-band"""
+    # The TS muxer inserts h264/hevc_mp4toannexb, which repeats SPS/PPS at keyframes
+    return ["ffmpeg", "-hide_banner", "-y", "-i", src, "-map", "0:v:0", "-map", "0:a?",
+            "-c", "copy", "-f", "mpegts", dst]
+
+
+async def normalize_input(src: str, dst: str, target: dict, info: dict, threads: int = 0,
+                          encode: bool = True):
+    """Re-encode (or with `encode=False` remux) one input for the concat; returns `dst` or None"""
+    cmd = normalize_command(src, dst, target, info, threads) if encode else remux_command(src, dst)
+    LOGGER.info(cmd)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0 or not os.path.exists(dst):
+        LOGGER.error(f"Normalizing {src} failed: {stderr.decode().strip()[-500:]}")
+        return None
+    return dst
+
+
+async def normalize_plan(plan: dict, work_dir: str):
+    """
+    Normalize every flagged input of `plan` concurrently (at most
+    `NORMALIZE_JOBS` ffmpeg processes at once) into intermediates under
+    `work_dir`; with TS intermediates the other inputs are remuxed too.
+    Returns the concat path list, or None if any job failed.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    ext = plan.get("container", "mkv")
+    jobs = [n for n, item in enumerate(plan["inputs"])
+            if item["normalize"] or (ext == "ts" and item["info"] is not None)]
+    encodes = [n for n in jobs if plan["inputs"][n]["normalize"]]
+    slots = asyncio.Semaphore(NORMALIZE_JOBS)
+    threads = max(1, CPU_BUDGET // min(NORMALIZE_JOBS, len(encodes) or 1))
+
+    async def run(n):
+        item = plan["inputs"][n]
+        async with slots:
+            return await normalize_input(
+                item["path"], f"{work_dir}/{n}.{ext}", plan["target"], item["info"], threads,
+                encode=item["normalize"],
+            )
+
+    start = time.time()
+    results = dict(zip(jobs, await asyncio.gather(*(run(n) for n in jobs))))
+    LOGGER.info(
+        f"Normalized {len(encodes)} and remuxed {len(jobs) - len(encodes)} input(s) with {NORMALIZE_JOBS} parallel job(s) in {time.time() - start:.1f}s"
+    )
+    if any(r is None for r in results.values()):
+        return None
+    # A copy concat of mismatched parts "succeeds" with a broken file; refuse instead
+    for n in encodes:
+        path = results[n]
+        info = await probe_file(path)
+        if info is None or not matches_target(info, plan["target"]):
+            LOGGER.error(f"Normalized {path} still differs from the target: {info}")
+            return None
+    return [results.get(n, item["path"]) for n, item in enumerate(plan["inputs"])]
+
+
+def concat_command(input_file: str, output: str, subtitles: list = (), existing_subs: int = 0,
+                   maps: list = None, metadata: list = ()) -> list:
+    """
+    Final single-pass mux: stream-copy concat of `input_file` plus every
+    `(offset_seconds, path)` in `subtitles` as an extra subtitle track,
+    shifted to where its video starts in the merged timeline.
+    `existing_subs` is the number of subtitle tracks the concat already has;
+    `maps` selects and orders the concat's own streams (default: all);
+    `metadata` holds extra `-metadata` options for the output.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-f", "concat", "-safe", "0", "-i", input_file]
+    for offset, path in subtitles:
+        cmd += ["-itsoffset", f"{offset:.3f}", "-i", path]
+    cmd += maps or ["-map", "0"]
+    for n in range(len(subtitles)):
+        cmd += ["-map", f"{n + 1}:s"]
+    cmd += ["-c", "copy"]
+    for n in range(len(subtitles)):
+        track = existing_subs + n
+        cmd += [f"-c:s:{track}", "srt", f"-metadata:s:s:{track}", f"title=Track {track + 1} - tg@yashoswalyo"]
+    cmd += list(metadata)
+    cmd.append(output)
+    return cmd
@@ -0,0 +1,38 @@
+# helpers/output_tags.py - Tags written by the pass that creates the output
+"""
+With "Edit Metadata" enabled, a user can queue a title, author and audio
+track name in OUTPUT_TAGS.  The merge and encode helpers add them as
+`-metadata` options to the ffmpeg run that writes the output anyway, so
+no separate /metadata download-remux-upload round trip is needed.  The
+tags are consumed by the next output.
+"""
+from __init__ import OUTPUT_TAGS
+
+TAG_FIELDS = {"title": "✏️ Title", "author": "👤 Author", "audio": "🎵 Audio track"}
+
+
+def pending_tags(user_id: int, enabled: bool) -> dict:
+    """Queued tags of `user_id`, or nothing when metadata editing is off"""
+    if not enabled:
+        return {}
+    return {k: v for k, v in OUTPUT_TAGS.get(user_id, {}).items() if v}
+
+
+def set_tag(user_id: int, field: str, value: str):
+    OUTPUT_TAGS.setdefault(user_id, {})[field] = value
+
+
+def clear_tags(user_id: int):
+    OUTPUT_TAGS.pop(user_id, None)
+
+
+def metadata_args(tags: dict) -> list:
+    """ffmpeg output options writing `tags`"""
+    args = []
+    if tags.get("title"):
+        args += ["-metadata", f"title={tags['title']}"]
+    if tags.get("author"):
+        args += ["-metadata", f"artist={tags['author']}", "-metadata", f"author={tags['author']}"]
+    if tags.get("audio"):
+        args += ["-metadata:s:a:0", f"title={tags['audio']}"]
+    return args
@@ -0,0 +1,147 @@
+# helpers/prefetcher.py - Speculative background download of queued files
+"""
+Start pulling queued Telegram files into a per-user cache as soon as they
+are queued, so by the time the user presses "Merge Videos" or confirms an
+encode most of the download is already done.
+
+Prefetching is low priority: few concurrent downloads, a bandwidth cap per
+download and per-user / global disk budgets.  When a job actually needs a
+file it `claim()`s it; a running prefetch is then un-throttled and awaited,
+one that has not started yet is dropped and the job downloads normally.
+"""
+import asyncio
+import os
+import shutil
+import time
+
+from __init__ import LOGGER, queueDB
+from helpers.queue_manifest import has_disk_space, resolve_manifest
+
+PREFETCH_CONCURRENCY = 2
+PREFETCH_BANDWIDTH = 8 * 1024 * 1024  # bytes/s shared by all prefetches
+PREFETCH_USER_BYTES = 6 * 1024 * 1024 * 1024
+PREFETCH_TOTAL_BYTES = 20 * 1024 * 1024 * 1024
+PREFETCH_DISK_RESERVE = 5 * 1024 * 1024 * 1024  # Keep free for running jobs
+
+
+def prefetch_dir(user_id: int) -> str:
+    return f"downloads/{str(user_id)}/prefetch"
+
+
+class Prefetcher:
+    """Tracks one background download per (user, file_unique_id)"""
+
+    def __init__(self):
+        self._jobs = {}  # (user_id, file_unique_id) -> job dict
+        self._slots = None
+
+    def _bytes(self, user_id=None) -> int:
+        return sum(
+            job["size"] for (uid, _), job in self._jobs.items()
+            if user_id is None or uid == user_id
+        )
+
+    async def schedule(self, c, user_id: int):
+        """Queue background downloads for everything the user has queued"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        queued = [mid for ids in queueDB.get(user_id, {}).values() for mid in ids]
+        entries = await resolve_manifest(c, user_id, queued)
+        wanted = {e["file_unique_id"] for e in entries if e.get("file_id")}
+        for key in [k for k in self._jobs if k[0] == user_id and k[1] not in wanted]:
+            await self._drop(key)
+
+        for entry in entries:
+            if not entry.get("file_id"):
+                continue
+            key = (user_id, entry["file_unique_id"])
+            if key in self._jobs:
+                continue
+            size = entry["file_size"]
+            if (self._bytes(user_id) + size > PREFETCH_USER_BYTES
+                    or self._bytes() + size > PREFETCH_TOTAL_BYTES
+                    or not has_disk_space(size + PREFETCH_DISK_RESERVE)):
+                LOGGER.info(f"Prefetch budget reached for user {user_id}")
+                break
+            path = os.path.join(prefetch_dir(user_id), entry["file_unique_id"], entry["file_name"])
+            job = {"size": size, "path": path, "started": False, "done": False, "boost": False}
+            job["task"] = asyncio.create_task(self._run(c, entry, job))
+            self._jobs[key] = job
+
+    async def _run(self, c, entry: dict, job: dict):
+        async with self._slots:
+            job["started"] = True
+            os.makedirs(os.path.dirname(job["path"]), exist_ok=True)
+            start = time.time()
+            per_job_rate = PREFETCH_BANDWIDTH / PREFETCH_CONCURRENCY
+
+            async def throttle(current, total):
+                if job["boost"]:
+                    return
+                ahead = current / per_job_rate - (time.time() - start)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+
+            try:
+                path = await c.download_media(entry["file_id"], file_name=job["path"], progress=throttle)
+                job["path"] = path
+                job["done"] = bool(path) and os.path.exists(path)
+                LOGGER.info(f"Prefetched {entry['file_name']} in {time.time() - start:.1f}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.warning(f"Prefetch failed for {entry['file_name']}: {e}")
+
+    async def _drop(self, key):
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return
+        job["task"].cancel()
+        # Let the download stop writing before its directory goes away
+        await asyncio.wait([job["task"]])
+        shutil.rmtree(os.path.dirname(job["path"]), ignore_errors=True)
+
+    async def claim(self, user_id: int, entry: dict):
+        """
+        Return the local path of a prefetched file, waiting for an in-flight
+        prefetch to finish at full speed.  Returns None when the caller must
+        download the file itself.
+        """
+        key = (user_id, entry.get("file_unique_id"))
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return None
+        if not job["started"]:
+            job["task"].cancel()
+            return None
+        return await self._finish(job)
+
+    async def peek(self, user_id: int, entry: dict):
+        """
+        Like `claim()`, but the file stays owned by the prefetcher for the
+        merge/encode job that will claim it later.  Callers must not delete
+        or move the returned path.
+        """
+        job = self._jobs.get((user_id, entry.get("file_unique_id")))
+        if job is None or not job["started"]:
+            return None
+        return await self._finish(job)
+
+    async def _finish(self, job: dict):
+        """Wait for a started prefetch at full speed; its path, or None"""
+        job["boost"] = True
+        try:
+            await asyncio.shield(job["task"])
+        except asyncio.CancelledError:
+            return None
+        if job["done"] and os.path.exists(job["path"]):
+            return job["path"]
+        return None
+
+    async def cancel(self, user_id: int):
+        """Stop all prefetches of a user and delete their partial files"""
+        await asyncio.gather(*(self._drop(k) for k in [k for k in self._jobs if k[0] == user_id]))
+        shutil.rmtree(prefetch_dir(user_id), ignore_errors=True)
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,87 @@
+# helpers/queue_manifest.py - Media details captured when a file is queued
+"""
+queueDB only holds message ids.  The manifest keeps what we learn about each
+queued message at arrival time (file_id, size, name, duration, ...) so merge
+and encode jobs can download by file_id, estimate cost and check disk space
+without re-fetching every message from Telegram.
+"""
+import shutil
+
+from __init__ import LOGGER, manifestDB, probeDB, queueDB
+
+
+def build_manifest_entry(m) -> dict:
+    """Describe a queued message; works for videos, documents, audios and URLs"""
+    media = m.video or m.document or m.audio
+    if media is None:
+        text = (m.text or "").strip()
+        if text.startswith(("http://", "https://")):
+            return {"message_id": m.id, "url": text}
+        return {"message_id": m.id}
+    duration = getattr(media, "duration", None) or 0
+    probe = probeDB.get(m.from_user.id, {}).get(m.id) if m.from_user else None
+    if not duration and probe:
+        duration = int(probe.get("duration") or 0)
+    return {
+        "message_id": m.id,
+        "file_id": media.file_id,
+        "file_unique_id": media.file_unique_id,
+        "file_size": media.file_size or 0,
+        "mime_type": getattr(media, "mime_type", None),
+        "file_name": getattr(media, "file_name", None) or f"file_{m.id}",
+        "duration": duration,
+    }
+
+
+def add_to_manifest(user_id: int, messages: list):
+    """Record entries for newly queued messages and drop ones no longer queued"""
+    user_manifest = manifestDB.setdefault(user_id, {})
+    queued = set()
+    for ids in queueDB.get(user_id, {}).values():
+        queued.update(ids)
+    for stale in [mid for mid in user_manifest if mid not in queued]:
+        del user_manifest[stale]
+    for m in messages:
+        user_manifest[m.id] = build_manifest_entry(m)
+
+
+def clear_manifest(user_id: int):
+    manifestDB.pop(user_id, None)
+
+
+async def resolve_manifest(c, user_id: int, message_ids: list) -> list:
+    """
+    Return manifest entries for `message_ids` in order.  Entries missing from
+    the manifest (e.g. queued before a restart) are fetched in one batch.
+    """
+    user_manifest = manifestDB.setdefault(user_id, {})
+    missing = [mid for mid in message_ids if mid not in user_manifest]
+    if missing:
+        LOGGER.info(f"Manifest miss for {len(missing)} message(s) of user {user_id}, fetching")
+        for m in await c.get_messages(chat_id=user_id, message_ids=missing):
+            if m and not m.empty:
+                user_manifest[m.id] = build_manifest_entry(m)
+    return [user_manifest[mid] for mid in message_ids if mid in user_manifest]
+
+
+def queue_totals(user_id: int) -> dict:
+    """Bytes and seconds currently queued, from the manifest only"""
+    totals = {"bytes": 0, "duration": 0, "files": 0}
+    user_manifest = manifestDB.get(user_id, {})
+    for ids in queueDB.get(user_id, {}).values():
+        for mid in ids:
+            entry = user_manifest.get(mid)
+            if entry is None:
+                continue
+            totals["bytes"] += entry.get("file_size", 0)
+            totals["duration"] += entry.get("duration", 0)
+            totals["files"] += 1
+    return totals
+
+
+def has_disk_space(needed_bytes: int, path: str = "downloads") -> bool:
+    """Admission check: is there room for `needed_bytes` under `path`?"""
+    try:
+        return shutil.disk_usage(path).free > needed_bytes
+    except OSError:
+        return True
@@ -0,0 +1,252 @@
+# helpers/rate_limiter.py - Central Telegram API rate limiter
+"""
+One limiter shared by every handler so the bot stays under Bot API limits.
+
+A global token bucket caps total calls per second, per-chat buckets cap
+sends and edits separately, and waiters are served by priority so final
+results always go out ahead of progress edits.  Progress edits never wait:
+if there is no budget for them right now they are simply dropped, since a
+newer progress update will follow anyway.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+
+from pyrogram.errors import FloodWait
+
+from __init__ import LOGGER
+
+# Bot API limits (conservative): ~30 calls/s globally, ~1 message/s per chat,
+# ~20 edits/min per chat before Telegram starts answering with FloodWait.
+GLOBAL_RATE = 25.0
+GLOBAL_BURST = 30
+CHAT_SEND_RATE = 1.0
+CHAT_SEND_BURST = 3
+CHAT_EDIT_RATE = 20 / 60
+CHAT_EDIT_BURST = 5
+CHAT_IDLE_SECONDS = 600  # Forget per-chat buckets after 10 minutes idle
+
+KIND_SEND = "send"
+KIND_EDIT = "edit"
+
+# Lower value = served first
+PRIORITY_RESULT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_PROGRESS = 2
+
+_priority_ctx = contextvars.ContextVar("tg_call_priority", default=None)
+
+
+@contextmanager
+def progress_priority():
+    """Mark Bot API calls made inside this block as droppable progress updates"""
+    token = _priority_ctx.set(PRIORITY_PROGRESS)
+    try:
+        yield
+    finally:
+        _priority_ctx.reset(token)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """Global + per-chat token buckets with priority ordering of waiters"""
+
+    def __init__(self):
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._chats = {}  # (chat_id, kind) -> TokenBucket
+        self._waiters = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._chat_paused_until = {}
+
+    def _chat_bucket(self, chat_id, kind) -> TokenBucket:
+        key = (chat_id, kind)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if kind == KIND_EDIT:
+                bucket = TokenBucket(CHAT_EDIT_RATE, CHAT_EDIT_BURST)
+            else:
+                bucket = TokenBucket(CHAT_SEND_RATE, CHAT_SEND_BURST)
+            self._chats[key] = bucket
+            self._prune()
+        return bucket
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, b in self._chats.items() if now - b.updated > CHAT_IDLE_SECONDS]:
+            del self._chats[key]
+        for chat_id in [c for c, until in self._chat_paused_until.items() if until <= now]:
+            del self._chat_paused_until[chat_id]
+
+    def _chat_delay(self, chat_id, kind) -> float:
+        if chat_id is None:
+            return 0.0
+        paused = self._chat_paused_until.get(chat_id, 0) - time.monotonic()
+        return max(paused, self._chat_bucket(chat_id, kind).delay())
+
+    def _global_delay(self) -> float:
+        return max(self._paused_until - time.monotonic(), self._global.delay())
+
+    def penalize(self, chat_id, seconds: float):
+        """Record a FloodWait so every caller backs off, not just the one that hit it"""
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+        else:
+            self._prune()
+            self._chat_paused_until[chat_id] = max(self._chat_paused_until.get(chat_id, 0), until)
+
+    async def acquire(self, chat_id, kind: str, priority: int) -> bool:
+        """
+        Wait for budget to make one Bot API call.
+
+        Returns False (without waiting) for progress-priority calls that have
+        no budget right now; the caller should skip the call.
+        """
+        if priority >= PRIORITY_PROGRESS:
+            if self._waiters or self._chat_delay(chat_id, kind) > 0 or self._global_delay() > 0:
+                return False
+            if chat_id is not None:
+                self._chat_bucket(chat_id, kind).take()
+            self._global.take()
+            return True
+
+        while True:
+            wait = self._chat_delay(chat_id, kind)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        if chat_id is not None:
+            self._chat_bucket(chat_id, kind).take()
+
+        entry = (priority, next(self._seq))
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                if self._waiters[0] == entry:
+                    wait = self._global_delay()
+                    if wait <= 0:
+                        self._global.take()
+                        return True
+                else:
+                    wait = 0.05
+                await asyncio.sleep(wait)
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+
+
+limiter = RateLimiter()
+
+
+def _chat_id_of(args, kwargs):
+    chat_id = kwargs.get("chat_id", args[0] if args else None)
+    if isinstance(chat_id, int):
+        return chat_id
+    return None
+
+
+class RateLimitedClient:
+    """
+    Client mixin that routes outgoing Bot API calls through the shared limiter.
+
+    Mix in before pyrogram's Client; bound helpers such as `Message.edit_text`,
+    `Message.reply_text` and `Message.copy` call these client methods, so every
+    call site is covered without changes.
+    """
+
+    async def _limited(self, method, kind, priority, args, kwargs):
+        ctx_priority = _priority_ctx.get()
+        if ctx_priority is not None:
+            priority = max(priority, ctx_priority)
+        chat_id = _chat_id_of(args, kwargs)
+        if not await limiter.acquire(chat_id, kind, priority):
+            return None
+        try:
+            return await method(*args, **kwargs)
+        except FloodWait as e:
+            LOGGER.warning(f"FloodWait {e.value}s on {method.__name__} (chat {chat_id})")
+            limiter.penalize(chat_id, e.value)
+            if priority >= PRIORITY_PROGRESS:
+                return None
+            await limiter.acquire(chat_id, kind, priority)
+            return await method(*args, **kwargs)
+
+    async def send_message(self, *args, **kwargs):
+        return await self._limited(super().send_message, KIND_SEND, PRIORITY_NORMAL, args, kwargs)
+
+    async def send_video(self, *args, **kwargs):
+        return await self._limited(super().send_video, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def send_document(self, *args, **kwargs):
+        return await self._limited(super().send_document, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def send_audio(self, *args, **kwargs):
+        return await self._limited(super().send_audio, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def send_photo(self, *args, **kwargs):
+        return await self._limited(super().send_photo, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def send_animation(self, *args, **kwargs):
+        return await self._limited(super().send_animation, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def send_media_group(self, *args, **kwargs):
+        return await self._limited(super().send_media_group, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def send_cached_media(self, *args, **kwargs):
+        return await self._limited(super().send_cached_media, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def copy_message(self, *args, **kwargs):
+        return await self._limited(super().copy_message, KIND_SEND, PRIORITY_NORMAL, args, kwargs)
+
+    async def forward_messages(self, *args, **kwargs):
+        return await self._limited(super().forward_messages, KIND_SEND, PRIORITY_NORMAL, args, kwargs)
+
+    async def edit_message_text(self, *args, **kwargs):
+        return await self._limited(super().edit_message_text, KIND_EDIT, PRIORITY_NORMAL, args, kwargs)
+
+    async def edit_message_caption(self, *args, **kwargs):
+        return await self._limited(super().edit_message_caption, KIND_EDIT, PRIORITY_NORMAL, args, kwargs)
+
+    async def edit_message_reply_markup(self, *args, **kwargs):
+        return await self._limited(super().edit_message_reply_markup, KIND_EDIT, PRIORITY_NORMAL, args, kwargs)
+
+    async def edit_message_media(self, *args, **kwargs):
+        return await self._limited(super().edit_message_media, KIND_EDIT, PRIORITY_NORMAL, args, kwargs)
+
+    async def answer_callback_query(self, *args, **kwargs):
+        # Keyed by query id, not chat: only the global bucket applies.
+        # Served first, Telegram shows a spinner until the answer arrives.
+        return await self._limited(super().answer_callback_query, KIND_SEND, PRIORITY_RESULT, args, kwargs)
+
+    async def delete_messages(self, *args, **kwargs):
+        return await self._limited(super().delete_messages, KIND_EDIT, PRIORITY_NORMAL, args, kwargs)
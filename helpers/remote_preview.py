@@ -0,0 +1,373 @@
+# helpers/remote_preview.py - Screenshots and sample clips from a few byte ranges
+"""
+A screenshot or a short sample of a Telegram file needs only the container
+header, its index and the media bytes around the requested time.  The
+index says where those bytes are:
+
+* MP4: `moov` sample tables (`stts`, `stss`, `stsc`, `stsz`, `stco`/`co64`)
+  give the exact offsets from the keyframe before the start to the end of
+  the clip, for every track.
+* Matroska: `Cues` (found through the `SeekHead`) map times to cluster
+  positions.
+* MPEG-TS has no index; the offset is estimated from the average bitrate,
+  which is good enough because TS can be decoded from any packet.
+
+The ranges are pulled with `stream_media` into a sparse local copy (or a
+standalone window for TS) and ffmpeg runs on that, so a preview costs a few
+MB instead of the whole file.
+"""
+import asyncio
+import bisect
+import os
+import struct
+
+from __init__ import LOGGER
+from helpers.faststart import FASTSTART_FLAGS
+from helpers.remote_probe import PROBE_HEAD_CHUNKS, TG_CHUNK_SIZE, find_moov, tg_read
+from helpers.tag_writer import (EBML_HEADER, INFO, SEGMENT, ebml_children, mp4_atoms,
+                                read_element_id, read_element_size)
+
+SAMPLE_LENGTH = 30  # seconds
+PREVIEW_MAX_BYTES = 96 * 1024 * 1024  # give up (caller downloads) beyond this
+TS_MARGIN = 4  # seconds fetched before the target in a bitrate-estimated TS window
+TS_PACKET = 188
+
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_CLUSTER_POSITION = 0xF1
+TIMESTAMP_SCALE = 0x2AD7B1
+CLUSTER = 0x1F43B675
+
+
+# --- MP4 --------------------------------------------------------------------
+
+def _full_box(buf: bytes, kind: bytes) -> bytes:
+    """Body of child `kind` of `buf` without its version/flags, or b''"""
+    for child, _, end, data in mp4_atoms(buf):
+        if child == kind:
+            return buf[data + 4:end]
+    return b""
+
+
+def _child(buf: bytes, *path: bytes) -> bytes:
+    for kind in path:
+        for child, _, end, data in mp4_atoms(buf):
+            if child == kind:
+                buf = buf[data:end]
+                break
+        else:
+            return b""
+    return buf
+
+
+class _Mp4Track:
+    """Sample tables of one `trak`, enough to turn times into byte offsets"""
+
+    def __init__(self, trak: bytes):
+        mdia = _child(trak, b"mdia")
+        self.handler = _full_box(mdia, b"hdlr")[4:8]
+        mdhd = _full_box(mdia, b"mdhd")
+        version = _child(mdia, b"mdhd")[0]
+        self.timescale = struct.unpack_from(">I", mdhd, 16 if version == 1 else 8)[0]
+        stbl = _child(mdia, b"minf", b"stbl")
+
+        stts = _full_box(stbl, b"stts")
+        self.stts = [struct.unpack_from(">II", stts, 4 + 8 * i)
+                     for i in range(struct.unpack_from(">I", stts)[0])]
+        stss = _full_box(stbl, b"stss")
+        self.sync = [struct.unpack_from(">I", stss, 4 + 4 * i)[0] - 1
+                     for i in range(struct.unpack_from(">I", stss)[0])] if stss else None
+        stsc = _full_box(stbl, b"stsc")
+        self.stsc = [struct.unpack_from(">III", stsc, 4 + 12 * i)
+                     for i in range(struct.unpack_from(">I", stsc)[0])]
+        stsz = _full_box(stbl, b"stsz")
+        uniform, count = struct.unpack_from(">II", stsz)
+        self.sizes = [uniform] * count if uniform else list(struct.unpack_from(f">{count}I", stsz, 8))
+        stco = _full_box(stbl, b"stco")
+        if stco:
+            n = struct.unpack_from(">I", stco)[0]
+            self.chunks = list(struct.unpack_from(f">{n}I", stco, 4))
+        else:
+            co64 = _full_box(stbl, b"co64")
+            n = struct.unpack_from(">I", co64)[0]
+            self.chunks = list(struct.unpack_from(f">{n}Q", co64, 4))
+
+    def sample_at(self, seconds: float) -> int:
+        """Index of the sample playing at `seconds`"""
+        target = seconds * self.timescale
+        sample, elapsed = 0, 0
+        for count, delta in self.stts:
+            if delta and elapsed + count * delta > target:
+                return sample + int((target - elapsed) // delta)
+            sample += count
+            elapsed += count * delta
+        return max(0, sample - 1)
+
+    def keyframe_before(self, sample: int) -> int:
+        if not self.sync:
+            return sample
+        i = bisect.bisect_right(self.sync, sample) - 1
+        return self.sync[max(i, 0)]
+
+    def byte_range(self, first: int, last: int):
+        """(start offset, end offset) covering samples `first`..`last`"""
+        offsets = []
+        sample = 0
+        for n, (first_chunk, per_chunk, _) in enumerate(self.stsc):
+            next_first = self.stsc[n + 1][0] if n + 1 < len(self.stsc) else len(self.chunks) + 1
+            for chunk in range(first_chunk - 1, next_first - 1):
+                if sample + per_chunk > first and sample <= last:
+                    pos = self.chunks[chunk]
+                    for s in range(sample, min(sample + per_chunk, len(self.sizes))):
+                        if first <= s <= last:
+                            offsets.append((pos, pos + self.sizes[s]))
+                        pos += self.sizes[s]
+                sample += per_chunk
+                if sample > last:
+                    break
+            if sample > last:
+                break
+        if not offsets:
+            return None
+        return min(o[0] for o in offsets), max(o[1] for o in offsets)
+
+
+def mp4_preview_range(moov: bytes, start: float, end: float):
+    """Byte span holding every track's samples from the keyframe before `start` to `end`"""
+    body = moov[16:] if struct.unpack_from(">I", moov)[0] == 1 else moov[8:]
+    tracks = [_Mp4Track(body[data:t_end]) for kind, _, t_end, data in mp4_atoms(body) if kind == b"trak"]
+    video = [t for t in tracks if t.handler == b"vide"]
+    if not video:
+        return None
+    first_video = video[0].keyframe_before(video[0].sample_at(start))
+    # Audio and other tracks are needed from the keyframe's time onwards
+    key_time = 0.0
+    elapsed, sample = 0, 0
+    for count, delta in video[0].stts:
+        if sample + count > first_video:
+            key_time = (elapsed + (first_video - sample) * delta) / video[0].timescale
+            break
+        sample += count
+        elapsed += count * delta
+    spans = []
+    for track in tracks:
+        if track.handler not in (b"vide", b"soun"):
+            continue
+        first = first_video if track is video[0] else track.sample_at(key_time)
+        span = track.byte_range(first, track.sample_at(end))
+        if span:
+            spans.append(span)
+    if not spans:
+        return None
+    return min(s[0] for s in spans), max(s[1] for s in spans)
+
+
+# --- Matroska ---------------------------------------------------------------
+
+def _uint(body: bytes) -> int:
+    return int.from_bytes(body, "big") if body else 0
+
+
+def _mkv_head(head: bytes):
+    """(segment data start, {element id: segment position}, timestamp scale, cues in head)"""
+    header_id, id_len = read_element_id(head, 0)
+    if header_id != EBML_HEADER:
+        return None
+    size, size_len = read_element_size(head, id_len)
+    pos = id_len + size_len + size
+    seg_id, id_len = read_element_id(head, pos)
+    if seg_id != SEGMENT:
+        return None
+    _, size_len = read_element_size(head, pos + id_len)
+    segment = pos + id_len + size_len
+    seeks, scale, cues = {}, 1000000, None
+    pos = segment
+    while pos + 12 <= len(head):
+        element_id, id_len = read_element_id(head, pos)
+        size, size_len = read_element_size(head, pos + id_len)
+        data = pos + id_len + size_len
+        if element_id == CLUSTER or size is None:
+            break
+        if data + size <= len(head):
+            body = head[data:data + size]
+            if element_id == SEEK_HEAD:
+                for seek_id, _, s_end, s_data in ebml_children(body):
+                    if seek_id != SEEK:
+                        continue
+                    entry = {k: body[s_data:s_end][d:e] for k, _, e, d in ebml_children(body[s_data:s_end])}
+                    seeks[_uint(entry.get(SEEK_ID, b""))] = _uint(entry.get(SEEK_POSITION, b""))
+            elif element_id == INFO:
+                for info_id, _, i_end, i_data in ebml_children(body):
+                    if info_id == TIMESTAMP_SCALE:
+                        scale = _uint(body[i_data:i_end])
+            elif element_id == CUES:
+                cues = body
+        pos = data + size
+    return segment, seeks, scale, cues
+
+
+def mkv_cue_points(cues: bytes, scale: int) -> list:
+    """Sorted [(seconds, cluster position relative to the segment), ...]"""
+    points = []
+    for point_id, _, p_end, p_data in ebml_children(cues):
+        if point_id != CUE_POINT:
+            continue
+        point = cues[p_data:p_end]
+        seconds, position = None, None
+        for kid, _, k_end, k_data in ebml_children(point):
+            if kid == CUE_TIME:
+                seconds = _uint(point[k_data:k_end]) * scale / 1e9
+            elif kid == CUE_TRACK_POSITIONS and position is None:
+                track = point[k_data:k_end]
+                for t_id, _, t_end, t_data in ebml_children(track):
+                    if t_id == CUE_CLUSTER_POSITION:
+                        position = _uint(track[t_data:t_end])
+        if seconds is not None and position is not None:
+            points.append((seconds, position))
+    return sorted(points)
+
+
+# --- Orchestration ----------------------------------------------------------
+
+async def _fetch_parts(c, message, file_size: int, at: float, length: float, duration: float):
+    """
+    Byte ranges needed for a preview at `at` seconds.
+
+    returns: ("sparse", [(offset, bytes), ...], ext) or ("window", bytes, "ts"), or None.
+    """
+    head = await tg_read(c, message, 0, min(file_size, PROBE_HEAD_CHUNKS * TG_CHUNK_SIZE))
+
+    async def read(start, size):
+        return await tg_read(c, message, start, size)
+
+    if head[4:8] == b"ftyp":
+        moov_at = await find_moov(read, head, file_size)
+        if moov_at is None:
+            # moov is inside the head; locate it there
+            offset = 0
+            while offset + 8 <= len(head):
+                size, kind = struct.unpack_from(">I4s", head, offset)
+                if kind == b"moov":
+                    moov_at = (offset, size)
+                    break
+                if size < 8:
+                    return None
+                offset += size
+            if moov_at is None:
+                return None
+            moov = head[moov_at[0]:moov_at[0] + moov_at[1]]
+        else:
+            moov = await read(*moov_at)
+        span = mp4_preview_range(moov, at, at + length)
+        if span is None or span[1] - span[0] > PREVIEW_MAX_BYTES:
+            return None
+        parts = [(0, head), (moov_at[0], moov), (span[0], await read(span[0], span[1] - span[0]))]
+        return "sparse", parts, "mp4"
+
+    if head[:4] == EBML_HEADER.to_bytes(4, "big"):
+        layout = _mkv_head(head)
+        if layout is None:
+            return None
+        segment, seeks, scale, cues = layout
+        parts = [(0, head)]
+        if cues is None:
+            if CUES not in seeks:
+                return None
+            cues_at = segment + seeks[CUES]
+            header = await read(cues_at, 12)
+            _, id_len = read_element_id(header, 0)
+            size, size_len = read_element_size(header, id_len)
+            if size is None or size > PREVIEW_MAX_BYTES:
+                return None
+            element = await read(cues_at, id_len + size_len + size)
+            parts.append((cues_at, element))
+            cues = element[id_len + size_len:]
+        points = mkv_cue_points(cues, scale)
+        if not points:
+            return None
+        times = [p[0] for p in points]
+        i = max(bisect.bisect_right(times, at) - 1, 0)
+        j = bisect.bisect_right(times, at + length) + 1  # one cluster past the end
+        start = segment + points[i][1]
+        end = segment + points[j][1] if j < len(points) else file_size
+        if end - start > PREVIEW_MAX_BYTES:
+            return None
+        parts.append((start, await read(start, end - start)))
+        return "sparse", parts, "mkv"
+
+    if head[:1] == b"\x47" and head[TS_PACKET:TS_PACKET + 1] == b"\x47" and duration:
+        rate = file_size / duration
+        start = int(max(0, at - TS_MARGIN) * rate) // TS_PACKET * TS_PACKET
+        size = min(file_size - start, int((length + 2 * TS_MARGIN) * rate))
+        if size > PREVIEW_MAX_BYTES:
+            return None
+        return "window", await read(start, size), "ts"
+    return None
+
+
+async def _run(cmd: list) -> bool:
+    LOGGER.info(cmd)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.error(stderr.decode().strip()[-500:])
+    return process.returncode == 0
+
+
+async def remote_preview(c, message, at: float, work_dir: str, length: float = SAMPLE_LENGTH):
+    """
+    Screenshot at `at` seconds and a low-res `length`-second sample of a
+    Telegram video, fetching only the byte ranges they need.
+
+    returns: (screenshot path or None, sample path or None), or None when the
+    container has no usable index (caller should download instead).
+    """
+    media = message.video or message.document
+    if media is None or not media.file_size:
+        return None
+    duration = getattr(media, "duration", 0) or 0
+    if duration:
+        at = min(at, max(0, duration - 1))
+        length = min(length, duration - at)
+    try:
+        fetched = await _fetch_parts(c, message, media.file_size, at, length, duration)
+    except Exception as e:
+        LOGGER.warning(f"Remote preview fetch failed for message {message.id}: {e}")
+        return None
+    if fetched is None:
+        return None
+    mode, parts, ext = fetched
+    os.makedirs(work_dir, exist_ok=True)
+    src = os.path.join(work_dir, f"preview_src.{ext}")
+    with open(src, "wb") as f:
+        if mode == "sparse":
+            f.truncate(media.file_size)
+            for offset, data in parts:
+                f.seek(offset)
+                f.write(data)
+        else:
+            f.write(parts)
+    # A TS window starts near the target already; indexed copies seek exactly
+    seek = ["-ss", f"{at:.3f}"] if mode == "sparse" else ["-ss", f"{min(at, TS_MARGIN):.3f}"]
+    shot = os.path.join(work_dir, "preview.jpg")
+    sample = os.path.join(work_dir, "preview.mp4")
+    shot_ok, sample_ok = await asyncio.gather(
+        _run(["ffmpeg", "-hide_banner", "-y"] + seek + ["-i", src, "-frames:v", "1", "-q:v", "3", shot]),
+        _run(["ffmpeg", "-hide_banner", "-y"] + seek + [
+            "-i", src, "-t", f"{length:.3f}", "-map", "0:v:0", "-map", "0:a:0?",
+            "-vf", "scale=-2:480", "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+            "-c:a", "aac", "-b:a", "96k", *FASTSTART_FLAGS, sample,
+        ]) if length > 0 else asyncio.sleep(0, False),
+    )
+    os.remove(src)
+    return (shot if shot_ok else None), (sample if sample_ok else None)
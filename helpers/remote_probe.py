@@ -0,0 +1,284 @@
+# helpers/remote_probe.py - Probe media from partial bytes before downloading
+"""
+Fetch only the container header (and the MP4 `moov` atom when it sits at the
+end of the file) from Telegram or an HTTP URL, then run ffprobe on a sparse
+local copy.  This is enough to read codecs, resolution, fps and duration, so
+broken inputs can be rejected at enqueue time instead of after gigabytes have
+been pulled.  Concat-incompatible inputs are accepted and normalized by the
+merge planner (see helpers/merge_planner.py).
+"""
+import os
+import struct
+
+import aiohttp
+
+from __init__ import LOGGER, probeDB, queueDB
+from helpers.media_probe import ffprobe_json, probe
+
+TG_CHUNK_SIZE = 1024 * 1024  # pyrogram stream_media works in 1 MiB chunks
+PROBE_HEAD_CHUNKS = 2
+PROBE_MAX_MOOV_BYTES = 32 * 1024 * 1024
+PROBE_TIMEOUT = 60
+
+MP4_EXTENSIONS = ("mp4", "m4v", "mov", "3gp", "m4a")
+
+
+async def locate_moov(read, head: bytes, file_size: int):
+    """
+    Walk top-level MP4 boxes and return (offset, length) of the `moov` box,
+    or None when there is none.  Box headers past `head` are fetched with
+    `read(offset, length)`.
+    """
+    offset = 0
+    while offset + 8 <= file_size:
+        if offset + 16 <= len(head):
+            box_header = head[offset:offset + 16]
+        else:
+            box_header = await read(offset, min(16, file_size - offset))
+        size, box_type = struct.unpack(">I4s", box_header[:8])
+        if size == 1:
+            size = struct.unpack(">Q", box_header[8:16])[0]
+        elif size == 0:
+            size = file_size - offset
+        if size < 8:
+            return None
+        if box_type == b"moov":
+            return offset, size
+        offset += size
+    return None
+
+
+async def find_moov(read, head: bytes, file_size: int):
+    """(offset, length) of the `moov` box when it is not fully inside `head`, else None"""
+    moov = await locate_moov(read, head, file_size)
+    return None if moov is None or moov[0] + moov[1] <= len(head) else moov
+
+
+async def _with_moov(read, head: bytes, file_size: int):
+    """
+    Byte parts to probe an MP4: the head plus `moov` when it lies past it.
+    None when `moov` is missing or too large to fetch; the head alone would
+    make a good file look broken.
+    """
+    moov = await locate_moov(read, head, file_size)
+    if moov is None or moov[1] > PROBE_MAX_MOOV_BYTES:
+        return None
+    parts = [(0, head)]
+    if moov[0] + moov[1] > len(head):
+        parts.append((moov[0], await read(*moov)))
+    return parts
+
+
+def _parse_rate(rate: str) -> float:
+    try:
+        num, den = rate.split("/")
+        return round(float(num) / float(den), 3) if float(den) else 0.0
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+def _language(stream: dict) -> str:
+    return (stream.get("tags") or {}).get("language", "und").lower()
+
+
+def summarize_probe(data: dict) -> dict:
+    """Reduce raw ffprobe JSON to the fields merge decisions are based on"""
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"
+                  and not s.get("disposition", {}).get("attached_pic")), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    duration = data.get("format", {}).get("duration") or video.get("duration") or 0
+    return {
+        "valid": bool(video),
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": _parse_rate(video.get("avg_frame_rate") or video.get("r_frame_rate") or "0/0"),
+        "pix_fmt": video.get("pix_fmt"),
+        "profile": video.get("profile"),
+        "level": video.get("level"),
+        "sar": video.get("sample_aspect_ratio") or "1:1",
+        "audio_codec": audio.get("codec_name"),
+        "sample_rate": audio.get("sample_rate"),
+        "channels": audio.get("channels"),
+        "duration": float(duration),
+        "format": data.get("format", {}).get("format_name"),
+        "audio_tracks": sum(1 for s in streams if s.get("codec_type") == "audio"),
+        "subtitle_codecs": [s.get("codec_name") for s in streams if s.get("codec_type") == "subtitle"],
+        "audio_langs": [_language(s) for s in streams if s.get("codec_type") == "audio"],
+        "subtitle_langs": [_language(s) for s in streams if s.get("codec_type") == "subtitle"],
+    }
+
+
+def concat_signature(info: dict) -> tuple:
+    """Fields that must match for `-f concat -c copy` to produce a sane file"""
+    return (
+        info.get("video_codec"),
+        info.get("width"),
+        info.get("height"),
+        info.get("fps"),
+        info.get("pix_fmt"),
+        info.get("sar"),
+        info.get("audio_codec"),
+        info.get("sample_rate"),
+        info.get("channels"),
+        info.get("audio_tracks"),
+    )
+
+
+def concat_mismatches(reference: dict, info: dict) -> list:
+    """Human readable list of differences between two probe summaries"""
+    labels = ["video codec", "width", "height", "fps", "pixel format",
+              "aspect ratio", "audio codec", "sample rate", "channels", "audio tracks"]
+    ref_sig = concat_signature(reference)
+    sig = concat_signature(info)
+    return [
+        f"{label}: `{b}` vs `{a}`"
+        for label, a, b in zip(labels, ref_sig, sig)
+        if a != b
+    ]
+
+
+async def probe_file(path: str):
+    """Summary of a local file from the shared probe cache, or None if unreadable"""
+    data = await probe(path)
+    if data is None:
+        return None
+    return summarize_probe(data)
+
+
+async def _probe_sparse(parts: list, file_size: int, work_path: str):
+    """Write (offset, bytes) parts into a sparse file of `file_size` and probe it"""
+    os.makedirs(os.path.dirname(work_path) or ".", exist_ok=True)
+    try:
+        with open(work_path, "wb") as f:
+            f.truncate(file_size)
+            for offset, data in parts:
+                f.seek(offset)
+                f.write(data)
+        data = await ffprobe_json(work_path)
+    finally:
+        if os.path.exists(work_path):
+            os.remove(work_path)
+    if not data or not data.get("streams"):
+        return {"valid": False}
+    return summarize_probe(data)
+
+
+async def tg_read(c, message, start: int, length: int) -> bytes:
+    first_chunk = start // TG_CHUNK_SIZE
+    last_chunk = (start + length - 1) // TG_CHUNK_SIZE
+    buf = bytearray()
+    async for chunk in c.stream_media(message, offset=first_chunk, limit=last_chunk - first_chunk + 1):
+        buf.extend(chunk)
+    skip = start - first_chunk * TG_CHUNK_SIZE
+    return bytes(buf[skip:skip + length])
+
+
+async def probe_tg_media(c, message, work_path: str):
+    """
+    Probe a Telegram video/document from its first chunks (plus `moov`).
+
+    Returns a summary dict (see `summarize_probe`); `valid` is False when
+    ffprobe could not make sense of the bytes, i.e. the file is broken or not
+    a video.  Returns None when the probe itself failed (network, timeout,
+    `moov` not fetched), in which case the caller should not judge the file.
+    """
+    media = message.video or message.document
+    if media is None or not media.file_size:
+        return None
+    file_size = media.file_size
+    try:
+        head = await tg_read(c, message, 0, min(file_size, PROBE_HEAD_CHUNKS * TG_CHUNK_SIZE))
+        parts = [(0, head)]
+        ext = (getattr(media, "file_name", None) or "").rsplit(".", 1)[-1].lower()
+        if ext in MP4_EXTENSIONS or head[4:8] == b"ftyp":
+            async def read(start, length):
+                return await tg_read(c, message, start, length)
+
+            parts = await _with_moov(read, head, file_size)
+            if parts is None:
+                LOGGER.info(f"moov of message {message.id} not captured, skipping the remote probe")
+                return None
+        return await _probe_sparse(parts, file_size, work_path)
+    except Exception as e:
+        LOGGER.warning(f"Remote probe failed for message {message.id}: {e}")
+        return None
+
+
+async def probe_url(url: str, work_path: str, headers: dict = None):
+    """Probe a direct download link using HTTP Range requests"""
+    timeout = aiohttp.ClientTimeout(total=PROBE_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(headers=headers or {}, timeout=timeout) as session:
+            async def read_range(start, length):
+                rng = {"Range": f"bytes={start}-{start + length - 1}"}
+                async with session.get(url, headers=rng, allow_redirects=True) as resp:
+                    if resp.status != 206:
+                        raise ValueError("Server does not support range requests")
+                    total = int(resp.headers.get("Content-Range", "*/0").rsplit("/", 1)[-1] or 0)
+                    return await resp.read(), total
+
+            async def read(start, length):
+                return (await read_range(start, length))[0]
+
+            head, file_size = await read_range(0, PROBE_HEAD_CHUNKS * TG_CHUNK_SIZE)
+            if not file_size:
+                return None
+            parts = [(0, head)]
+            if head[4:8] == b"ftyp":
+                parts = await _with_moov(read, head, file_size)
+                if parts is None:
+                    LOGGER.info(f"moov of {url} not captured, skipping the remote probe")
+                    return None
+            return await _probe_sparse(parts, file_size, work_path)
+    except Exception as e:
+        LOGGER.warning(f"Remote probe failed for {url}: {e}")
+        return None
+
+
+async def check_merge_input(c, message, user_id: int, pending=()):
+    """
+    Probe a video about to be queued for merging and compare it with the
+    videos already queued (plus `pending` ids accepted in the same batch).
+    Returns a short rejection reason when the file must be refused, else
+    None.  Files that differ from the queue are accepted (the merge planner
+    re-encodes them); only the mismatch is logged.  Probe results are kept
+    in `probeDB`.
+    """
+    info = await probe_tg_media(c, message, f"downloads/{user_id}/probe_{message.id}.bin")
+    if info is None:
+        # Could not fetch bytes; don't block the user on our own failure
+        return None
+    if not info.get("valid"):
+        return "file looks corrupted or has no video stream"
+
+    queued = queueDB.get(user_id, {}).get("videos", []) + list(pending)
+    user_probes = probeDB.setdefault(user_id, {})
+    for stale in [mid for mid in user_probes if mid not in queued]:
+        del user_probes[stale]
+    reference = next((user_probes[mid] for mid in queued if mid in user_probes), None)
+    user_probes[message.id] = info
+    if reference is None:
+        return None
+    mismatches = concat_mismatches(reference, info)
+    if mismatches:
+        LOGGER.info(f"Message {message.id} will need normalizing: {'; '.join(mismatches)}")
+    return None
+
+
+async def check_url_input(url: str, user_id: int, message_id: int):
+    """
+    Probe a queued direct link with Range requests before it is downloaded.
+    Returns a rejection reason for links that are clearly not a usable video,
+    else None (also when the server cannot be probed, e.g. no range support).
+    """
+    if "gofile.io" in url:
+        return None  # Needs the account token resolved by the downloader first
+    info = await probe_url(url, f"downloads/{user_id}/probe_{message_id}.bin")
+    if info is None:
+        return None
+    if not info.get("valid"):
+        return "link does not point to a readable video"
+    probeDB.setdefault(user_id, {})[message_id] = info
+    return None
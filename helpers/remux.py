@@ -0,0 +1,103 @@
+# helpers/remux.py - Container conversion with stream copy
+"""
+Convert between MKV and MP4 without re-encoding what the target container
+can hold.  Each stream is checked against the target: compatible streams
+are copied (with the bitstream filters / tags the muxer needs), text
+subtitles are converted to the target's subtitle format, and only streams
+the container cannot carry at all (e.g. DTS/TrueHD audio in MP4) are
+transcoded.  Bitmap subtitles are dropped for MP4, which has no place for
+them.
+"""
+import asyncio
+import os
+
+from __init__ import LOGGER
+from helpers.faststart import FASTSTART_FLAGS
+from helpers.media_probe import probe
+
+REMUX_TARGETS = ("mp4", "mkv")
+
+MP4_VIDEO = {"h264", "hevc", "av1", "vp9", "mpeg4", "mpeg2video", "mjpeg"}
+MP4_AUDIO = {"aac", "mp3", "ac3", "eac3", "opus", "flac", "alac"}
+TEXT_SUBTITLES = {"subrip", "ass", "ssa", "webvtt", "mov_text", "text"}
+
+FALLBACK_VIDEO = ["libx264", "-crf", "18", "-preset", "veryfast"]
+FALLBACK_AUDIO = ["aac", "-b:a", "256k"]
+
+
+def _stream_args(stream: dict, out_index: int, target: str, from_ts: bool = False):
+    """Codec arguments for one output stream, or None to drop the stream"""
+    kind = stream.get("codec_type")
+    codec = stream.get("codec_name")
+    if kind == "video":
+        if stream.get("disposition", {}).get("attached_pic"):
+            return [f"-c:v:{out_index}", "copy"] if target == "mkv" else None
+        if target == "mp4" and codec not in MP4_VIDEO:
+            return [f"-c:v:{out_index}"] + FALLBACK_VIDEO
+        args = [f"-c:v:{out_index}", "copy"]
+        if target == "mp4" and codec == "hevc":
+            args += [f"-tag:v:{out_index}", "hvc1"]  # Needed for inline playback
+        return args
+    if kind == "audio":
+        if target == "mp4" and codec not in MP4_AUDIO:
+            return [f"-c:a:{out_index}"] + FALLBACK_AUDIO
+        args = [f"-c:a:{out_index}", "copy"]
+        if target == "mp4" and codec == "aac" and from_ts:
+            args += [f"-bsf:a:{out_index}", "aac_adtstoasc"]  # ADTS headers -> MP4 config
+        return args
+    if kind == "subtitle":
+        if target == "mp4":
+            if codec not in TEXT_SUBTITLES:
+                return None
+            return [f"-c:s:{out_index}", "mov_text"]
+        return [f"-c:s:{out_index}", "srt" if codec == "mov_text" else "copy"]
+    if kind == "attachment" and target == "mkv":
+        return []
+    return None
+
+
+def remux_command(src: str, data: dict, target: str, dst: str, metadata: list = ()):
+    """ffmpeg command converting `src` to `target`; also returns what was transcoded/dropped"""
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-i", src]
+    codec_args, notes = [], []
+    counters = {"video": 0, "audio": 0, "subtitle": 0, "attachment": 0}
+    from_ts = data.get("format", {}).get("format_name", "").startswith("mpegts")
+    for stream in data.get("streams", []):
+        kind = stream.get("codec_type")
+        args = _stream_args(stream, counters.get(kind, 0), target, from_ts)
+        if args is None:
+            notes.append(f"dropped {kind} `{stream.get('codec_name')}`")
+            continue
+        if any(a in (FALLBACK_VIDEO[0], FALLBACK_AUDIO[0]) for a in args):
+            notes.append(f"transcoded {kind} `{stream.get('codec_name')}`")
+        cmd += ["-map", f"0:{stream['index']}"]
+        codec_args += args
+        counters[kind] = counters.get(kind, 0) + 1
+    cmd += codec_args
+    if target == "mp4":
+        cmd += FASTSTART_FLAGS
+    cmd += ["-map_metadata", "0", "-map_chapters", "0"] + list(metadata) + [dst]
+    return cmd, notes
+
+
+async def remux_container(src: str, target: str, dst: str, metadata: list = ()):
+    """
+    Convert `src` into the `target` container at `dst`.
+
+    returns: (output path or None, list of notes about transcoded/dropped streams)
+    """
+    data = await probe(src)
+    if data is None:
+        return None, ["input could not be read"]
+    cmd, notes = remux_command(src, data, target, dst, metadata)
+    LOGGER.info(cmd)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0 or not os.path.exists(dst):
+        LOGGER.error(f"Remux failed: {stderr.decode().strip()[-500:]}")
+        return None, notes
+    return dst, notes
@@ -0,0 +1,128 @@
+# helpers/settings_menus.py - Merge output settings shared by both callback handlers
+"""
+Transition length, tracks to keep and output tags are per-user settings of
+the merge/encode output.  bot.py's callback handler is the one the running
+client dispatches to; plugins/cb_handler.py builds its own settings menu.
+Both use the buttons and callbacks defined here.
+"""
+import asyncio
+
+from pyrogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+
+from __init__ import TRANSITION
+
+
+def transition_status(user_id: int) -> str:
+    transition = TRANSITION.get(user_id, 0)
+    return f"{transition}s crossfade" if transition else "Hard cut"
+
+
+def output_settings_rows(user) -> list:
+    """Keyboard rows for the output settings, placed in a settings menu"""
+    return [
+        *([[InlineKeyboardButton("🏷️ Output tags", callback_data="outtags_menu")]] if user.edit_metadata else []),
+        [InlineKeyboardButton(f"🎞️ Transition: {transition_status(user.user_id)}", callback_data="transition_toggle")],
+        [InlineKeyboardButton("🎚️ Tracks to keep", callback_data="tracks_menu"),
+         InlineKeyboardButton("🖼️ Preview sheet", callback_data="contact_sheet")],
+    ]
+
+
+def is_output_settings_callback(data: str) -> bool:
+    return data in ("transition_toggle", "tracks_menu", "outtags_menu") or data.startswith(("trk_", "outtags_"))
+
+
+async def show_output_tags_menu(cb: CallbackQuery, tags: dict):
+    """Title/author/audio-track tags applied to the next merge or encode"""
+    from helpers.output_tags import TAG_FIELDS
+    rows = [[InlineKeyboardButton(label, callback_data=f"outtags_{field}")]
+            for field, label in TAG_FIELDS.items()]
+    rows.append([InlineKeyboardButton("🗑️ Clear", callback_data="outtags_clear"),
+                 InlineKeyboardButton("🔙 Back", callback_data="settings")])
+    lines = "\n".join(f"• {label}: `{tags.get(field) or '—'}`" for field, label in TAG_FIELDS.items())
+    text = f"""🏷️ **OUTPUT TAGS**
+
+{lines}
+
+💡 Written while the next merge/encode output is created, no separate /metadata pass needed"""
+    await cb.message.edit_text(text, reply_markup=InlineKeyboardMarkup(rows))
+
+
+async def show_tracks_menu(cb: CallbackQuery, prefs: dict, languages: dict):
+    """Language picker built from the probes of the queued videos"""
+    rows = []
+    for kind, icon in (("audio", "🔊"), ("subtitle", "💬")):
+        buttons = [
+            InlineKeyboardButton(
+                f"{icon} {lang} {'✅' if lang in prefs[kind] else '▫️'}",
+                callback_data=f"trk_{kind}_{lang}",
+            )
+            for lang in languages[kind]
+        ]
+        rows += [buttons[i:i + 3] for i in range(0, len(buttons), 3)]
+    rows.append([InlineKeyboardButton("♻️ Keep all", callback_data="trk_reset"),
+                 InlineKeyboardButton("🔙 Back", callback_data="settings")])
+
+    def describe(kind):
+        return ", ".join(prefs[kind]) if prefs[kind] else "all"
+
+    text = f"""🎚️ **TRACKS TO KEEP**
+
+🔊 **Audio:** `{describe("audio")}`
+💬 **Subtitles:** `{describe("subtitle")}`
+
+Tap a language to keep it; order of taps is the track order.
+Unselected dubs and subtitles are left out of the output."""
+    if not languages["audio"] and not languages["subtitle"]:
+        text += "\n\n⚠️ No track info yet, send your videos first."
+    await cb.message.edit_text(text, reply_markup=InlineKeyboardMarkup(rows))
+
+
+async def handle_output_settings(c, cb: CallbackQuery, data: str, user_id: int) -> bool:
+    """
+    Handle a transition / tracks / output-tags callback.
+
+    returns: True when the caller should redraw its settings menu (the
+    transition toggle), False when a submenu was shown instead.
+    """
+    if data == "transition_toggle":
+        # Cycle crossfade length between merged videos
+        from helpers.transitions import TRANSITION_CHOICES
+        current = TRANSITION.get(user_id, 0)
+        nxt = TRANSITION_CHOICES[(TRANSITION_CHOICES.index(current) + 1) % len(TRANSITION_CHOICES)] \
+            if current in TRANSITION_CHOICES else 0
+        TRANSITION[user_id] = nxt
+        await cb.answer(f"🎞️ Transition: {transition_status(user_id)}", show_alert=False)
+        return True
+
+    if data == "tracks_menu" or data.startswith("trk_"):
+        # Pick which audio/subtitle languages end up in the output
+        from helpers.stream_select import get_prefs, queued_languages, toggle_language
+        if data == "trk_reset":
+            get_prefs(user_id).update({"audio": [], "subtitle": []})
+            await cb.answer("♻️ Keeping all tracks", show_alert=False)
+        elif data.startswith("trk_"):
+            _, kind, lang = data.split("_", 2)
+            kept = toggle_language(user_id, kind, lang)
+            await cb.answer(f"{'✅ Keeping' if kept else '▫️ Not keeping'} {kind} `{lang}`", show_alert=False)
+        await show_tracks_menu(cb, get_prefs(user_id), queued_languages(user_id))
+        return False
+
+    # Tags written into the next merge/encode output
+    from helpers.output_tags import TAG_FIELDS, clear_tags, pending_tags, set_tag
+    if data == "outtags_clear":
+        clear_tags(user_id)
+        await cb.answer("🗑️ Output tags cleared", show_alert=False)
+    elif data != "outtags_menu":
+        field = data.split("_", 1)[1]
+        await cb.message.edit_text(
+            f"{TAG_FIELDS[field]}\n\n📝 Send the value for your next output\n\n⚠️ Send /cancel to cancel"
+        )
+        try:
+            response = await c.listen(cb.message.chat.id, timeout=60)
+            if response.text and not response.text.startswith("/cancel"):
+                set_tag(user_id, field, response.text)
+                await response.reply_text(f"✅ Saved: `{response.text}`")
+        except asyncio.TimeoutError:
+            await cb.message.reply_text("⏰ Timeout! Please try again.")
+    await show_output_tags_menu(cb, pending_tags(user_id, True))
+    return False
@@ -0,0 +1,130 @@
+# helpers/smart_cut.py - Frame-accurate trimming without re-encoding the whole range
+"""
+A cut from `start` to `end` is split at the keyframes inside the range:
+
+    start ... k_first | k_first ... k_last | k_last ... end
+      re-encoded          stream copy         re-encoded
+
+Only the partial GOPs at both ends are encoded, with the source codec,
+profile, level, resolution and pixel format, so the three pieces can be
+joined with the concat demuxer and `-c copy`.  Pieces are written as
+MPEG-TS for H.264/HEVC and the encoder repeats its SPS/PPS at every
+keyframe.  An MP4 keeps a single avcC/hvcC for the whole file, which would
+not describe the re-encoded ends, so such cuts are written as MKV instead.
+Keyframes come from helpers/keyframe_index.py.
+"""
+import asyncio
+import os
+import shutil
+
+from __init__ import LOGGER
+from helpers.keyframe_index import keyframes_between
+from helpers.faststart import MP4_EXTENSIONS
+from helpers.media_probe import probe, streams_of
+from helpers.merge_planner import (
+    ANNEXB_CODECS,
+    AUDIO_ENCODERS,
+    bitstream_args,
+    encoder_args,
+    write_concat_list,
+)
+from helpers.remote_probe import probe_file
+
+KEYFRAME_TOLERANCE = 0.01  # seconds; a cut this close to a keyframe needs no head/tail encode
+
+
+async def _run(cmd: list) -> bool:
+    LOGGER.info(cmd)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.error(stderr.decode().strip()[-500:])
+    return process.returncode == 0
+
+
+def _encode_command(src: str, start: float, end: float, info: dict, dst: str,
+                    bitstream: list = ()) -> list:
+    """Re-encode [start, end) of `src` with parameters matching the source"""
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-ss", f"{start:.6f}", "-i", src,
+           "-t", f"{end - start:.6f}", "-map", "0:v:0", "-map", "0:a?"]
+    cmd += encoder_args(info.get("video_codec"), bitstream)
+    if info.get("pix_fmt"):
+        cmd += ["-pix_fmt", info["pix_fmt"]]
+    if info.get("fps"):
+        cmd += ["-r", str(info["fps"])]
+    if info.get("audio_codec"):
+        cmd += ["-c:a", AUDIO_ENCODERS.get(info["audio_codec"], "aac")]
+        if info.get("sample_rate"):
+            cmd += ["-ar", str(info["sample_rate"])]
+        if info.get("channels"):
+            cmd += ["-ac", str(info["channels"])]
+    return cmd + [dst]
+
+
+def _copy_command(src: str, start: float, end: float, dst: str) -> list:
+    """Stream-copy the whole GOPs between two keyframes"""
+    return ["ffmpeg", "-hide_banner", "-y", "-ss", f"{start:.6f}", "-i", src,
+            "-t", f"{end - start:.6f}", "-map", "0:v:0", "-map", "0:a?",
+            "-c", "copy", "-avoid_negative_ts", "make_zero", dst]
+
+
+async def smart_cut(src: str, start: float, end: float, out_path: str, work_dir: str):
+    """
+    Cut [start, end] of `src` into `out_path`, copying every full GOP and
+    encoding only the boundary pieces.  Returns the written path (an MP4
+    name becomes .mkv when H.264/HEVC ends were re-encoded) or None.
+    """
+    info = await probe_file(src)
+    if info is None or not info.get("valid"):
+        return None
+    video = next(iter(streams_of(await probe(src), "video")), {})
+    bitstream = bitstream_args(info, video)
+    end = min(end, info["duration"] or end)
+    if end <= start:
+        return None
+    keyframes = await keyframes_between(src, start, end)
+    ext = "ts" if info.get("video_codec") in ANNEXB_CODECS else "mkv"
+
+    if len(keyframes) < 2:
+        # No full GOP inside the range: a plain re-encode is as cheap as it gets
+        return out_path if await _run(_encode_command(src, start, end, info, out_path)) else None
+
+    first, last = keyframes[0], keyframes[-1]
+    pieces = []
+    if first - start > KEYFRAME_TOLERANCE:
+        pieces.append(("encode", start, first))
+    pieces.append(("copy", first, last))
+    if end - last > KEYFRAME_TOLERANCE:
+        pieces.append(("encode", last, end))
+    LOGGER.info(f"Smart cut {src}: {pieces}")
+    root, out_ext = os.path.splitext(out_path)
+    if (ext == "ts" and len(pieces) > 1
+            and out_ext.lstrip(".").lower() in MP4_EXTENSIONS):
+        out_path = root + ".mkv"
+    os.makedirs(work_dir, exist_ok=True)
+
+    paths = []
+    commands = []
+    for n, (kind, a, b) in enumerate(pieces):
+        piece_path = os.path.join(work_dir, f"piece_{n}.{ext}")
+        paths.append(os.path.abspath(piece_path))
+        if kind == "copy":
+            commands.append(_copy_command(src, a, b, piece_path))
+        else:
+            commands.append(_encode_command(src, a, b, info, piece_path, bitstream))
+    try:
+        if not all(await asyncio.gather(*(_run(cmd) for cmd in commands))):
+            return None
+        list_file = os.path.join(work_dir, "pieces.txt")
+        write_concat_list(list_file, paths)
+        joined = await _run([
+            "ffmpeg", "-hide_banner", "-y", "-f", "concat", "-safe", "0", "-i", list_file,
+            "-map", "0", "-c", "copy", out_path,
+        ])
+        return out_path if joined and os.path.exists(out_path) else None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
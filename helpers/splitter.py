@@ -0,0 +1,96 @@
+# helpers/splitter.py - Split outputs at keyframes to fit Telegram upload limits
+"""
+Instead of refusing a result that is larger than the Telegram limit, cut it
+with stream copy at keyframes into self-contained parts below the limit.
+Cut points come from the keyframe index (byte offsets when the container
+reports them, else an even bitrate estimate), so no frame is re-encoded.
+"""
+import asyncio
+import os
+
+from config import Config
+from __init__ import LOGGER
+from helpers.faststart import FASTSTART_FLAGS, is_mp4
+from helpers.keyframe_index import get_index
+from helpers.media_probe import media_info
+
+TG_UPLOAD_LIMIT = 2044723200
+TG_PREMIUM_UPLOAD_LIMIT = 4241280205
+SPLIT_MARGIN = 0.95  # Aim below the limit; container overhead varies per part
+SPLIT_ATTEMPTS = 3
+
+
+def upload_limit() -> int:
+    """Largest file the bot may upload to Telegram"""
+    return TG_PREMIUM_UPLOAD_LIMIT if Config.IS_PREMIUM else TG_UPLOAD_LIMIT
+
+
+def _cut_points(keyframes: list, file_size: int, duration: float, target: int) -> list:
+    """Keyframe timestamps where a new part starts (first part starts at 0)"""
+    bytes_per_sec = file_size / duration if duration else 0
+    cuts = []
+    part_start_t, part_start_pos = 0.0, 0
+    previous = None
+    for t, pos in keyframes:
+        if t <= part_start_t:
+            continue
+        if pos < 0:
+            pos = int(t * bytes_per_sec)
+        if pos - part_start_pos > target and previous is not None:
+            cuts.append(previous[0])
+            part_start_t, part_start_pos = previous
+        previous = (t, pos)
+    return cuts
+
+
+async def _copy_part(src: str, start: float, end, dst: str) -> bool:
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-ss", f"{start:.6f}", "-i", src]
+    if end is not None:
+        cmd += ["-t", f"{end - start:.6f}"]
+    cmd += ["-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero"]
+    if is_mp4(dst):
+        cmd += FASTSTART_FLAGS
+    cmd.append(dst)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.error(f"Splitting {src} failed: {stderr.decode().strip()[-500:]}")
+    return process.returncode == 0 and os.path.exists(dst)
+
+
+async def split_for_upload(path: str, limit: int = None):
+    """
+    Split `path` into parts smaller than `limit` bytes.
+
+    returns: list of part paths in order (just `[path]` when it already
+    fits), or None if it could not be split.
+    """
+    limit = limit or upload_limit()
+    file_size = os.path.getsize(path)
+    if file_size <= limit:
+        return [path]
+    info = await media_info(path)
+    index = await get_index(path)
+    if not info or not index or not index["keyframes"]:
+        return None
+    base, ext = os.path.splitext(path)
+    margin = SPLIT_MARGIN
+    for _ in range(SPLIT_ATTEMPTS):
+        cuts = _cut_points(index["keyframes"], file_size, info["duration"], int(limit * margin))
+        bounds = list(zip([0.0] + cuts, cuts + [None]))
+        parts = [f"{base}.part{n + 1:02d}{ext}" for n in range(len(bounds))]
+        LOGGER.info(f"Splitting {path} into {len(parts)} parts at {cuts}")
+        ok = await asyncio.gather(*(
+            _copy_part(path, start, end, dst) for (start, end), dst in zip(bounds, parts)
+        ))
+        if all(ok) and all(os.path.getsize(p) <= limit for p in parts):
+            return parts
+        for p in parts:
+            if os.path.exists(p):
+                os.remove(p)
+        margin -= 0.1
+    return None
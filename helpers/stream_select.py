@@ -0,0 +1,98 @@
+# helpers/stream_select.py - Keep only the tracks a user wants in the output
+"""
+Merged files often carry many dubs and subtitle tracks nobody asked for,
+and every extra track is paid for in upload bytes.  Per user, TRACK_PREFS
+holds the audio / subtitle languages to keep, in preference order, and
+codecs to skip when another track of the same language exists.  The mux
+helpers turn that into an ordered `-map` list.
+
+An empty language list means "keep everything" for that kind.  When no
+audio track matches, the first one is kept so the output is never silent.
+"""
+from __init__ import TRACK_PREFS, probeDB, queueDB
+
+# Lossless / oversized audio codecs skipped when a lighter track of the same
+# language exists
+HEAVY_AUDIO_CODECS = {"truehd", "dts", "pcm_s16le", "pcm_s24le", "flac"}
+
+
+def get_prefs(user_id: int) -> dict:
+    return TRACK_PREFS.setdefault(user_id, {"audio": [], "subtitle": []})
+
+
+def toggle_language(user_id: int, kind: str, lang: str) -> bool:
+    """Add or remove `lang` for `kind`; returns True if it is now kept"""
+    langs = get_prefs(user_id)[kind]
+    if lang in langs:
+        langs.remove(lang)
+        return False
+    langs.append(lang)
+    return True
+
+
+def queued_languages(user_id: int) -> dict:
+    """Audio and subtitle languages seen in the probes of the user's queued videos"""
+    found = {"audio": [], "subtitle": []}
+    user_probes = probeDB.get(user_id, {})
+    for mid in queueDB.get(user_id, {}).get("videos", []):
+        info = user_probes.get(mid) or {}
+        for kind in found:
+            for lang in info.get(f"{kind}_langs", []):
+                if lang not in found[kind]:
+                    found[kind].append(lang)
+    return found
+
+
+def _language(stream: dict) -> str:
+    return (stream.get("tags") or {}).get("language", "und").lower()
+
+
+def _pick(streams: list, langs: list, kind: str) -> list:
+    if not langs:
+        return streams
+    chosen = []
+    for lang in langs:
+        same = [s for s in streams if _language(s) == lang]
+        if kind == "audio":
+            light = [s for s in same if s.get("codec_name") not in HEAVY_AUDIO_CODECS]
+            same = light or same
+        chosen += same
+    if not chosen and kind == "audio" and streams:
+        chosen = streams[:1]
+    return chosen
+
+
+def select_streams(data: dict, user_id: int) -> dict:
+    """
+    Streams of probe JSON `data` to keep, in output order:
+    `{"video": [...], "audio": [...], "subtitle": [...]}`.
+    """
+    prefs = get_prefs(user_id)
+    streams = (data or {}).get("streams", [])
+    by_kind = {
+        kind: [s for s in streams if s.get("codec_type") == kind]
+        for kind in ("video", "audio", "subtitle")
+    }
+    return {
+        "video": by_kind["video"],
+        "audio": _pick(by_kind["audio"], prefs["audio"], "audio"),
+        "subtitle": _pick(by_kind["subtitle"], prefs["subtitle"], "subtitle"),
+    }
+
+
+def selection_maps(data: dict, user_id: int, input_index: int = 0, kinds=("video", "audio", "subtitle")) -> list:
+    """`-map` arguments for the selected streams of input `input_index`"""
+    if data is None:
+        fallback = {"video": "v", "audio": "a?", "subtitle": "s?"}
+        return [arg for kind in kinds for arg in ("-map", f"{input_index}:{fallback[kind]}")]
+    selected = select_streams(data, user_id)
+    maps = []
+    for kind in kinds:
+        for s in selected[kind]:
+            maps += ["-map", f"{input_index}:{s['index']}"]
+    return maps
+
+
+def is_filtering(user_id: int) -> bool:
+    prefs = get_prefs(user_id)
+    return bool(prefs["audio"] or prefs["subtitle"])
@@ -0,0 +1,379 @@
+# helpers/tag_writer.py - Edit title / author tags without remuxing
+"""
+Changing a title or author only touches a few hundred bytes of the file,
+so `write_tags()` patches those bytes in place instead of running
+`ffmpeg -c copy` over the whole file:
+
+* Matroska: the Segment `Info` element (Title) and the global `Tags`
+  element (ARTIST) are rebuilt and written over themselves, taking or
+  giving back room from a following `Void` element.  A `Tags` element at
+  the very end of the file may simply grow.  CRC-32 children are updated.
+* MP4: `moov/udta/meta/ilst` gets `©nam` / `©ART` items.  The new `moov`
+  is written over the old one, using a following top-level `free` atom as
+  padding, or anywhere when `moov` is the last atom.  Only `moov`
+  changes size, so chunk offsets into `mdat` stay valid.
+
+When the new tags do not fit, nothing is written and the caller falls
+back to a remux.
+"""
+import asyncio
+import os
+import struct
+import zlib
+
+from __init__ import LOGGER
+
+# Matroska element ids
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TAGS = 0x1254C367
+VOID = 0xEC
+CRC32 = 0xBF
+TITLE = 0x7BA9
+TAG = 0x7373
+TARGETS = 0x63C0
+SIMPLE_TAG = 0x67C8
+TAG_NAME = 0x45A3
+TAG_STRING = 0x4487
+TARGET_UIDS = {0x63C5, 0x63C9, 0x63C4, 0x63C6}
+
+MP4_TITLE = b"\xa9nam"
+MP4_ARTIST = b"\xa9ART"
+
+
+# --- Matroska ---------------------------------------------------------------
+
+def _vint_length(first: int) -> int:
+    if first == 0:
+        raise ValueError("invalid EBML variable-length integer")
+    return 9 - first.bit_length()
+
+
+def read_element_id(buf, pos: int):
+    length = _vint_length(buf[pos])
+    return int.from_bytes(buf[pos:pos + length], "big"), length
+
+
+def read_element_size(buf, pos: int):
+    """(value or None if unknown, width)"""
+    length = _vint_length(buf[pos])
+    value = int.from_bytes(buf[pos:pos + length], "big") & ((1 << (7 * length)) - 1)
+    if value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def _encode_size(value: int, width: int = 0) -> bytes:
+    if not width:
+        width = 1
+        while value >= (1 << (7 * width)) - 1:
+            width += 1
+    if width > 8 or value >= (1 << (7 * width)) - 1:
+        raise ValueError("size does not fit")
+    return (value | (1 << (7 * width))).to_bytes(width, "big")
+
+
+def _element(element_id: int, body: bytes) -> bytes:
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + _encode_size(len(body)) + body
+
+
+def _void(total: int) -> bytes:
+    """A Void element occupying exactly `total` (>= 2) bytes"""
+    width = 1 if total - 2 < 127 else 8
+    return bytes([VOID]) + _encode_size(total - 1 - width, width) + bytes(total - 1 - width)
+
+
+def ebml_children(body: bytes) -> list:
+    """[(id, start, end, data_start), ...] of the elements in `body`"""
+    out, pos = [], 0
+    while pos < len(body):
+        element_id, id_len = read_element_id(body, pos)
+        size, size_len = read_element_size(body, pos + id_len)
+        if size is None:
+            raise ValueError("unknown-size child")
+        data = pos + id_len + size_len
+        out.append((element_id, pos, data + size, data))
+        pos = data + size
+    return out
+
+
+def _with_crc(body: bytes) -> bytes:
+    """Recompute a leading CRC-32 child over the rest of `body`"""
+    kids = ebml_children(body)
+    if kids and kids[0][0] == CRC32:
+        rest = body[kids[0][2]:]
+        return _element(CRC32, struct.pack("<I", zlib.crc32(rest) & 0xFFFFFFFF)) + rest
+    return body
+
+
+def _set_child(body: bytes, child_id: int, value: bytes) -> bytes:
+    """Replace the first `child_id` child of `body` with `value`, or append it"""
+    for element_id, start, end, _ in ebml_children(body):
+        if element_id == child_id:
+            return body[:start] + _element(child_id, value) + body[end:]
+    return body + _element(child_id, value)
+
+
+def _set_artist(tags_body: bytes, author: str) -> bytes:
+    """Set ARTIST in the global Tag (one with no target UIDs), creating it if needed"""
+    simple = _element(TAG_NAME, b"ARTIST") + _element(TAG_STRING, author.encode())
+    for tag_id, start, end, data in ebml_children(tags_body):
+        if tag_id != TAG:
+            continue
+        tag_body = tags_body[data:end]
+        kids = ebml_children(tag_body)
+        targets = [k for k in kids if k[0] == TARGETS]
+        if targets and any(t[0] in TARGET_UIDS for t in ebml_children(tag_body[targets[0][3]:targets[0][2]])):
+            continue
+        for kid_id, k_start, k_end, k_data in kids:
+            if kid_id != SIMPLE_TAG:
+                continue
+            names = [n for n in ebml_children(tag_body[k_data:k_end]) if n[0] == TAG_NAME]
+            if names and tag_body[k_data:k_end][names[0][3]:names[0][2]].upper() == b"ARTIST":
+                new_simple = _set_child(tag_body[k_data:k_end], TAG_STRING, author.encode())
+                tag_body = tag_body[:k_start] + _element(SIMPLE_TAG, new_simple) + tag_body[k_end:]
+                break
+        else:
+            tag_body += _element(SIMPLE_TAG, simple)
+        return tags_body[:start] + _element(TAG, _with_crc(tag_body)) + tags_body[end:]
+    return tags_body + _element(TAG, _element(TARGETS, b"") + _element(SIMPLE_TAG, simple))
+
+
+def _mkv_layout(f, file_size: int):
+    """Segment (size_pos, size_width, size, data_start) and its top-level children"""
+    f.seek(0)
+    head = f.read(64)
+    header_id, id_len = read_element_id(head, 0)
+    if header_id != EBML_HEADER:
+        raise ValueError("not Matroska")
+    size, size_len = read_element_size(head, id_len)
+    pos = id_len + size_len + size
+    f.seek(pos)
+    head = f.read(16)
+    seg_id, id_len = read_element_id(head, 0)
+    if seg_id != SEGMENT:
+        raise ValueError("no Segment")
+    seg_size, size_len = read_element_size(head, id_len)
+    segment = (pos + id_len, size_len, seg_size, pos + id_len + size_len)
+    end = file_size if seg_size is None else min(file_size, segment[3] + seg_size)
+
+    elements, pos = [], segment[3]
+    while pos < end:
+        f.seek(pos)
+        head = f.read(16)
+        element_id, id_len = read_element_id(head, 0)
+        size, size_len = read_element_size(head, id_len)
+        if size is None:
+            break  # Live-written cluster; nothing we edit comes after it
+        elements.append((element_id, pos, pos + id_len + size_len, pos + id_len + size_len + size))
+        pos += id_len + size_len + size
+    return segment, elements
+
+
+def _fit(elements: list, index: int, new: bytes, file_size: int, segment):
+    """Writes that put `new` where elements[index] is, or None if it doesn't fit"""
+    _, start, _, end = elements[index]
+    room = end - start
+    following = elements[index + 1] if index + 1 < len(elements) else None
+    if following and following[0] == VOID:
+        room = following[3] - start
+    if len(new) == room:
+        return [(start, new)], None, 0
+    if room - len(new) >= 2:
+        return [(start, new + _void(room - len(new)))], None, 0
+    if following is None and end == file_size:
+        return [(start, new)], start + len(new), len(new) - (end - start)
+    return None
+
+
+def _mkv_write(f, path: str, title, author) -> bool:
+    file_size = os.path.getsize(path)
+    segment, elements = _mkv_layout(f, file_size)
+    ids = [e[0] for e in elements]
+    plans = []
+    for element_id, wanted in ((INFO, title), (TAGS, author)):
+        if wanted is None:
+            continue
+        if element_id not in ids:
+            return False
+        index = ids.index(element_id)
+        _, start, data, end = elements[index]
+        f.seek(data)
+        body = f.read(end - data)
+        if element_id == INFO:
+            body = _set_child(body, TITLE, wanted.encode())
+        else:
+            body = _set_artist(body, wanted)
+        fitted = _fit(elements, index, _element(element_id, _with_crc(body)), file_size, segment)
+        if fitted is None:
+            return False
+        plans.append(fitted)
+
+    size_pos, size_width, seg_size, _ = segment
+    growth = sum(p[2] for p in plans)
+    if growth and seg_size is not None:
+        try:
+            plans.append(([(size_pos, _encode_size(seg_size + growth, size_width))], None, 0))
+        except ValueError:
+            return False
+    for writes, truncate_at, _ in plans:
+        for pos, data in writes:
+            f.seek(pos)
+            f.write(data)
+        if truncate_at is not None:
+            f.truncate(truncate_at)
+    return True
+
+
+# --- MP4 --------------------------------------------------------------------
+
+def _atom(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def mp4_atoms(buf: bytes) -> list:
+    """[(kind, start, end, data_start), ...] of the atoms in `buf`"""
+    out, pos = [], 0
+    while pos + 8 <= len(buf):
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = len(buf) - pos
+        if size < header or pos + size > len(buf):
+            raise ValueError("malformed atom")
+        out.append((kind, pos, pos + size, pos + header))
+        pos += size
+    return out
+
+
+def _replace_atom(buf: bytes, kind: bytes, new_atom: bytes, drop=(b"free",)) -> bytes:
+    """Children of `buf` with the first `kind` replaced (or appended) and padding dropped"""
+    out, done = b"", False
+    for child, start, end, _ in mp4_atoms(buf):
+        if child in drop:
+            continue
+        if child == kind and not done:
+            out += new_atom
+            done = True
+        else:
+            out += buf[start:end]
+    return out if done else out + new_atom
+
+
+def _child_body(buf: bytes, kind: bytes) -> bytes:
+    for child, _, end, data in mp4_atoms(buf):
+        if child == kind:
+            return buf[data:end]
+    return b""
+
+
+def _ilst_item(kind: bytes, text: str) -> bytes:
+    value = text.encode()
+    return _atom(kind, struct.pack(">I4sII", 16 + len(value), b"data", 1, 0) + value)
+
+
+def _new_moov_body(moov_body: bytes, title, author) -> bytes:
+    udta = _child_body(moov_body, b"udta")
+    meta = _child_body(udta, b"meta")
+    version_flags, meta_children = (meta[:4], meta[4:]) if meta else (b"\0" * 4, b"")
+    if b"hdlr" not in [a[0] for a in mp4_atoms(meta_children)]:
+        hdlr = _atom(b"hdlr", b"\0" * 8 + b"mdirappl" + b"\0" * 9)
+        meta_children = hdlr + meta_children
+    ilst = _child_body(meta_children, b"ilst")
+    for kind, text in ((MP4_TITLE, title), (MP4_ARTIST, author)):
+        if text is not None:
+            ilst = _replace_atom(ilst, kind, _ilst_item(kind, text), drop=())
+    meta_children = _replace_atom(meta_children, b"ilst", _atom(b"ilst", ilst))
+    udta = _replace_atom(udta, b"meta", _atom(b"meta", version_flags + meta_children))
+    return _replace_atom(moov_body, b"udta", _atom(b"udta", udta), drop=())
+
+
+def _mp4_write(f, path: str, title, author) -> bool:
+    file_size = os.path.getsize(path)
+    top, pos = [], 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size, header = struct.unpack(">Q", f.read(8))[0], 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header:
+            raise ValueError("malformed atom")
+        top.append((kind, pos, pos + size, pos + header))
+        pos += size
+    kinds = [a[0] for a in top]
+    if b"moov" not in kinds:
+        return False
+    index = kinds.index(b"moov")
+    _, start, end, data = top[index]
+    f.seek(data)
+    body = _new_moov_body(f.read(end - data), title, author)
+    if len(body) + 8 > 0xFFFFFFFF:
+        return False
+
+    room = end - start
+    following = top[index + 1] if index + 1 < len(top) else None
+    if following and following[0] in (b"free", b"skip"):
+        room = following[2] - start
+    new = _atom(b"moov", body)
+    truncate_at = None
+    if room - len(new) >= 8 or room == len(new):
+        if room > len(new):
+            new += _atom(b"free", bytes(room - len(new) - 8))
+    elif following is None:
+        truncate_at = start + len(new)
+    else:
+        return False
+    f.seek(start)
+    f.write(new)
+    if truncate_at is not None:
+        f.truncate(truncate_at)
+    return True
+
+
+# --- Public -----------------------------------------------------------------
+
+def tag_container(path: str):
+    """"matroska" or "mp4" from the file's magic bytes, else None"""
+    with open(path, "rb") as f:
+        magic = f.read(12)
+    if magic[:4] == EBML_HEADER.to_bytes(4, "big"):
+        return "matroska"
+    if magic[4:8] == b"ftyp":
+        return "mp4"
+    return None
+
+
+def _write(path: str, title, author) -> bool:
+    container = tag_container(path)
+    if container is None:
+        return False
+    with open(path, "r+b") as f:
+        if container == "matroska":
+            return _mkv_write(f, path, title, author)
+        return _mp4_write(f, path, title, author)
+
+
+async def write_tags(path: str, title: str = None, author: str = None) -> bool:
+    """
+    Set the container title / author of `path` in place.
+
+    :return: True if the file was updated, False if the caller has to remux.
+    """
+    if title is None and author is None:
+        return True
+    loop = asyncio.get_running_loop()
+    try:
+        written = await loop.run_in_executor(None, _write, path, title, author)
+    except (OSError, ValueError, IndexError, struct.error) as e:
+        LOGGER.warning(f"In-place tag edit failed for {path}: {e}")
+        return False
+    if written:
+        LOGGER.info(f"Tags of {path} updated in place")
+    return written
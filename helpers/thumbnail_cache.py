@@ -0,0 +1,88 @@
+# helpers/thumbnail_cache.py - Custom thumbnails prepared once, reused by every job
+"""
+Telegram wants video thumbnails as baseline JPEG, at most 320 px on the
+long side and under 200 KB.  The user's photo is downloaded and converted
+once when it is saved, and kept under THUMB_CACHE_DIR keyed by its file_id;
+merge and encode jobs just point at that file.  A job that finds no cached
+copy (e.g. after a redeploy wiped the disk) rebuilds it the same way.
+"""
+import asyncio
+import os
+import re
+
+from PIL import Image
+
+from __init__ import LOGGER
+
+THUMB_CACHE_DIR = "thumbs"
+THUMB_MAX_SIDE = 320
+THUMB_MAX_BYTES = 200 * 1024
+JPEG_QUALITIES = (90, 80, 70, 60, 50, 40)
+
+
+def _cache_path(user_id: int, file_id: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_-]", "_", file_id)
+    return os.path.join(THUMB_CACHE_DIR, str(user_id), f"{safe}.jpg")
+
+
+def prepare_thumbnail(src: str, dst: str):
+    """Resize `src` to fit 320x320 and save it as a baseline JPEG under 200 KB"""
+    with Image.open(src) as img:
+        img = img.convert("RGB")
+        img.thumbnail((THUMB_MAX_SIDE, THUMB_MAX_SIDE))
+        for quality in JPEG_QUALITIES:
+            img.save(dst, "JPEG", quality=quality, optimize=True, progressive=False)
+            if os.path.getsize(dst) <= THUMB_MAX_BYTES:
+                break
+
+
+def discard_thumbnail(path: str):
+    """Delete a job's generated thumbnail; cached custom thumbnails are kept"""
+    if not path or not os.path.exists(path):
+        return
+    cache_root = os.path.realpath(THUMB_CACHE_DIR) + os.sep
+    if os.path.realpath(path).startswith(cache_root):
+        return
+    os.remove(path)
+
+
+async def cache_thumbnail(c, user_id: int, file_id: str):
+    """Path of the prepared thumbnail for `file_id`, downloading it on a cache miss"""
+    path = _cache_path(user_id, file_id)
+    if os.path.exists(path):
+        return path
+    user_dir = os.path.dirname(path)
+    os.makedirs(user_dir, exist_ok=True)
+    try:
+        raw = await c.download_media(message=file_id, file_name=f"{path}.src")
+        await asyncio.get_running_loop().run_in_executor(None, prepare_thumbnail, raw, path)
+        os.remove(raw)
+    except Exception as e:
+        LOGGER.warning(f"Could not prepare thumbnail for {user_id}: {e}")
+        return None
+    # Only the current thumbnail is kept per user
+    for name in os.listdir(user_dir):
+        if os.path.join(user_dir, name) != path:
+            os.remove(os.path.join(user_dir, name))
+    return path
+
+
+async def job_thumbnail(c, user_id: int, thumb_id, video_path: str, at: float, shot: str = None):
+    """
+    The user's cached thumbnail, else a prepared frame of `video_path` at `at`
+    seconds.  `shot` is a frame the job already extracted, used instead of
+    seeking into the video again.
+    """
+    from helpers.ffmpeg_helper import take_screen_shot
+
+    if thumb_id:
+        path = await cache_thumbnail(c, user_id, str(thumb_id))
+        if path:
+            return path
+    if shot is None or not os.path.exists(shot):
+        LOGGER.info("Generating thumb")
+        shot = await take_screen_shot(video_path, os.path.dirname(video_path), at)
+    if shot is None or not os.path.exists(shot):
+        return None
+    await asyncio.get_running_loop().run_in_executor(None, prepare_thumbnail, shot, shot)
+    return shot
@@ -0,0 +1,118 @@
+# helpers/transitions.py - Crossfade merges that only re-encode the joins
+"""
+A crossfade needs decoded frames only where two videos overlap.  For every
+join the tail of video A (from its last keyframe before the fade) and the
+head of video B (up to its first keyframe after the fade) are re-encoded
+through `xfade`/`acrossfade` with the inputs' own codec parameters; the
+bodies in between are stream-copied.  The pieces are then joined with the
+usual copy concat, so a transition merge costs little more than a plain one.
+Every piece carries the video and the first audio track only, so body and
+fade pieces share one stream layout.
+
+Inputs must already share stream parameters (see helpers/merge_planner.py).
+"""
+import asyncio
+import os
+
+from __init__ import LOGGER
+from helpers.keyframe_index import keyframes_between
+from helpers.merge_planner import AUDIO_ENCODERS, VIDEO_ENCODERS
+from helpers.media_probe import media_info
+
+TRANSITION_CHOICES = [0, 0.5, 1, 2]  # seconds; 0 = hard cuts
+KEYFRAME_SEARCH = 30  # seconds scanned around a join to find a keyframe
+ANNEXB_CODECS = ("h264", "hevc")
+
+
+async def _run(cmd: list) -> bool:
+    LOGGER.info(cmd)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.error(stderr.decode().strip()[-500:])
+    return process.returncode == 0
+
+
+async def _join_points(path: str, duration: float, fade: float):
+    """(head_cut, tail_cut): first keyframe after the fade-in, last before the fade-out"""
+    head = await keyframes_between(path, fade, min(duration, fade + KEYFRAME_SEARCH))
+    tail = await keyframes_between(path, max(0, duration - fade - KEYFRAME_SEARCH), duration - fade)
+    return (head[0] if head else None), (tail[-1] if tail else None)
+
+
+def _body_command(src: str, start: float, end: float, dst: str) -> list:
+    return ["ffmpeg", "-hide_banner", "-y", "-ss", f"{start:.6f}", "-i", src,
+            "-t", f"{end - start:.6f}", "-map", "0:v:0", "-map", "0:a:0?",
+            "-c", "copy", "-avoid_negative_ts", "make_zero", dst]
+
+
+def _fade_command(a: str, a_start: float, a_len: float, b: str, b_len: float,
+                  fade: float, target: dict, dst: str) -> list:
+    """Re-encode tail of `a` crossfaded into the head of `b`"""
+    pre = "settb=AVTB" + (f",fps={target['fps']}" if target.get("fps") else "")
+    graph = (
+        f"[0:v:0]{pre}[va];[1:v:0]{pre}[vb];"
+        f"[va][vb]xfade=transition=fade:duration={fade}:offset={a_len - fade:.6f}[v]"
+    )
+    has_audio = target.get("audio_codec") is not None
+    if has_audio:
+        graph += f";[0:a:0][1:a:0]acrossfade=d={fade}[a]"
+    cmd = ["ffmpeg", "-hide_banner", "-y",
+           "-ss", f"{a_start:.6f}", "-t", f"{a_len:.6f}", "-i", a,
+           "-t", f"{b_len:.6f}", "-i", b,
+           "-filter_complex", graph, "-map", "[v]"]
+    cmd += ["-c:v"] + VIDEO_ENCODERS.get(target.get("video_codec"), VIDEO_ENCODERS["h264"])
+    if target.get("pix_fmt"):
+        cmd += ["-pix_fmt", target["pix_fmt"]]
+    if has_audio:
+        cmd += ["-map", "[a]", "-c:a", AUDIO_ENCODERS.get(target["audio_codec"], "aac")]
+        if target.get("sample_rate"):
+            cmd += ["-ar", str(target["sample_rate"])]
+    return cmd + [dst]
+
+
+async def crossfade_pieces(paths: list, target: dict, fade: float, work_dir: str):
+    """
+    Build the piece list for a crossfade merge of `paths`.
+
+    returns: list of piece paths to concat with `-c copy`, or None when a
+    join has no usable keyframes (caller falls back to hard cuts).
+    """
+    infos = await asyncio.gather(*(media_info(p) for p in paths))
+    if any(i is None or i["duration"] <= 2 * fade for i in infos):
+        return None
+    points = await asyncio.gather(*(
+        _join_points(p, i["duration"], fade) for p, i in zip(paths, infos)
+    ))
+    ext = "ts" if target.get("video_codec") in ANNEXB_CODECS else "mkv"
+    os.makedirs(work_dir, exist_ok=True)
+
+    pieces, commands = [], []
+    for n, (path, info) in enumerate(zip(paths, infos)):
+        head_cut, tail_cut = points[n]
+        start = 0.0 if n == 0 else head_cut
+        end = info["duration"] if n == len(paths) - 1 else tail_cut
+        if start is None or end is None or end <= start:
+            LOGGER.info(f"No keyframes around the joins of {path}, using hard cuts")
+            return None
+        body = os.path.abspath(f"{work_dir}/body_{n}.{ext}")
+        commands.append(_body_command(path, start, end, body))
+        pieces.append(body)
+        if n < len(paths) - 1:
+            next_head = points[n + 1][0]
+            if next_head is None:
+                return None
+            fade_piece = os.path.abspath(f"{work_dir}/fade_{n}.{ext}")
+            commands.append(_fade_command(
+                path, tail_cut, info["duration"] - tail_cut,
+                paths[n + 1], next_head, fade, target, fade_piece,
+            ))
+            pieces.append(fade_piece)
+
+    if not all(await asyncio.gather(*(_run(cmd) for cmd in commands))):
+        return None
+    return pieces
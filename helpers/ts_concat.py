@@ -0,0 +1,141 @@
+# helpers/ts_concat.py - Join MPEG-TS files byte by byte
+"""
+MPEG-TS is a stream of self-contained 188-byte packets, so segments cut
+from one continuous stream (recordings, HLS/DVR chunks) can be merged by
+appending the files.  The copy is done in the kernel with
+`os.copy_file_range` (falling back to `os.sendfile`), so no ffmpeg and no
+user-space copy is involved.
+
+The fast path is only taken when every input is MPEG-TS with the same
+stream parameters and each file's timestamps continue where the previous
+one ended; anything else goes through the normal ffmpeg concat.
+Optionally the continuity counters of later files are renumbered so
+players don't report discontinuities at the joins; that rewrite has to go
+through user space and is off by default.
+"""
+import asyncio
+import os
+import shutil
+
+from __init__ import LOGGER
+from helpers.media_probe import probe
+
+TS_PACKET = 188
+TS_SYNC = 0x47
+TIMESTAMP_TOLERANCE = 1.0  # seconds of gap/overlap accepted between segments
+COPY_CHUNK = 64 * 1024 * 1024
+
+
+async def can_byte_concat(paths: list) -> bool:
+    """True when `paths` are continuing MPEG-TS segments with identical streams"""
+    if len(paths) < 2:
+        return False
+    datas = await asyncio.gather(*(probe(p) for p in paths))
+    previous_end = None
+    for data in datas:
+        if not data:
+            return False
+        fmt = data.get("format", {})
+        if not fmt.get("format_name", "").startswith("mpegts"):
+            return False
+        try:
+            start = float(fmt.get("start_time"))
+            duration = float(fmt.get("duration"))
+        except (TypeError, ValueError):
+            return False
+        if previous_end is not None and abs(start - previous_end) > TIMESTAMP_TOLERANCE:
+            return False
+        previous_end = start + duration
+    layouts = {
+        tuple((s.get("codec_type"), s.get("codec_name"), s.get("id")) for s in d.get("streams", []))
+        for d in datas
+    }
+    return len(layouts) == 1
+
+
+def _kernel_copy(src_fd: int, dst_fd: int, size: int):
+    offset = 0
+    while offset < size:
+        count = min(COPY_CHUNK, size - offset)
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, count, offset_src=offset)
+        except (AttributeError, OSError):
+            copied = os.sendfile(dst_fd, src_fd, offset, count)
+        if copied <= 0:
+            raise OSError("kernel copy made no progress")
+        offset += copied
+
+
+def _rewrite_continuity(src, dst, counters: dict):
+    """Copy packets renumbering continuity counters after `counters` (pid -> last cc)"""
+    shift = {}
+    while True:
+        chunk = src.read(TS_PACKET * 4096)
+        if not chunk:
+            break
+        buf = bytearray(chunk)
+        for pos in range(0, len(buf) - TS_PACKET + 1, TS_PACKET):
+            if buf[pos] != TS_SYNC:
+                continue
+            pid = ((buf[pos + 1] & 0x1F) << 8) | buf[pos + 2]
+            has_payload = buf[pos + 3] & 0x10
+            if pid == 0x1FFF or not has_payload:
+                continue
+            cc = buf[pos + 3] & 0x0F
+            if pid not in shift:
+                shift[pid] = ((counters.get(pid, cc - 1) + 1) - cc) % 16
+            new_cc = (cc + shift[pid]) % 16
+            buf[pos + 3] = (buf[pos + 3] & 0xF0) | new_cc
+            counters[pid] = new_cc
+        dst.write(buf)
+
+
+def _last_counters(path: str) -> dict:
+    """Last continuity counter per PID, read from the tail of a TS file"""
+    counters = {}
+    size = os.path.getsize(path)
+    tail = min(size - size % TS_PACKET, TS_PACKET * 8192)
+    with open(path, "rb") as f:
+        f.seek(size - size % TS_PACKET - tail)
+        data = f.read(tail)
+    for pos in range(0, len(data) - TS_PACKET + 1, TS_PACKET):
+        if data[pos] != TS_SYNC or not data[pos + 3] & 0x10:
+            continue
+        pid = ((data[pos + 1] & 0x1F) << 8) | data[pos + 2]
+        counters[pid] = data[pos + 3] & 0x0F
+    return counters
+
+
+def _concat(paths: list, out_path: str, fix_continuity: bool):
+    with open(out_path, "wb") as dst:
+        for n, path in enumerate(paths):
+            size = os.path.getsize(path)
+            if fix_continuity and n > 0:
+                counters = _last_counters(paths[n - 1])
+                with open(path, "rb") as src:
+                    dst.flush()
+                    _rewrite_continuity(src, dst, counters)
+                continue
+            dst.flush()
+            joined = dst.tell()
+            with open(path, "rb") as src:
+                try:
+                    _kernel_copy(src.fileno(), dst.fileno(), size)
+                    dst.seek(0, os.SEEK_END)
+                except OSError:
+                    # Filesystem refused both syscalls; redo this file in user space
+                    dst.truncate(joined)
+                    dst.seek(joined)
+                    shutil.copyfileobj(src, dst, COPY_CHUNK)
+
+
+async def ts_byte_concat(paths: list, out_path: str, fix_continuity: bool = False):
+    """Append `paths` into `out_path` without ffmpeg; returns `out_path` or None"""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, _concat, paths, out_path, fix_continuity)
+    except OSError as e:
+        LOGGER.error(f"TS byte concat failed: {e}")
+        return None
+    LOGGER.info(f"Joined {len(paths)} TS segments at byte level into {out_path}")
+    return out_path
@@ -10,6 +10,8 @@ from random import choice
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
 from config import Config
 from __init__ import LOGGER
+from helpers.faststart import make_faststart
+from helpers.rate_limiter import progress_priority
 from helpers.utils import get_readable_file_size, get_readable_time
 
 # GoFile Configuration - FIXED VALUES
@@ -333,6 +335,7 @@ async def uploadVideo(c, cb, merged_video_path, width, height, duration, video_t
                 progress_args=(cb.message, "📤 **Uploading Document...**", time.time())
             )
         else:  # Upload as video
+            await make_faststart(merged_video_path)
             await cb.message.edit("📤 **Uploading as Video...**")
             sent_message = await c.send_video(
                 chat_id=cb.from_user.id,
@@ -386,6 +389,83 @@ async def uploadVideo(c, cb, merged_video_path, width, height, duration, video_t
             pass
         return False
 
+PARALLEL_PART_UPLOADS = 3
+
+
+async def uploadVideoParts(c, cb, part_paths, width, height, video_thumbnail, upload_mode):
+    """Upload split parts concurrently with numbered captions; one combined progress message"""
+    from helpers.media_probe import media_info
+
+    total_parts = len(part_paths)
+    sizes = [os.path.getsize(p) for p in part_paths]
+    done = [0] * total_parts
+    slots = asyncio.Semaphore(PARALLEL_PART_UPLOADS)
+    start_time = time.time()
+    await cb.message.edit(f"✂️ **Output split into {total_parts} parts, uploading...**")
+
+    async def part_progress(current, total, n):
+        done[n] = current
+        await upload_progress(
+            sum(done), sum(sizes), cb.message,
+            f"📤 **Uploading {total_parts} parts...**", start_time,
+        )
+
+    async def upload_part(n, path):
+        info = await media_info(path) or {}
+        duration = int(info.get("duration") or 0)
+        caption = f"📹 **Merged Video — Part {n + 1}/{total_parts}**\n\n" \
+                  f"📁 **File:** `{os.path.basename(path)}`\n" \
+                  f"📊 **Size:** `{get_readable_file_size(sizes[n])}`\n" \
+                  f"⏱ **Duration:** `{get_readable_time(duration)}`\n\n" \
+                  f"🤖 **Bot:** @{Config.OWNER_USERNAME}"
+        async with slots:
+            if upload_mode:
+                return await c.send_document(
+                    chat_id=cb.from_user.id,
+                    document=path,
+                    thumb=video_thumbnail,
+                    caption=caption,
+                    progress=part_progress,
+                    progress_args=(n,),
+                )
+            await make_faststart(path)
+            return await c.send_video(
+                chat_id=cb.from_user.id,
+                video=path,
+                duration=duration,
+                width=width,
+                height=height,
+                thumb=video_thumbnail,
+                caption=caption,
+                supports_streaming=True,
+                progress=part_progress,
+                progress_args=(n,),
+            )
+
+    results = await asyncio.gather(
+        *(upload_part(n, p) for n, p in enumerate(part_paths)), return_exceptions=True
+    )
+    failed = [n + 1 for n, r in enumerate(results) if isinstance(r, Exception) or r is None]
+    for n, r in enumerate(results):
+        if isinstance(r, Exception):
+            LOGGER.error(f"Upload of part {n + 1} failed: {r}")
+    if failed:
+        await cb.message.edit(f"❌ **Upload failed for part(s):** `{', '.join(map(str, failed))}`")
+        return False
+
+    if Config.LOGCHANNEL:
+        try:
+            for n, sent_message in enumerate(results):
+                await sent_message.copy(
+                    chat_id=int(Config.LOGCHANNEL),
+                    caption=f"📤 **Video Merged & Uploaded — Part {n + 1}/{total_parts}**\n\n"
+                    f"👤 **User:** {cb.from_user.first_name} (`{cb.from_user.id}`)\n"
+                    f"📁 **File:** `{os.path.basename(part_paths[n])}`",
+                )
+        except Exception as e:
+            LOGGER.error(f"Failed to send to log channel: {e}")
+    return True
+
 async def upload_progress(current, total, message, text, start_time):
     """Upload progress callback with better formatting"""
     try:
@@ -406,7 +486,8 @@ async def upload_progress(current, total, message, text, start_time):
                        f"🚀 **Speed:** `{get_readable_file_size(speed)}/s`\n" \
                        f"⏱ **ETA:** `{get_readable_time(eta)}`"
         
-        await smart_progress_editor(message, progress_text)
+        with progress_priority():
+            await smart_progress_editor(message, progress_text)
         
     except Exception as e:
         LOGGER.warning(f"Progress update failed: {e}")
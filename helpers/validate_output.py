@@ -0,0 +1,77 @@
+# helpers/validate_output.py - Catch broken outputs before uploading them
+"""
+A merged file is checked in two cheap steps instead of parsing the whole
+container: ffprobe must report readable streams and a duration matching
+the sum of the inputs, and ffmpeg must decode a few seconds at the start,
+around every join and at the end without errors.  Joins and the tail are
+where concat / mux problems show up, so this catches broken outputs in
+seconds, before a long upload.
+"""
+import asyncio
+
+from __init__ import LOGGER
+from helpers.media_probe import probe, streams_of
+
+DECODE_WINDOW = 3  # seconds decoded at each checkpoint
+DURATION_TOLERANCE = 2.0  # seconds, plus 1% of the expected duration
+MAX_CHECKPOINTS = 12
+
+
+async def _decodes(path: str, start: float, length: float) -> bool:
+    cmd = ["ffmpeg", "-hide_banner", "-v", "error", "-xerror",
+           "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", path,
+           "-map", "0:v:0?", "-map", "0:a:0?", "-f", "null", "-"]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        LOGGER.warning(f"Decode check failed at {start:.1f}s of {path}: {stderr.decode().strip()[-300:]}")
+        return False
+    return True
+
+
+def _checkpoints(duration: float, joins) -> list:
+    """Window start times: beginning, around each join and the end"""
+    points = [0.0]
+    points += [max(0.0, j - 1) for j in joins if 0 < j < duration]
+    points.append(max(0.0, duration - DECODE_WINDOW))
+    points = sorted(set(round(p, 3) for p in points))
+    if len(points) > MAX_CHECKPOINTS:
+        step = len(points) / MAX_CHECKPOINTS
+        points = [points[int(i * step)] for i in range(MAX_CHECKPOINTS)] + [points[-1]]
+    return points
+
+
+async def validate_output(path: str, expected_duration: float = None, joins=(), slack: float = 0.0):
+    """
+    Check a finished output.
+
+    :param `expected_duration`: Sum of the input durations, if known.
+    :param `joins`: Offsets (seconds) where inputs were joined.
+    :param `slack`: Extra seconds allowed below `expected_duration` (e.g. crossfade overlaps).
+    :return: None if the file looks fine, otherwise a short reason.
+    """
+    data = await probe(path)
+    if data is None:
+        return "ffprobe cannot read the file"
+    if not streams_of(data, "video") and not streams_of(data, "audio"):
+        return "no audio or video streams"
+    try:
+        duration = float(data.get("format", {}).get("duration") or 0)
+    except ValueError:
+        duration = 0
+    if duration <= 0:
+        return "duration is missing"
+    if expected_duration:
+        tolerance = DURATION_TOLERANCE + expected_duration * 0.01
+        if not (expected_duration - tolerance - slack <= duration <= expected_duration + tolerance):
+            return f"duration {duration:.1f}s, expected {expected_duration:.1f}s"
+    points = _checkpoints(duration, joins)
+    results = await asyncio.gather(*(_decodes(path, p, DECODE_WINDOW) for p in points))
+    for point, ok in zip(points, results):
+        if not ok:
+            return f"decode error near {point:.0f}s"
+    return None
@@ -12,6 +12,10 @@ from __init__ import (UPLOAD_AS_DOC, UPLOAD_TO_GOFILE, formatDB, gDict,
                       queueDB, replyDB, LOGGER, MERGE_MODE)
 from bot import delete_all
 from config import Config
+from helpers.prefetcher import prefetcher
+from helpers.settings_menus import (
+    handle_output_settings, is_output_settings_callback, output_settings_rows, transition_status
+)
 from helpers.utils import UserSettings
 from plugins.mergeVideo import mergeNow
 
@@ -87,6 +91,15 @@ async def callback_handler(c: Client, cb: CallbackQuery):
             await cb.answer(f"📊 Metadata editing {status}", show_alert=False)
             await show_settings_menu(cb, user)
         
+        elif is_output_settings_callback(data):
+            # Transition, tracks to keep and output tags (helpers/settings_menus.py)
+            if await handle_output_settings(c, cb, data, user_id):
+                await show_settings_menu(cb, user)
+        
+        elif data == "contact_sheet":
+            from plugins.streams_extractor import contactSheetNow
+            await contactSheetNow(c, cb)
+        
         elif data == "thumbnail_toggle":
             # Information about thumbnail
             if user.thumbnail:
@@ -98,6 +111,7 @@ async def callback_handler(c: Client, cb: CallbackQuery):
             # Clear user queue
             if user_id in queueDB:
                 queueDB[user_id] = {"videos": [], "subtitles": [], "audios": []}
+                await prefetcher.cancel(user_id)
                 await cb.answer("🗑️ Queue cleared successfully!", show_alert=True)
             else:
                 await cb.answer("📋 Queue is already empty!", show_alert=True)
@@ -203,6 +217,9 @@ async def handle_cancel(cb: CallbackQuery, user_id: int):
         if user_id in queueDB:
             queueDB[user_id] = {"videos": [], "subtitles": [], "audios": []}
 
+        # Stop background downloads before their directory is deleted
+        await prefetcher.cancel(user_id)
+
         if user_id in formatDB:
             formatDB[user_id] = None
 
@@ -406,6 +423,7 @@ async def show_settings_menu(cb: CallbackQuery, user: UserSettings):
              InlineKeyboardButton("🔍 Extract", callback_data="mode_extract")],
             [InlineKeyboardButton(f"🖼️ Thumbnail: {thumbnail_status}", callback_data="thumbnail_toggle")],
             [InlineKeyboardButton(f"📊 Metadata: {metadata_status}", callback_data="metadata_toggle")],
+            *output_settings_rows(user),
             [InlineKeyboardButton(f"🔗 GoFile: {gofile_status}", callback_data="gofile_toggle")],
             [InlineKeyboardButton("🗑️ Clear Queue", callback_data="clear_queue"),
              InlineKeyboardButton("✏️ Rename", callback_data="rename_file")],
@@ -426,6 +444,7 @@ async def show_settings_menu(cb: CallbackQuery, user: UserSettings):
 **🎬 MERGE SETTINGS:**
 • Current Mode: {current_mode}
 • Metadata Edit: {metadata_status}
+• Transition: {transition_status(user.user_id)}
 • Custom Thumbnail: {thumbnail_status}
 
 **💡 TIP:** All settings are automatically saved to database"""
@@ -13,8 +13,8 @@ from __init__ import LOGGER, queueDB
 from config import Config
 from helpers.utils import UserSettings, get_readable_file_size
 from helpers.encoding_helper import (
-    encode_video, get_user_encoding_settings,
-    QUALITY_PRESETS, CRF_PRESETS
+    encode_video, get_user_encoding_settings, output_geometry,
+    QUALITY_PRESETS, CRF_PRESETS, PREVIEW_LENGTH
 )
 from helpers.encode_buttons import (
     get_encoding_mode_buttons, get_custom_encoding_buttons,
@@ -25,7 +25,12 @@ from helpers.encode_buttons import (
     get_help_text, parse_encoding_callback
 )
 from helpers.uploader import uploadVideo
-from helpers.ffmpeg_helper import take_screen_shot
+from helpers.media_probe import media_info
+from helpers.output_tags import clear_tags, metadata_args, pending_tags
+from helpers.prefetcher import prefetcher
+from helpers.queue_manifest import has_disk_space, resolve_manifest
+from helpers.remux import remux_container
+from helpers.thumbnail_cache import discard_thumbnail, job_thumbnail
 
 
 async def handle_encoding_callback(c: Client, cb: CallbackQuery):
@@ -78,8 +83,20 @@ async def handle_encoding_callback(c: Client, cb: CallbackQuery):
                 reply_markup=get_encode_confirm_buttons()
             )
         
+        elif data.startswith("enc_remux_"):
+            # Container conversion only
+            settings_obj.set_remux(value)
+            await cb.answer(f"✅ Remux to {value.upper()}", show_alert=False)
+            await cb.message.edit_text(
+                "✅ **Remux Selected**\n\n"
+                + get_current_settings_text(user_id) +
+                "\n\nReady to convert?",
+                reply_markup=get_encode_confirm_buttons()
+            )
+        
         elif data == "enc_custom_menu":
-            # Show custom settings menu
+            # Show custom settings menu (leaves remux-only mode)
+            settings_obj.remux_target = None
             await cb.message.edit_text(
                 "⚙️ **Custom Encoding Settings**\n\n"
                 + get_current_settings_text(user_id),
@@ -235,6 +252,18 @@ async def handle_encoding_callback(c: Client, cb: CallbackQuery):
                 reply_markup=get_custom_encoding_buttons()
             )
         
+        elif data == "enc_preview_toggle":
+            # Low-res preview clip alongside the encode
+            settings_obj.toggle_preview_clip()
+            await cb.answer(
+                f"🎞 Preview clip: {'On' if settings_obj.preview_clip else 'Off'}"
+            )
+            await cb.message.edit_text(
+                "⚙️ **Custom Encoding Settings**\n\n"
+                + get_current_settings_text(user_id),
+                reply_markup=get_custom_encoding_buttons()
+            )
+        
         elif data == "enc_start_custom":
             # Start encoding with custom settings
             await cb.message.edit_text(
@@ -305,8 +334,20 @@ async def start_encoding_process(c: Client, cb: CallbackQuery, user_id: int):
         )
         
         try:
-            video_msg = await c.get_messages(user_id, video_msg_id)
-            input_file = await video_msg.download(file_name=user_dir)
+            entries = await resolve_manifest(c, user_id, [video_msg_id])
+            if not entries or not entries[0].get("file_id"):
+                raise ValueError("Queued message has no downloadable file")
+            entry = entries[0]
+            # Input plus a re-encoded output of at most similar size
+            if not has_disk_space(entry["file_size"] * 2):
+                await cb.message.edit_text(
+                    "💾 **Not enough disk space right now!**\n\n"
+                    "⏳ Please try again later."
+                )
+                return
+            input_file = await prefetcher.claim(user_id, entry) or await c.download_media(
+                entry["file_id"], file_name=f"{user_dir}/{entry['file_name']}"
+            )
             
             LOGGER.info(f"Downloaded: {input_file}")
             
@@ -319,18 +360,49 @@ async def start_encoding_process(c: Client, cb: CallbackQuery, user_id: int):
             return
         
         # Prepare output file
-        file_ext = input_file.split('.')[-1]
-        output_file = f"{user_dir}/encoded_{int(time.time())}.{file_ext}"
-        
-        # Start encoding
-        LOGGER.info(f"Starting encoding: {input_file} -> {output_file}")
+        settings_obj = get_user_encoding_settings(user_id)
+        file_ext = settings_obj.remux_target or input_file.split('.')[-1]
+        stamp = int(time.time())
+        output_file = f"{user_dir}/encoded_{stamp}.{file_ext}"
+        user = UserSettings(user_id, cb.from_user.first_name)
+        tags = pending_tags(user_id, user.edit_metadata)
         
-        encoded_file = await encode_video(
-            input_file=input_file,
-            output_file=output_file,
-            user_id=user_id,
-            progress_message=cb.message
+        # Probe the source once; the output's size and length follow from the settings
+        geometry = output_geometry(
+            await media_info(input_file) or {},
+            {} if settings_obj.remux_target else settings_obj.get_settings()
         )
+        duration = geometry["duration"]
+        thumb_at = min(10, duration / 2)
+        # A custom thumbnail wins, so only grab a frame when there is none
+        shot_path = None if user.thumbnail else f"{user_dir}/encoded_{stamp}.jpg"
+        preview_path = f"{user_dir}/preview_{stamp}.mp4" if settings_obj.preview_clip else None
+        
+        if settings_obj.remux_target:
+            LOGGER.info(f"Starting remux: {input_file} -> {output_file}")
+            await cb.message.edit_text(f"🔁 **Remuxing to {file_ext.upper()}...**")
+            encoded_file, notes = await remux_container(
+                input_file, file_ext, output_file, metadata_args(tags)
+            )
+            if encoded_file and notes:
+                await cb.message.edit_text(
+                    f"✅ **Remuxed to {file_ext.upper()}**\n\n" + "\n".join(f"• {n}" for n in notes)
+                )
+        else:
+            # Start encoding
+            LOGGER.info(f"Starting encoding: {input_file} -> {output_file}")
+            
+            encoded_file = await encode_video(
+                input_file=input_file,
+                output_file=output_file,
+                user_id=user_id,
+                progress_message=cb.message,
+                metadata=metadata_args(tags),
+                thumbnail_path=shot_path,
+                thumbnail_at=thumb_at,
+                preview_path=preview_path,
+                preview_at=max(0.0, (duration - PREVIEW_LENGTH) / 2)
+            )
         
         if not encoded_file or not os.path.exists(encoded_file):
             await cb.message.edit_text(
@@ -342,23 +414,23 @@ async def start_encoding_process(c: Client, cb: CallbackQuery, user_id: int):
                 os.remove(input_file)
             return
         
+        if tags:
+            clear_tags(user_id)
+        
         # Get file info for upload
         file_size = os.path.getsize(encoded_file)
         
-        # Generate thumbnail
+        # Thumbnail: the user's cached one, else the frame written during the encode
         thumbnail_path = None
         try:
-            thumbnail_path = await take_screen_shot(encoded_file, user_dir, 10)
+            thumbnail_path = await job_thumbnail(
+                c, user_id, user.thumbnail, encoded_file, thumb_at, shot=shot_path
+            )
         except Exception as e:
             LOGGER.warning(f"Thumbnail generation failed: {e}")
         
-        # Get video info
-        from helpers.encoding_helper import get_video_info
-        video_info = await get_video_info(encoded_file)
-        
-        width = video_info.get("width", 1280) if video_info else 1280
-        height = video_info.get("height", 720) if video_info else 720
-        duration = int(video_info.get("duration", 0)) if video_info else 0
+        width = geometry["width"] or 1280
+        height = geometry["height"] or 720
         
         # Upload the encoded video
         from __init__ import UPLOAD_AS_DOC
@@ -366,18 +438,32 @@ async def start_encoding_process(c: Client, cb: CallbackQuery, user_id: int):
         
         await uploadVideo(
             c, cb, encoded_file,
-            width, height, duration,
+            width, height, int(duration),
             thumbnail_path, file_size, upload_mode
         )
         
+        if preview_path and os.path.exists(preview_path):
+            try:
+                await c.send_video(
+                    chat_id=cb.from_user.id,
+                    video=preview_path,
+                    caption=f"🎞 **{PREVIEW_LENGTH}s preview of** `{os.path.basename(encoded_file)}`",
+                    duration=PREVIEW_LENGTH,
+                    supports_streaming=True
+                )
+            except Exception as e:
+                LOGGER.warning(f"Preview clip upload failed: {e}")
+        
         # Clean up
         try:
             if os.path.exists(input_file):
                 os.remove(input_file)
             if os.path.exists(encoded_file):
                 os.remove(encoded_file)
-            if thumbnail_path and os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
+            for path in (thumbnail_path, shot_path):
+                discard_thumbnail(path)
+            if preview_path and os.path.exists(preview_path):
+                os.remove(preview_path)
         except Exception as e:
             LOGGER.warning(f"Cleanup error: {e}")
         
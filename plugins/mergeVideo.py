@@ -2,17 +2,22 @@
 import asyncio
 import os
 import time
-from __init__ import (LOGGER, UPLOAD_AS_DOC, UPLOAD_TO_GOFILE, formatDB,
-                      gDict, queueDB, replyDB)
+from __init__ import (LOGGER, TRANSITION, UPLOAD_AS_DOC, UPLOAD_TO_GOFILE,
+                      formatDB, gDict, queueDB, replyDB)
 from bot import delete_all
 from config import Config
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
 from helpers.display_progress import Progress
-from helpers.ffmpeg_helper import MergeSub, MergeVideo, take_screen_shot
-from helpers.uploader import uploadVideo
+from helpers.ffmpeg_helper import MergeVideo
+from helpers.media_probe import media_info
+from helpers.output_tags import clear_tags, metadata_args, pending_tags
+from helpers.prefetcher import prefetcher
+from helpers.queue_manifest import has_disk_space, queue_totals, resolve_manifest
+from helpers.remote_probe import check_url_input
+from helpers.splitter import split_for_upload, upload_limit
+from helpers.thumbnail_cache import job_thumbnail
+from helpers.uploader import uploadVideo, uploadVideoParts
+from helpers.validate_output import validate_output
 from helpers.utils import UserSettings
-from PIL import Image
 from pyrogram import Client
 from pyrogram.errors import MessageNotModified
 from pyrogram.errors.rpc_error import UnknownError
@@ -39,6 +44,7 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
     try:
         omess = cb.message.reply_to_message
         vid_list = list()
+        part_info = list()  # (concat line, duration, subtitle path)
         sub_list = list()
         sIndex = 0
         await cb.message.edit("⭕ Processing...")
@@ -60,63 +66,84 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
         if not os.path.exists(f"downloads/{str(cb.from_user.id)}/"):
             os.makedirs(f"downloads/{str(cb.from_user.id)}/")
         
+        # Disk admission from the enqueue-time manifest: inputs + merged output
+        totals = queue_totals(cb.from_user.id)
+        if not has_disk_space(totals["bytes"] * 2):
+            await cb.message.edit(
+                "💾 **Not enough disk space for this job right now!**\n\n"
+                f"📊 **Queued:** `{get_readable_file_size(totals['bytes'])}`\n"
+                "⏳ Please try again later."
+            )
+            return
+        
         input_ = f"downloads/{str(cb.from_user.id)}/input.txt"
         all = len(list_message_ids)
         n = 1
         
+        # Media details were captured at enqueue time, so nothing is re-fetched here
+        entries = await resolve_manifest(c, cb.from_user.id, list_message_ids)
+        sub_entries = await resolve_manifest(c, cb.from_user.id, list_subtitle_ids)
+        
         # Process each video/URL in the queue
-        for i in await c.get_messages(
-            chat_id=cb.from_user.id, message_ids=list_message_ids):
+        for i in entries:
             
-            media = i.video or i.document
             file_dl_path = None
             sub_dl_path = None
             
             try:
-                # Check if message contains URL or file
-                if i.text and (i.text.startswith('http://') or i.text.startswith('https://')):
-                    # Handle Direct Download Link
-                    await cb.message.edit(f"📥 Downloading URL ({n}/{all}): `{i.text[:50]}...`")
-                    LOGGER.info(f"📥 Starting URL Download: {i.text}")
+                # Check if entry is a URL or file
+                if i.get("url"):
+                    # Handle Direct Download Link; reject broken links from their first bytes
+                    rejection = await check_url_input(i["url"], cb.from_user.id, i["message_id"])
+                    if rejection:
+                        LOGGER.info(f"Skipping URL {i['url']}: {rejection}")
+                        queueDB.get(cb.from_user.id)["videos"].remove(i["message_id"])
+                        await cb.message.edit(f"❗URL Skipped: {rejection}")
+                        await asyncio.sleep(4)
+                        n += 1
+                        continue
+                    await cb.message.edit(f"📥 Downloading URL ({n}/{all}): `{i['url'][:50]}...`")
+                    LOGGER.info(f"📥 Starting URL Download: {i['url']}")
                     
                     # Use our new downloader for URLs
                     file_dl_path = await download_from_url(
-                        url=i.text,
+                        url=i["url"],
                         user_id=cb.from_user.id,
                         status_message=cb.message
                     )
                     
                     if not file_dl_path:
-                        LOGGER.error(f"Failed to download URL: {i.text}")
-                        queueDB.get(cb.from_user.id)["videos"].remove(i.id)
+                        LOGGER.error(f"Failed to download URL: {i['url']}")
+                        queueDB.get(cb.from_user.id)["videos"].remove(i["message_id"])
                         await cb.message.edit("❗URL Download Failed! Skipping...")
                         await asyncio.sleep(4)
                         n += 1
                         continue
                 
-                elif media:
+                elif i.get("file_id"):
                     # Handle Telegram File
-                    await cb.message.edit(f"📥 Downloading TG File ({n}/{all}): `{media.file_name}`")
-                    LOGGER.info(f"📥 Starting TG Download: {media.file_name}")
+                    await cb.message.edit(f"📥 Downloading TG File ({n}/{all}): `{i['file_name']}`")
+                    LOGGER.info(f"📥 Starting TG Download: {i['file_name']}")
                     
                     # Use our new downloader for Telegram files
                     file_dl_path = await download_from_tg(
                         message=i,
                         user_id=cb.from_user.id,
-                        status_message=cb.message
+                        status_message=cb.message,
+                        client=c
                     )
                     
                     if not file_dl_path:
-                        LOGGER.error(f"Failed to download TG file: {media.file_name}")
-                        queueDB.get(cb.from_user.id)["videos"].remove(i.id)
+                        LOGGER.error(f"Failed to download TG file: {i['file_name']}")
+                        queueDB.get(cb.from_user.id)["videos"].remove(i["message_id"])
                         await cb.message.edit("❗TG Download Failed! Skipping...")
                         await asyncio.sleep(4)
                         n += 1
                         continue
                 
                 else:
-                    LOGGER.warning(f"No downloadable content in message {i.id}")
-                    queueDB.get(cb.from_user.id)["videos"].remove(i.id)
+                    LOGGER.warning(f"No downloadable content in message {i['message_id']}")
+                    queueDB.get(cb.from_user.id)["videos"].remove(i["message_id"])
                     await cb.message.edit("❗No downloadable content! Skipping...")
                     await asyncio.sleep(4)
                     n += 1
@@ -136,31 +163,27 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
                 pass
             except Exception as downloadErr:
                 LOGGER.info(f"Failed to download Error: {downloadErr}")
-                queueDB.get(cb.from_user.id)["videos"].remove(i.id)
+                queueDB.get(cb.from_user.id)["videos"].remove(i["message_id"])
                 await cb.message.edit("❗File Skipped!")
                 await asyncio.sleep(4)
                 continue
             
             # Handle subtitles if present
-            if list_subtitle_ids[sIndex] is not None:
-                a = await c.get_messages(
-                    chat_id=cb.from_user.id, message_ids=list_subtitle_ids[sIndex]
-                )
-                sub_dl_path = await c.download_media(
-                    message=a,
-                    file_name=f"downloads/{str(cb.from_user.id)}/{str(a.id)}/",
+            if sIndex < len(sub_entries):
+                a = sub_entries[sIndex]
+                sub_dl_path = await prefetcher.claim(cb.from_user.id, a) or await c.download_media(
+                    message=a["file_id"],
+                    file_name=f"downloads/{str(cb.from_user.id)}/{str(a['message_id'])}/{a['file_name']}",
                 )
-                LOGGER.info("Got sub: ", a.document.file_name)
-                file_dl_path = await MergeSub(file_dl_path, sub_dl_path, cb.from_user.id)
-                LOGGER.info("Added subs")
+                LOGGER.info(f"Got sub: {a['file_name']}")
                 sIndex += 1
             
             # Extract metadata
-            metadata = extractMetadata(createParser(file_dl_path))
             try:
-                if metadata.has("duration"):
-                    duration += metadata.get("duration").seconds
+                part_duration = (await media_info(file_dl_path))["duration"]
+                duration += int(part_duration)
                 vid_list.append(f"file '{file_dl_path}'")
+                part_info.append((f"file '{file_dl_path}'", part_duration, sub_dl_path))
             except:
                 await cleanup_user_data(cb.from_user.id)
                 await cb.message.edit("⚠️ Video is corrupted")
@@ -173,6 +196,21 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
                 _cache.append(vid_list[i])
         vid_list = _cache
         
+        # Subtitles are muxed in the merge pass, placed at the start of their video
+        sub_tracks = []
+        joins = []
+        offset = 0.0
+        seen = set()
+        for line, part_duration, sub_path in part_info:
+            if line in seen:
+                continue
+            seen.add(line)
+            if sub_path:
+                sub_tracks.append((len(seen) - 1, sub_path))
+            if offset:
+                joins.append(offset)
+            offset += part_duration
+        
         LOGGER.info(f"Trying to merge videos user {cb.from_user.id}")
         await cb.message.edit(f"🔀 Merging videos... Please wait...")
         
@@ -180,9 +218,18 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
         with open(input_, "w") as _list:
             _list.write("\n".join(vid_list))
         
-        # Merge videos
+        # Merge videos, writing any queued tags in the same pass
+        tags = pending_tags(
+            cb.from_user.id, UserSettings(cb.from_user.id, cb.from_user.first_name).edit_metadata
+        )
         merged_video_path = await MergeVideo(
-            input_file=input_, user_id=cb.from_user.id, message=cb.message, format_="mkv"
+            input_file=input_,
+            user_id=cb.from_user.id,
+            message=cb.message,
+            format_="mkv",
+            subtitles=sub_tracks,
+            transition=TRANSITION.get(cb.from_user.id, 0),
+            metadata=metadata_args(tags),
         )
         
         if merged_video_path is None:
@@ -190,6 +237,9 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
             await cleanup_user_data(cb.from_user.id)
             return
         
+        if tags:
+            clear_tags(cb.from_user.id)
+        
         try:
             await cb.message.edit("✅ Successfully Merged Video!")
         except MessageNotModified:
@@ -200,89 +250,66 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
         
         # Rename file
         file_size = os.path.getsize(merged_video_path)
+        merged_ext = os.path.splitext(merged_video_path)[1]
+        if merged_ext != os.path.splitext(new_file_name)[1]:
+            new_file_name = os.path.splitext(new_file_name)[0] + merged_ext
         os.rename(merged_video_path, new_file_name)
         await cb.message.edit(f"🔄 Renamed to: `{new_file_name.rsplit('/',1)[-1]}`")
         await asyncio.sleep(3)
         merged_video_path = new_file_name
         
-        # Check file size limits
-        if file_size > 2044723200 and Config.IS_PREMIUM == False:
-            await cb.message.edit(
-                f"📁 **File too large for regular Telegram!**\n\n"
-                f"📊 **Size:** `{get_readable_file_size(file_size)}`\n"
-                f"🚫 **Limit:** `2GB`\n\n"
-                f"💡 **Tip:** Use GoFile upload option or contact admin for premium access."
-            )
+        await cb.message.edit("🩺 Checking merged video...")
+        transition = TRANSITION.get(cb.from_user.id, 0)
+        problem = await validate_output(
+            merged_video_path, expected_duration=offset, joins=joins, slack=transition * len(joins)
+        )
+        if problem:
+            LOGGER.warning(f"Merged output for {cb.from_user.id} failed validation: {problem}")
             await cleanup_user_data(cb.from_user.id)
+            await cb.message.edit(f"⭕ Merged Video is corrupted\n\n`{problem}`")
             return
+        duration = int((await media_info(merged_video_path))["duration"]) or 1
+        
+        # Handle thumbnail
+        user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+        video_thumbnail = await job_thumbnail(
+            c, cb.from_user.id, user.thumbnail, merged_video_path, duration / 2
+        )
+        info = await media_info(merged_video_path)
+        width = info["width"] or 1280
+        height = info["height"] or 720
         
-        if Config.IS_PREMIUM and file_size > 4241280205:
+        # Upload the video, split at keyframes if it is over the Telegram limit
+        if file_size > upload_limit() and not UPLOAD_TO_GOFILE.get(str(cb.from_user.id)):
             await cb.message.edit(
-                f"📁 **File too large even for premium!**\n\n"
-                f"📊 **Size:** `{get_readable_file_size(file_size)}`\n"
-                f"🚫 **Limit:** `4GB`\n\n"
-                f"💡 **Tip:** Use GoFile upload option for larger files."
+                f"✂️ **{get_readable_file_size(file_size)} is over the Telegram limit, splitting...**"
             )
-            await cleanup_user_data(cb.from_user.id)
-            return
-        
-        await cb.message.edit("🎥 Extracting Video Data...")
-        duration = 1
-        
-        try:
-            metadata = extractMetadata(createParser(merged_video_path))
-            if metadata.has("duration"):
-                duration = metadata.get("duration").seconds
-        except Exception as er:
-            await cleanup_user_data(cb.from_user.id)
-            await cb.message.edit("⭕ Merged Video is corrupted")
-            return
-        
-        # Handle thumbnail
-        try:
-            user = UserSettings(cb.from_user.id, cb.from_user.first_name)
-            thumb_id = user.thumbnail
-            if thumb_id is None:
-                raise Exception
-            video_thumbnail = f"downloads/{str(cb.from_user.id)}_thumb.jpg"
-            await c.download_media(message=str(thumb_id), file_name=video_thumbnail)
-        except Exception as err:
-            LOGGER.info("Generating thumb")
-            video_thumbnail = await take_screen_shot(
-                merged_video_path, f"downloads/{str(cb.from_user.id)}", (duration / 2)
+            parts = await split_for_upload(merged_video_path)
+            if parts is None:
+                await cb.message.edit("❌ Could not split the merged video for upload")
+                await cleanup_user_data(cb.from_user.id)
+                return
+            await uploadVideoParts(
+                c=c,
+                cb=cb,
+                part_paths=parts,
+                width=width,
+                height=height,
+                video_thumbnail=video_thumbnail,
+                upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
+            )
+        else:
+            await uploadVideo(
+                c=c,
+                cb=cb,
+                merged_video_path=merged_video_path,
+                width=width,
+                height=height,
+                duration=duration,
+                video_thumbnail=video_thumbnail,
+                file_size=os.path.getsize(merged_video_path),
+                upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
             )
-        
-        # Process thumbnail
-        width = 1280
-        height = 720
-        try:
-            thumb = extractMetadata(createParser(video_thumbnail))
-            height = thumb.get("height")
-            width = thumb.get("width")
-            img = Image.open(video_thumbnail)
-            if width > height:
-                img.resize((320, height))
-            elif height > width:
-                img.resize((width, 320))
-            img.save(video_thumbnail)
-            Image.open(video_thumbnail).convert("RGB").save(video_thumbnail, "JPEG")
-        except:
-            await cleanup_user_data(cb.from_user.id)
-            await cb.message.edit("⭕ Merged Video is corrupted")
-            return
-        
-        # Upload the video
-        await uploadVideo(
-            c=c,
-            cb=cb,
-            merged_video_path=merged_video_path,
-            width=width,
-            height=height,
-            duration=duration,
-            video_thumbnail=video_thumbnail,
-            file_size=os.path.getsize(merged_video_path),
-            upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
-        )
         
         await cb.message.delete(True)
         await cleanup_user_data(cb.from_user.id)
@@ -299,7 +326,8 @@ async def mergeNow(c: Client, cb: CallbackQuery, new_file_name: str):
 async def cleanup_user_data(user_id):
     """Enhanced cleanup function with downloader integration"""
     try:
-        await delete_all(root=f"downloads/{str(user_id)}")
+        await prefetcher.cancel(user_id)
+        delete_all(root=f"downloads/{str(user_id)}")
         queueDB.update({user_id: {"videos": [], "subtitles": [], "audios": []}})
         formatDB.update({user_id: None})
         
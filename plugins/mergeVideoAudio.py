@@ -5,17 +5,19 @@ import time
 from __init__ import (AUDIO_EXTENSIONS, LOGGER, UPLOAD_AS_DOC, UPLOAD_TO_GOFILE,
                       VIDEO_EXTENSIONS, formatDB, gDict, queueDB)
 from bot import delete_all
-from config import Config
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
 from helpers.display_progress import Progress
-from helpers.ffmpeg_helper import MergeAudio, take_screen_shot
-from helpers.uploader import uploadVideo
-from helpers.utils import UserSettings
-from PIL import Image
+from helpers.ffmpeg_helper import MergeAudio
+from helpers.media_probe import media_info
+from helpers.prefetcher import prefetcher
+from helpers.queue_manifest import resolve_manifest
+from helpers.splitter import split_for_upload, upload_limit
+from helpers.thumbnail_cache import job_thumbnail
+from helpers.uploader import uploadVideo, uploadVideoParts
+from helpers.utils import UserSettings, get_readable_file_size
+from helpers.validate_output import validate_output
 from pyrogram import Client
 from pyrogram.errors import MessageNotModified
-from pyrogram.types import CallbackQuery, Message
+from pyrogram.types import CallbackQuery
 
 
 async def mergeAudio(c: Client, cb: CallbackQuery, new_file_name: str):
@@ -35,14 +37,11 @@ async def mergeAudio(c: Client, cb: CallbackQuery, new_file_name: str):
         os.makedirs(f"downloads/{str(cb.from_user.id)}/")
     all = len(list_message_ids)
     n=1
-    msgs: list[Message] = await c.get_messages(
-        chat_id=cb.from_user.id, message_ids=list_message_ids
-    )
-    for i in msgs:
-        media = i.video or i.document or i.audio
-        await cb.message.edit(f"📥 Starting Download of ... `{media.file_name}`")
-        LOGGER.info(f"📥 Starting Download of ... {media.file_name}")
-        currentFileNameExt = media.file_name.rsplit(sep=".")[-1].lower()
+    entries = await resolve_manifest(c, cb.from_user.id, list_message_ids)
+    for i in entries:
+        await cb.message.edit(f"📥 Starting Download of ... `{i['file_name']}`")
+        LOGGER.info(f"📥 Starting Download of ... {i['file_name']}")
+        currentFileNameExt = i["file_name"].rsplit(sep=".")[-1].lower()
         if currentFileNameExt in VIDEO_EXTENSIONS:
             tmpFileName = "vid.mkv"
         elif currentFileNameExt in AUDIO_EXTENSIONS:
@@ -52,28 +51,28 @@ async def mergeAudio(c: Client, cb: CallbackQuery, new_file_name: str):
         try:
             c_time = time.time()
             prog = Progress(cb.from_user.id, c, cb.message)
-            file_dl_path = await c.download_media(
-                message=media,
-                file_name=f"downloads/{str(cb.from_user.id)}/{str(i.id)}/{tmpFileName}",
+            file_dl_path = await prefetcher.claim(cb.from_user.id, i) or await c.download_media(
+                message=i["file_id"],
+                file_name=f"downloads/{str(cb.from_user.id)}/{str(i['message_id'])}/{tmpFileName}",
                 progress=prog.progress_for_pyrogram,
-                progress_args=(f"🚀 Downloading: `{media.file_name}`", c_time, f"\n**Downloading: {n}/{all}**"),
+                progress_args=(f"🚀 Downloading: `{i['file_name']}`", c_time, f"\n**Downloading: {n}/{all}**"),
             )
             n+=1
             if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
                 return
-            await cb.message.edit(f"Downloaded Sucessfully ... `{media.file_name}`")
-            LOGGER.info(f"Downloaded Sucessfully ... {media.file_name}")
+            await cb.message.edit(f"Downloaded Sucessfully ... `{i['file_name']}`")
+            LOGGER.info(f"Downloaded Sucessfully ... {i['file_name']}")
             await asyncio.sleep(4)
         except Exception as downloadErr:
             LOGGER.warning(f"Failed to download Error: {downloadErr}")
-            queueDB.get(cb.from_user.id)["audios"].remove(i.id)
+            queueDB.get(cb.from_user.id)["audios"].remove(i["message_id"])
             await cb.message.edit("❗File Skipped!")
             await asyncio.sleep(4)
             await cb.message.delete(True)
             continue
         files_list.append(f"{file_dl_path}")
 
-    muxed_video = MergeAudio(files_list[0], files_list, cb.from_user.id)
+    muxed_video = await MergeAudio(files_list[0], files_list, cb.from_user.id)
     if muxed_video is None:
         await cb.message.edit("❌ Failed to add audio to video !")
         await delete_all(root=f"downloads/{str(cb.from_user.id)}")
@@ -100,79 +99,56 @@ async def mergeAudio(c: Client, cb: CallbackQuery, new_file_name: str):
         formatDB.update({cb.from_user.id: None})
         return
 
-    if file_size > 2044723200 and Config.IS_PREMIUM == False:
-        await cb.message.edit(
-            f"Video is Larger than 2GB Can't Upload,\n\n Tell {Config.OWNER_USERNAME} to add premium account to get 4GB TG uploads"
-        )
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        return
-    if Config.IS_PREMIUM and file_size > 4241280205:
-        await cb.message.edit(
-            f"Video is Larger than 4GB Can't Upload,\n\n Tell {Config.OWNER_USERNAME} to die with premium account"
-        )
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        return
     await cb.message.edit("🎥 Extracting Video Data ...")
 
-    duration = 1
-    try:
-        metadata = extractMetadata(createParser(merged_video_path))
-        if metadata.has("duration"):
-            duration = metadata.get("duration").seconds
-    except Exception as er:
+    problem = await validate_output(merged_video_path)
+    if problem:
+        LOGGER.warning(f"Muxed output for {cb.from_user.id} failed validation: {problem}")
         await delete_all(root=f"downloads/{str(cb.from_user.id)}")
         queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
         formatDB.update({cb.from_user.id: None})
-        await cb.message.edit("⭕ Merged Video is corrupted")
+        await cb.message.edit(f"⭕ Merged Video is corrupted\n\n`{problem}`")
         return
-    try:
-        user = UserSettings(cb.from_user.id, cb.from_user.first_name)
-        thumb_id = user.thumbnail
-        if thumb_id is None:
-            raise Exception
-        video_thumbnail = f"downloads/{str(cb.from_user.id)}_thumb.jpg"
-        await c.download_media(message=str(thumb_id), file_name=video_thumbnail)
-    except Exception as err:
-        LOGGER.info("Generating thumb")
-        video_thumbnail = await take_screen_shot(
-            merged_video_path, f"downloads/{str(cb.from_user.id)}", (duration / 2)
-        )
-    width = 1280
-    height = 720
-    try:
-        thumb = extractMetadata(createParser(video_thumbnail))
-        height = thumb.get("height")
-        width = thumb.get("width")
-        img = Image.open(video_thumbnail)
-        if width > height:
-            img.resize((320, height))
-        elif height > width:
-            img.resize((width, 320))
-        img.save(video_thumbnail)
-        Image.open(video_thumbnail).convert("RGB").save(video_thumbnail, "JPEG")
-    except:
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
+    duration = int((await media_info(merged_video_path))["duration"]) or 1
+    user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+    video_thumbnail = await job_thumbnail(
+        c, cb.from_user.id, user.thumbnail, merged_video_path, duration / 2
+    )
+    info = await media_info(merged_video_path)
+    width = info["width"] or 1280
+    height = info["height"] or 720
+    if file_size > upload_limit():
         await cb.message.edit(
-            "⭕ Merged Video is corrupted \n\n<i>Try setting custom thumbnail</i>",
+            f"✂️ **{get_readable_file_size(file_size)} is over the Telegram limit, splitting...**"
+        )
+        parts = await split_for_upload(merged_video_path)
+        if parts is None:
+            await cb.message.edit("❌ Could not split the muxed video for upload")
+            await delete_all(root=f"downloads/{str(cb.from_user.id)}")
+            queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
+            formatDB.update({cb.from_user.id: None})
+            return
+        await uploadVideoParts(
+            c=c,
+            cb=cb,
+            part_paths=parts,
+            width=width,
+            height=height,
+            video_thumbnail=video_thumbnail,
+            upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
+        )
+    else:
+        await uploadVideo(
+            c=c,
+            cb=cb,
+            merged_video_path=merged_video_path,
+            width=width,
+            height=height,
+            duration=duration,
+            video_thumbnail=video_thumbnail,
+            file_size=os.path.getsize(merged_video_path),
+            upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
         )
-        return
-    await uploadVideo(
-        c=c,
-        cb=cb,
-        merged_video_path=merged_video_path,
-        width=width,
-        height=height,
-        duration=duration,
-        video_thumbnail=video_thumbnail,
-        file_size=os.path.getsize(merged_video_path),
-        upload_mode=UPLOAD_AS_DOC[f"{cb.from_user.id}"],
-    )
     await cb.message.delete(True)
     await delete_all(root=f"downloads/{str(cb.from_user.id)}")
     queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
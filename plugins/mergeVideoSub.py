@@ -14,18 +14,20 @@ from __init__ import (
 )
 from bot import delete_all
 from config import Config
-from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
 from helpers.display_progress import Progress
-from helpers.ffmpeg_helper import MergeSubNew, take_screen_shot
+from helpers.ffmpeg_helper import MergeSubNew
+from helpers.media_probe import media_info
+from helpers.prefetcher import prefetcher
+from helpers.queue_manifest import resolve_manifest
+from helpers.thumbnail_cache import job_thumbnail
 from helpers.uploader import uploadVideo
 from helpers.utils import UserSettings
-from PIL import Image
+from helpers.validate_output import validate_output
 from pyrogram import Client
 from pyrogram.errors import MessageNotModified
 from pyrogram.errors.exceptions.flood_420 import FloodWait
 from pyrogram.errors.rpc_error import UnknownError
-from pyrogram.types import CallbackQuery, Message
+from pyrogram.types import CallbackQuery
 
 
 async def mergeSub(c: Client, cb: CallbackQuery, new_file_name: str):
@@ -43,16 +45,13 @@ async def mergeSub(c: Client, cb: CallbackQuery, new_file_name: str):
         return
     if not os.path.exists(f"downloads/{str(cb.from_user.id)}/"):
         os.makedirs(f"downloads/{str(cb.from_user.id)}/")
-    msgs: list[Message] = await c.get_messages(
-        chat_id=cb.from_user.id, message_ids=list_message_ids
-    )
-    all = len(msgs)
+    entries = await resolve_manifest(c, cb.from_user.id, list_message_ids)
+    all = len(entries)
     n=1
-    for i in msgs:
-        media = i.video or i.document
-        await cb.message.edit(f"📥 Starting Download of ... `{media.file_name}`")
-        LOGGER.info(f"📥 Starting Download of ... {media.file_name}")
-        currentFileNameExt = media.file_name.rsplit(sep=".")[-1].lower()
+    for i in entries:
+        await cb.message.edit(f"📥 Starting Download of ... `{i['file_name']}`")
+        LOGGER.info(f"📥 Starting Download of ... {i['file_name']}")
+        currentFileNameExt = i["file_name"].rsplit(sep=".")[-1].lower()
         if currentFileNameExt in VIDEO_EXTENSIONS:
             tmpFileName = "vid.mkv"
         elif currentFileNameExt in SUBTITLE_EXTENSIONS:
@@ -62,28 +61,28 @@ async def mergeSub(c: Client, cb: CallbackQuery, new_file_name: str):
         try:
             c_time = time.time()
             prog = Progress(cb.from_user.id, c, cb.message)
-            file_dl_path = await c.download_media(
-                message=media,
-                file_name=f"downloads/{str(cb.from_user.id)}/{str(i.id)}/{tmpFileName}",
+            file_dl_path = await prefetcher.claim(cb.from_user.id, i) or await c.download_media(
+                message=i["file_id"],
+                file_name=f"downloads/{str(cb.from_user.id)}/{str(i['message_id'])}/{tmpFileName}",
                 progress=prog.progress_for_pyrogram,
-                progress_args=(f"🚀 Downloading: `{media.file_name}`", c_time,f"\n**Downloading: {n}/{all}**"),
+                progress_args=(f"🚀 Downloading: `{i['file_name']}`", c_time,f"\n**Downloading: {n}/{all}**"),
             )
             n+=1
             if gDict[cb.message.chat.id] and cb.message.id in gDict[cb.message.chat.id]:
                 return
-            await cb.message.edit(f"Downloaded Sucessfully ... `{media.file_name}`")
-            LOGGER.info(f"Downloaded Sucessfully ... {media.file_name}")
+            await cb.message.edit(f"Downloaded Sucessfully ... `{i['file_name']}`")
+            LOGGER.info(f"Downloaded Sucessfully ... {i['file_name']}")
             await asyncio.sleep(5)
         except Exception as downloadErr:
             LOGGER.warning(f"Failed to download Error: {downloadErr}")
-            queueDB.get(cb.from_user.id)["subtitles"].remove(i.id)
+            queueDB.get(cb.from_user.id)["subtitles"].remove(i["message_id"])
             await cb.message.edit("❗File Skipped!")
             await asyncio.sleep(4)
             await cb.message.delete(True)
             continue
         vid_list.append(f"{file_dl_path}")
 
-    subbed_video = MergeSubNew(
+    subbed_video = await MergeSubNew(
         filePath=vid_list[0],
         subPath=vid_list[1],
         user_id=cb.from_user.id,
@@ -132,51 +131,22 @@ async def mergeSub(c: Client, cb: CallbackQuery, new_file_name: str):
         return
     await cb.message.edit("🎥 Extracting Video Data ...")
 
-    duration = 1
-    try:
-        metadata = extractMetadata(createParser(merged_video_path))
-        if metadata.has("duration"):
-            duration = metadata.get("duration").seconds
-    except Exception as er:
-        await delete_all(root=f"downloads/{str(cb.from_user.id)}")
-        queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
-        formatDB.update({cb.from_user.id: None})
-        await cb.message.edit("⭕ Merged Video is corrupted")
-        return
-    try:
-        user = UserSettings(cb.from_user.id, cb.from_user.first_name)
-        thumb_id = user.thumbnail
-        if thumb_id is None:
-            raise Exception
-        # thumb_id = await database.getThumb(cb.from_user.id)
-        video_thumbnail = f"downloads/{str(cb.from_user.id)}_thumb.jpg"
-        await c.download_media(message=str(thumb_id), file_name=video_thumbnail)
-    except Exception as err:
-        LOGGER.info("Generating thumb")
-        video_thumbnail = await take_screen_shot(
-            merged_video_path, f"downloads/{str(cb.from_user.id)}", (duration / 2)
-        )
-    width = 1280
-    height = 720
-    try:
-        thumb = extractMetadata(createParser(video_thumbnail))
-        height = thumb.get("height")
-        width = thumb.get("width")
-        img = Image.open(video_thumbnail)
-        if width > height:
-            img.resize((320, height))
-        elif height > width:
-            img.resize((width, 320))
-        img.save(video_thumbnail)
-        Image.open(video_thumbnail).convert("RGB").save(video_thumbnail, "JPEG")
-    except:
+    problem = await validate_output(merged_video_path)
+    if problem:
+        LOGGER.warning(f"Muxed output for {cb.from_user.id} failed validation: {problem}")
         await delete_all(root=f"downloads/{str(cb.from_user.id)}")
         queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
         formatDB.update({cb.from_user.id: None})
-        await cb.message.edit(
-            "⭕ Merged Video is corrupted \n\n<i>Try setting custom thumbnail</i>",
-        )
+        await cb.message.edit(f"⭕ Merged Video is corrupted\n\n`{problem}`")
         return
+    duration = int((await media_info(merged_video_path))["duration"]) or 1
+    user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+    video_thumbnail = await job_thumbnail(
+        c, cb.from_user.id, user.thumbnail, merged_video_path, duration / 2
+    )
+    info = await media_info(merged_video_path)
+    width = info["width"] or 1280
+    height = info["height"] or 720
     await uploadVideo(
         c=c,
         cb=cb,
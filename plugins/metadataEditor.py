@@ -9,6 +9,8 @@ from __init__ import LOGGER
 from config import Config
 from helpers.utils import UserSettings
 from helpers.display_progress import Progress
+from helpers.faststart import FASTSTART_FLAGS, is_mp4
+from helpers.tag_writer import tag_container, write_tags
 import asyncio
 
 # Store pending metadata changes per user
@@ -337,6 +339,50 @@ async def handle_metadata_callback(c: Client, cb: CallbackQuery):
         await cb.answer(f"❌ Error: {str(e)}", show_alert=True)
 
 
+async def remux_with_metadata(input_file: str, output_file: str, metadata: dict, cb: CallbackQuery):
+    """Copy every stream into `output_file` with the new tags, thumbnail and track names"""
+    ffmpeg_cmd = ["ffmpeg", "-i", input_file]
+    
+    # Add thumbnail if provided
+    if metadata['thumbnail']:
+        ffmpeg_cmd.extend(["-i", metadata['thumbnail']])
+    
+    # Add metadata flags
+    ffmpeg_cmd.extend(["-map", "0"])
+    if metadata['thumbnail']:
+        ffmpeg_cmd.extend(["-map", "1", "-disposition:v:1", "attached_pic"])
+    
+    # Add metadata options
+    if metadata['title']:
+        ffmpeg_cmd.extend(["-metadata", f"title={metadata['title']}"])
+    if metadata['author']:
+        ffmpeg_cmd.extend(["-metadata", f"artist={metadata['author']}"])
+        ffmpeg_cmd.extend(["-metadata", f"author={metadata['author']}"])
+    if metadata['audio']:
+        ffmpeg_cmd.extend(["-metadata:s:a:0", f"title={metadata['audio']}"])
+    if metadata['subtitle']:
+        ffmpeg_cmd.extend(["-metadata:s:s:0", f"language={metadata['subtitle']}"])
+    
+    # Copy codecs to avoid re-encoding
+    ffmpeg_cmd.extend(["-c", "copy"])
+    if is_mp4(output_file):
+        ffmpeg_cmd.extend(FASTSTART_FLAGS)
+    ffmpeg_cmd.extend([output_file, "-y"])
+    
+    await cb.message.edit_text("⚙️ **Processing...**\n\n⚙️ Applying metadata changes...")
+    
+    # Execute FFmpeg
+    process = await asyncio.create_subprocess_exec(
+        *ffmpeg_cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    
+    if process.returncode != 0:
+        raise Exception(f"FFmpeg failed: {stderr.decode()[:200]}")
+
+
 async def apply_metadata_changes(c: Client, cb: CallbackQuery, user_id: int, msg_id: int):
     """Apply metadata changes using FFmpeg and send updated file"""
     try:
@@ -367,47 +413,25 @@ async def apply_metadata_changes(c: Client, cb: CallbackQuery, user_id: int, msg
             progress_args=("📥 Downloading", c_time)
         )
         
-        # Build FFmpeg command
-        output_file = f"{download_dir}/output_{msg_id}.mp4"
+        # The output keeps the source container, so MKV stays MKV
+        container = tag_container(input_file)
+        output_ext = ".mkv" if container == "matroska" else ".mp4"
+        output_file = f"{download_dir}/output_{msg_id}{output_ext}"
         metadata = metadata_storage[user_id][msg_id]
         
-        ffmpeg_cmd = ["ffmpeg", "-i", input_file]
-        
-        # Add thumbnail if provided
-        if metadata['thumbnail']:
-            ffmpeg_cmd.extend(["-i", metadata['thumbnail']])
-        
-        # Add metadata flags
-        ffmpeg_cmd.extend(["-map", "0"])
-        if metadata['thumbnail']:
-            ffmpeg_cmd.extend(["-map", "1", "-disposition:v:1", "attached_pic"])
-        
-        # Add metadata options
-        if metadata['title']:
-            ffmpeg_cmd.extend(["-metadata", f"title={metadata['title']}"])
-        if metadata['author']:
-            ffmpeg_cmd.extend(["-metadata", f"artist={metadata['author']}"])
-            ffmpeg_cmd.extend(["-metadata", f"author={metadata['author']}"])
-        if metadata['audio']:
-            ffmpeg_cmd.extend(["-metadata:s:a:0", f"title={metadata['audio']}"])
-        if metadata['subtitle']:
-            ffmpeg_cmd.extend(["-metadata:s:s:0", f"language={metadata['subtitle']}"])
-        
-        # Copy codecs to avoid re-encoding
-        ffmpeg_cmd.extend(["-c", "copy", output_file, "-y"])
-        
-        await cb.message.edit_text("⚙️ **Processing...**\n\n⚙️ Applying metadata changes...")
-        
-        # Execute FFmpeg
-        process = await asyncio.create_subprocess_exec(
-            *ffmpeg_cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        # Title / author only: patch the container tags instead of remuxing
+        in_place = False
+        if (not (metadata['audio'] or metadata['subtitle'] or metadata['thumbnail'])
+                and container is not None):
+            await cb.message.edit_text("⚙️ **Processing...**\n\n✏️ Writing tags in place...")
+            in_place = await write_tags(
+                input_file, title=metadata['title'] or None, author=metadata['author'] or None
+            )
+            if in_place:
+                os.replace(input_file, output_file)
         
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg failed: {stderr.decode()[:200]}")
+        if not in_place:
+            await remux_with_metadata(input_file, output_file, metadata, cb)
         
         # Upload modified file
         await cb.message.edit_text("⚙️ **Processing...**\n\n⬆️ Uploading modified file...")
@@ -438,8 +462,9 @@ async def apply_metadata_changes(c: Client, cb: CallbackQuery, user_id: int, msg
         
         # Cleanup
         try:
-            os.remove(input_file)
-            os.remove(output_file)
+            for path in (input_file, output_file):
+                if os.path.exists(path):
+                    os.remove(path)
             if metadata['thumbnail']:
                 os.remove(metadata['thumbnail'])
             del metadata_storage[user_id][msg_id]
@@ -1,6 +1,6 @@
 import time
 from pyrogram import Client
-from pyrogram.types import Message, CallbackQuery
+from pyrogram.types import CallbackQuery, InputMediaPhoto, Message
 
 from pyrogram.errors import MessageNotModified
 from pyrogram.errors.rpc_error import UnknownError
@@ -9,7 +9,10 @@ from __init__ import LOGGER, gDict, queueDB
 import os
 from bot import delete_all
 from helpers.display_progress import Progress
-from helpers.ffmpeg_helper import extractAudios, extractSubtitles
+from helpers.contact_sheet import SHEET_COLUMNS, SHEET_ROWS, contact_sheet
+from helpers.ffmpeg_helper import extractStreams
+from helpers.prefetcher import prefetcher
+from helpers.queue_manifest import resolve_manifest
 from helpers.uploader import uploadFiles
 
 async def streamsExtractor(c: Client, cb:CallbackQuery ,media_mid, exAudios=False, exSubs=False):
@@ -49,12 +52,11 @@ async def streamsExtractor(c: Client, cb:CallbackQuery ,media_mid, exAudios=Fals
         await asyncio.sleep(4)
     await _hold.edit_text("Fetching data")
     await asyncio.sleep(3)
-    if exAudios:
-        await _hold.edit_text("Extracting Audios")
-        extract_dir = await extractAudios(file_dl_path,cb.from_user.id)
-    if exSubs:
-        await _hold.edit_text("Extracting Subtitles")
-        extract_dir = await extractSubtitles(file_dl_path, cb.from_user.id)
+    kinds = " and ".join(k for k, on in (("Audios", exAudios), ("Subtitles", exSubs)) if on)
+    await _hold.edit_text(f"Extracting {kinds or 'Streams'}")
+    extract_dir = await extractStreams(
+        file_dl_path, cb.from_user.id, audios=exAudios, subtitles=exSubs
+    ) if kinds else None
 
     if extract_dir is None:
         await cb.message.edit("❌ Failed to Extract Streams !")
@@ -82,3 +84,59 @@ async def streamsExtractor(c: Client, cb:CallbackQuery ,media_mid, exAudios=Fals
     queueDB.update({cb.from_user.id: {"videos": [], "subtitles": [], "audios": []}})
     
     return
+
+
+async def extractStreamsNow(c: Client, cb: CallbackQuery):
+    """Extract audio and subtitle tracks of the queued video in one pass"""
+    videos = queueDB.get(cb.from_user.id, {}).get("videos", [])
+    if not videos:
+        await cb.answer("⚠️ Send a video first", show_alert=True)
+        return
+    await streamsExtractor(c, cb, videos[0], exAudios=True, exSubs=True)
+
+
+async def contactSheetNow(c: Client, cb: CallbackQuery):
+    """Send a keyframe contact sheet and screenshot series of the first queued video"""
+    videos = queueDB.get(cb.from_user.id, {}).get("videos", [])
+    if not videos:
+        await cb.answer("⚠️ Send a video first", show_alert=True)
+        return
+    entries = await resolve_manifest(c, cb.from_user.id, videos[:1])
+    if not entries:
+        await cb.answer("⚠️ Queued video not found", show_alert=True)
+        return
+    entry = entries[0]
+    user_dir = f"downloads/{str(cb.from_user.id)}"
+    sheet_dir = f"{user_dir}/sheet_{entry['message_id']}"
+    await cb.message.edit(f"📥 Getting `{entry['file_name']}` ...")
+    # A prefetched copy stays with the prefetcher for the merge; our own
+    # download goes into sheet_dir and is removed with it
+    try:
+        file_dl_path = await prefetcher.peek(cb.from_user.id, entry) or await c.download_media(
+            message=entry["file_id"],
+            file_name=f"{sheet_dir}/{entry['file_name']}",
+        )
+    except Exception as downloadErr:
+        LOGGER.info(f"Failed to download Error: {downloadErr}")
+        await cb.message.edit("Download Error")
+        delete_all(root=sheet_dir)
+        return
+    try:
+        await cb.message.edit("🖼️ Building contact sheet from keyframes ...")
+        sheet, shots = await contact_sheet(file_dl_path, f"{sheet_dir}/shots")
+        if sheet is None:
+            await cb.message.edit("❌ Failed to build contact sheet !")
+            return
+        await c.send_photo(
+            chat_id=cb.from_user.id,
+            photo=sheet,
+            caption=f"🖼️ **{SHEET_COLUMNS}×{SHEET_ROWS} preview of** `{entry['file_name']}`",
+        )
+        for i in range(0, len(shots), 10):  # Telegram albums hold up to 10 photos
+            await c.send_media_group(
+                chat_id=cb.from_user.id,
+                media=[InputMediaPhoto(p) for p in shots[i:i + 10]],
+            )
+        await cb.message.delete()
+    finally:
+        delete_all(root=sheet_dir)
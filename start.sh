@@ -39,7 +39,7 @@ log "Python version: $python_version"
 
 # Check if all required packages are installed
 log "Checking dependencies..."
-if ! python3 -c "import pyrogram, pymongo, ffmpeg, requests" 2>/dev/null; then
+if ! python3 -c "import pyrogram, pymongo, requests" 2>/dev/null; then
     error "Some required packages are missing!"
     error "Please run: pip3 install -r requirements.txt"
     exit 1